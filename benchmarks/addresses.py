@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+Benchmark loading an HD wallet with many addresses spread over many
+colors, with and without public data of addresses in the wallet
+database, and creating new addresses with get_new_address.
+
+usage: python benchmarks/addresses.py [addresses] [colors]
+"""
+
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coloredcoinlib import ColorSet
+from coloredcoinlib.store import DataStoreConnection
+from ngcccbase.bip0032 import HDWalletAddressManager
+
+
+class BenchColorMap(object):
+    def find_color_desc(self, color_id):
+        return "obc:%064x:0:1" % color_id
+
+    def resolve_color_desc(self, color_desc, auto_add=True):
+        return int(color_desc.split(':')[1], 16)
+
+
+def make_config(colormap, addresses, colors):
+    per_color = addresses // colors
+    return {
+        'hdw_master_key': '5e' * 64,
+        'hdwam': {
+            'genesis_color_sets': [],
+            'color_set_states': [
+                {'color_set': [colormap.find_color_desc(i)],
+                 'max_index': per_color - 1}
+                for i in xrange(1, colors + 1)]},
+        'testnet': False,
+        }
+
+
+def timed(name, count, f):
+    start = time.time()
+    result = f()
+    elapsed = time.time() - start
+    print ("%-28s %8.2f s  %8.3f ms per address" % (
+        name, elapsed, 1000.0 * elapsed / count))
+    return result
+
+
+def main():
+    addresses = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    colors = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    colormap = BenchColorMap()
+    store_conn = DataStoreConnection(':memory:', True)
+    store_conn.conn.row_factory = sqlite3.Row
+    print ("%d addresses in %d colors" % (addresses, colors))
+
+    timed("startup, no address store", addresses, lambda:
+          HDWalletAddressManager(colormap,
+                                 make_config(colormap, addresses, colors)))
+    timed("startup, filling the store", addresses, lambda:
+          HDWalletAddressManager(colormap,
+                                 make_config(colormap, addresses, colors),
+                                 store_conn))
+    manager = timed("startup from the store", addresses, lambda:
+                    HDWalletAddressManager(
+                        colormap, make_config(colormap, addresses, colors),
+                        store_conn))
+
+    color_sets = [ColorSet(colormap, [colormap.find_color_desc(i)])
+                  for i in xrange(1, colors + 1)]
+    new = max(colors, addresses // 10)
+    timed("get_new_address", new, lambda:
+          [manager.get_new_address(color_sets[i % colors])
+           for i in xrange(new)])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+
+"""
+Benchmark CoinQuery.get_result on a wallet with many coins against
+filtering coins one by one (the way CoinQuery used to work).
+
+usage: python benchmarks/coinquery.py [coins] [addresses]
+"""
+
+import os
+import sys
+import sqlite3
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from coloredcoinlib import ColorMap, ColorSet
+from coloredcoinlib.store import DataStoreConnection, ColorMetaStore
+from ngcccbase.coindb import CoinManager, CoinQuery
+from ngcccbase.txdb import NaiveTxDb, TX_STATUS_CONFIRMED
+
+
+class BenchAddressRecord(object):
+    def __init__(self, address, color_set):
+        self.address = address
+        self.color_set = color_set
+
+    def get_address(self):
+        return self.address
+
+    def get_color_set(self):
+        return self.color_set
+
+
+class BenchAddressManager(object):
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def get_all_addresses(self):
+        return self.addresses
+
+    def get_addresses_for_color_set(self, color_set):
+        return [ar for ar in self.addresses
+                if color_set.intersects(ar.get_color_set())]
+
+
+class BenchColoredCoinContext(object):
+    colordata = None
+
+
+class BenchModel(object):
+    """Just enough of WalletModel for CoinQuery on uncolored coins."""
+    def __init__(self, num_coins, num_addresses):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.store_conn.conn.row_factory = sqlite3.Row
+        self.ccc = BenchColoredCoinContext()
+        self.colormap = ColorMap(ColorMetaStore(self.store_conn.conn))
+        self.color_set = ColorSet(self.colormap, [''])
+        self.address_man = BenchAddressManager(
+            [BenchAddressRecord("address%d" % i, self.color_set)
+             for i in xrange(num_addresses)])
+        self.txdb = NaiveTxDb(self, {})
+        self.coin_man = CoinManager(self, {})
+
+        coin_store = self.coin_man.store
+        for i in xrange(num_coins):
+            txhash = "%064x" % i
+            self.txdb.store.add_tx(txhash, "", TX_STATUS_CONFIRMED)
+            coin_store.add_coin("address%d" % (i % num_addresses),
+                                txhash, 0, 10000 + i, "")
+            if i % 2:
+                # every other coin is spent by the previous transaction
+                coin_store.add_spend(coin_store.find_coin(txhash, 0),
+                                     "%064x" % (i - 1))
+
+    def get_blockchain_state(self):
+        return None
+
+    def get_tx_db(self):
+        return self.txdb
+
+    def get_address_manager(self):
+        return self.address_man
+
+    def get_coin_manager(self):
+        return self.coin_man
+
+
+def legacy_get_result(model, query):
+    coins = []
+    for address_rec in model.get_address_manager().get_all_addresses():
+        coins.extend(filter(
+            query.coin_matches_filter,
+            model.get_coin_manager().get_coins_for_address(
+                address_rec.get_address())))
+    return coins
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return result, time.time() - start
+
+
+def main():
+    num_coins = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_addresses = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    model = BenchModel(num_coins, num_addresses)
+    query = CoinQuery(model, model.color_set, {'spent': False})
+
+    coins, t_query = timed(query.get_result)
+    legacy_coins, t_legacy = timed(legacy_get_result, model, query)
+    assert (sorted(c.coin_id for c in coins) ==
+            sorted(c.coin_id for c in legacy_coins))
+
+    print "%d coins, %d addresses, %d unspent" % (
+        num_coins, num_addresses, len(coins))
+    print "per-coin filtering: %.3fs" % t_legacy
+    print "single query:       %.3fs" % t_query
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+"""
+Simulate a wallet making many payments with each coin selection
+strategy and report fees paid, number of inputs, UTXO set growth
+and time spent selecting coins.
+
+Fees and the dust threshold are those of BaseOperationalTxSpec.
+
+usage: python benchmarks/coinselection.py [sends] [initial coins]
+"""
+
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ngcccbase.coinselection import make_coin_selector
+
+
+FEE_PER_KB = 11000
+DUST_THRESHOLD = 600
+
+
+def required_fee(num_inputs, num_outputs):
+    # ComposedTxSpec.estimate_size for uncompressed P2PKH inputs
+    size = 180 * num_inputs + 34 * num_outputs + 10
+    return int(math.ceil(size * FEE_PER_KB / 1000.0))
+
+
+def simulate(name, sends, initial_coins, seed):
+    rnd = random.Random(seed)
+    selector = make_coin_selector(name)
+    utxos = [int(rnd.lognormvariate(13, 1.5)) for i in xrange(initial_coins)]
+    fees = inputs = changeless = failed = 0
+    select_time = 0.0
+    for i in xrange(sends):
+        if i % 2 == 0:
+            # now and then we get paid too
+            utxos.append(int(rnd.lognormvariate(13, 1.5)))
+        amount = int(rnd.lognormvariate(12, 1.5))
+        # one output for the payment, one for change
+        required = lambda count: amount + required_fee(count, 2)
+        start = time.time()
+        indices = selector.select(utxos, required, DUST_THRESHOLD)
+        select_time += time.time() - start
+        if indices is None:
+            failed += 1
+            continue
+        total = sum(utxos[j] for j in indices)
+        fee = required_fee(len(indices), 2)
+        change = total - amount - fee
+        for j in sorted(indices, reverse=True):
+            del utxos[j]
+        if change > DUST_THRESHOLD:
+            utxos.append(change)
+        else:
+            fee += change
+            changeless += 1
+        fees += fee
+        inputs += len(indices)
+    done = sends - failed
+    print ("%-14s fees %10d  inputs/tx %5.2f  changeless %5d  "
+           "failed %4d  utxos %5d -> %5d  select %6.3fs" % (
+               name, fees, float(inputs) / max(done, 1), changeless,
+               failed, initial_coins, len(utxos), select_time))
+
+
+def main():
+    sends = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    initial_coins = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    for name in ['first_fit', 'largest_first', 'knapsack', 'bnb']:
+        simulate(name, sends, initial_coins, seed=1)
+
+
+if __name__ == '__main__':
+    main()
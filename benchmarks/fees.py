@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Compare fees estimated with the old size model (181 bytes per input,
+34 per output, 10 more) and with ComposedTxSpec.estimate_size against
+the fee the signed transaction actually needs, for random transactions
+spending coins of compressed and uncompressed keys.
+
+usage: python benchmarks/fees.py [transactions] [fee rate]
+"""
+
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycoin.encoding import b2a_hashed_base58, to_bytes_32
+
+from coloredcoinlib.txspec import ComposedTxSpec
+from ngcccbase import pycoin_txcons
+from ngcccbase.address import LooseAddressRecord
+from ngcccbase.coindb import UTXO
+
+
+class CompressedAddressRecord(LooseAddressRecord):
+    compressed = True
+
+
+def make_address_rec(secret_exponent, compressed):
+    cls = CompressedAddressRecord if compressed else LooseAddressRecord
+    return cls(address_data=b2a_hashed_base58('\0' + to_bytes_32(secret_exponent)),
+               color_set=None, testnet=False)
+
+
+def make_utxo(n, address_rec):
+    utxo = UTXO({'txhash': '%064x' % n, 'outindex': n % 3, 'value': 100000,
+                 'script': pycoin_txcons.tools.compile(
+                     "OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG" %
+                     address_rec.rawPubkey().encode('hex')).encode('hex')})
+    utxo.address_rec = address_rec
+    return utxo
+
+
+def fee(size, fee_rate):
+    return int(math.ceil(size * fee_rate / 1000.0))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fee_rate = int(sys.argv[2]) if len(sys.argv) > 2 else 11000
+    rnd = random.Random(1)
+    address_recs = [make_address_rec(1000 + i, i % 2 == 0)
+                    for i in xrange(20)]
+    totals = {'old': [0, 0], 'exact': [0, 0]}
+    actual_total = 0
+    estimate_time = 0.0
+    for i in xrange(count):
+        spec = ComposedTxSpec()
+        for j in xrange(rnd.randint(1, 20)):
+            spec.add_txin(make_utxo(i * 100 + j, rnd.choice(address_recs)))
+        for j in xrange(rnd.randint(1, 5)):
+            spec.add_txout(ComposedTxSpec.TxOut(
+                1000, rnd.choice(address_recs).get_address()))
+        start = time.time()
+        exact_size = spec.estimate_size()
+        estimate_time += time.time() - start
+        old_size = 181 * len(spec.txins) + 34 * len(spec.txouts) + 10
+
+        tx = pycoin_txcons.construct_standard_tx(spec, False)
+        pycoin_txcons.sign_tx(tx, spec.txins, False)
+        actual_fee = fee(len(pycoin_txcons.serialize(tx)), fee_rate)
+        actual_total += actual_fee
+        for name, size in [('old', old_size), ('exact', exact_size)]:
+            overpaid = fee(size, fee_rate) - actual_fee
+            totals[name][0] += overpaid
+            totals[name][1] += overpaid < 0
+
+    print ("%d transactions at %d sat/kB, required fees %d" % (
+        count, fee_rate, actual_total))
+    for name in ['old', 'exact']:
+        overpaid, underpaid = totals[name]
+        print ("%-6s overpaid %8d (%5.2f%%)  underpaid txs %d" % (
+            name, overpaid, 100.0 * overpaid / actual_total, underpaid))
+    print ("estimate_size %.1f us per tx" % (1e6 * estimate_time / count))
+
+
+if __name__ == '__main__':
+    main()
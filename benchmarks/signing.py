@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+Benchmark pycoin_txcons.sign_tx on transactions with many inputs
+against the way it used to sign: scanning the coin list for each
+input, rebuilding the hash160 lookup (an EC multiplication per key)
+and signing through pycoin's script solver.
+
+usage: python benchmarks/signing.py [inputs ...]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pycoin.encoding import b2a_hashed_base58, to_bytes_32
+from pycoin.tx.pay_to import build_hash160_lookup
+from pycoin.tx.Tx import Tx, SIGHASH_ALL
+from pycoin.tx.TxIn import TxIn
+from pycoin.tx.TxOut import TxOut
+
+from ngcccbase import pycoin_txcons, signing
+from ngcccbase.address import LooseAddressRecord
+
+
+class BenchUTXO(object):
+    def __init__(self, txhash, outindex, address_rec):
+        self.txhash = txhash
+        self.outindex = outindex
+        self.address_rec = address_rec
+        self.script = pycoin_txcons.tools.compile(
+            "OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG" %
+            address_rec.rawPubkey().encode('hex')).encode('hex')
+
+    def get_txhash(self):
+        return self.txhash
+
+
+def sign_tx_old(tx, utxo_list):
+    secret_exponents = [utxo.address_rec.rawPrivKey
+                        for utxo in utxo_list if utxo.address_rec]
+    hash160_lookup = build_hash160_lookup(secret_exponents)
+    for txin_idx, blank_txin in enumerate(tx.txs_in):
+        utxo = None
+        for utxo_candidate in utxo_list:
+            if utxo_candidate.get_txhash() == blank_txin.previous_hash \
+                    and utxo_candidate.outindex == blank_txin.previous_index:
+                utxo = utxo_candidate
+                break
+        if not (utxo and utxo.address_rec):
+            continue
+        txout_script = utxo.script.decode('hex')
+        tx.sign_tx_in(hash160_lookup, txin_idx, txout_script, SIGHASH_ALL)
+
+
+def make_tx(utxos):
+    return Tx(1, [TxIn(utxo.txhash, utxo.outindex) for utxo in utxos],
+              [TxOut(1000, utxos[0].script.decode('hex'))], 0)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 500]
+    # 20 keys, as if coins were spread over a few addresses
+    address_recs = [LooseAddressRecord(
+        address_data=b2a_hashed_base58('\0' + to_bytes_32(1000 + i)),
+        color_set=None, testnet=False) for i in xrange(20)]
+    print ("ECDSA backend: %s" % signing.BACKEND)
+    for size in sizes:
+        utxos = [BenchUTXO(to_bytes_32(i), i % 4, address_recs[i % 20])
+                 for i in xrange(size)]
+        lookup = pycoin_txcons.make_hash160_lookup(utxos)
+
+        tx = make_tx(utxos)
+        start = time.time()
+        sign_tx_old(tx, utxos)
+        old_time = time.time() - start
+
+        tx = make_tx(utxos)
+        start = time.time()
+        pycoin_txcons.sign_tx(tx, utxos, False, lookup)
+        new_time = time.time() - start
+        tx.verify_tx_in(size - 1, utxos[-1].script.decode('hex'))
+
+        print ("%4d inputs: old %7.2fs  sign_tx %7.2fs" % (
+            size, old_time, new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,9 +19,11 @@ urls = (
     '/tx_blockhash', 'TxBlockhash',
     '/prefetch', 'Prefetch',
     '/blockcount', 'BlockCount',
+    '/blockcount_wait', 'BlockCountWait',
     '/header', 'Header',
     '/chunk', 'Chunk',
-    '/merkle', 'Merkle'
+    '/merkle', 'Merkle',
+    '/merkle_batch', 'MerkleBatch'
 )
 
 testnet = False
@@ -163,6 +165,7 @@ class ChunkThread(threading.Thread):
         threading.Thread.__init__(self, *args, **kwargs)
         self.running = False
         self.lock = threading.Lock()
+        self.new_block = threading.Condition()
         self.headers = ''
 
     def is_running(self):
@@ -209,6 +212,8 @@ class ChunkThread(threading.Thread):
                         else:
                             self.headers = self.headers[:-80]
                 open(HEADERS_FILE, 'wb').write(self.headers)
+                with self.new_block:
+                    self.new_block.notify_all()
             except httplib.BadStatusLine:
                 pass # bad connection, try again later
             except SocketError:
@@ -222,6 +227,18 @@ class ChunkThread(threading.Thread):
     def height(self):
         return len(self.headers)/80 - 1
 
+    def wait_for_height(self, known_height, timeout):
+        """Block until height differs from <known_height> or <timeout>
+        seconds pass, return the current height."""
+        deadline = time.time() + timeout
+        with self.new_block:
+            while self.height == known_height:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.new_block.wait(remaining)
+            return self.height
+
     def _rev_hex(self, s):
         return s.decode('hex')[::-1].encode('hex')
 
@@ -245,6 +262,18 @@ class ChunkThread(threading.Thread):
 chunkThread = ChunkThread()
 
 
+class BlockCountWait(ErrorThrowingRequestProcessor):
+    MAX_TIMEOUT = 60
+
+    def POST(self):
+        # long-poll, answers as soon as a block above known_count arrives
+        data = json.loads(web.data())
+        timeout = min(data.get('timeout') or self.MAX_TIMEOUT,
+                      self.MAX_TIMEOUT)
+        return str(chunkThread.wait_for_height(data.get('known_count'),
+                                               timeout))
+
+
 class Chunk(ErrorThrowingRequestProcessor):
     def POST(self):
         data = json.loads(web.data())
@@ -255,6 +284,37 @@ class Chunk(ErrorThrowingRequestProcessor):
             return headers.read(2016*80)
 
 
+hash_decode = lambda x: x.decode('hex')[::-1]
+hash_encode = lambda x: x[::-1].encode('hex')
+Hash = lambda x: hashlib.sha256(hashlib.sha256(x).digest()).digest()
+
+
+def merkle_tree_levels(tx_list):
+    """All levels of the merkle tree of block transactions <tx_list>,
+    from the leaves up to the root."""
+    level = map(hash_decode, tx_list)
+    levels = [level]
+    while len(level) != 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        level = [Hash(level[i] + level[i+1])
+                 for i in xrange(0, len(level), 2)]
+        levels.append(level)
+    return levels
+
+
+def merkle_branch(levels, pos):
+    """Merkle branch of the transaction at position <pos>."""
+    s = []
+    for level in levels[:-1]:
+        sibling = pos ^ 1
+        if sibling == len(level):
+            sibling = pos
+        s.append(hash_encode(level[sibling]))
+        pos >>= 1
+    return s
+
+
 class Merkle(ErrorThrowingRequestProcessor):
     def POST(self):
         data = json.loads(web.data())
@@ -263,37 +323,47 @@ class Merkle(ErrorThrowingRequestProcessor):
         txhash = data.get('txhash')
         blockhash = data.get('blockhash')
 
-        hash_decode = lambda x: x.decode('hex')[::-1]
-        hash_encode = lambda x: x[::-1].encode('hex')
-        Hash = lambda x: hashlib.sha256(hashlib.sha256(x).digest()).digest()
-
         blockchainstate = BlockchainState.from_url(None, testnet)
         b = blockchainstate.get_block(blockhash)
         tx_list = b.get('tx')
         tx_pos = tx_list.index(txhash)
-
-        merkle = map(hash_decode, tx_list)
-        target_hash = hash_decode(txhash)
-        s = []
-        while len(merkle) != 1:
-            if len(merkle) % 2:
-                merkle.append(merkle[-1])
-            n = []
-            while merkle:
-                new_hash = Hash(merkle[0] + merkle[1])
-                if merkle[0] == target_hash:
-                    s.append(hash_encode(merkle[1]))
-                    target_hash = new_hash
-                elif merkle[1] == target_hash:
-                    s.append(hash_encode(merkle[0]))
-                    target_hash = new_hash
-                n.append(new_hash)
-                merkle = merkle[2:]
-            merkle = n
+        s = merkle_branch(merkle_tree_levels(tx_list), tx_pos)
 
         return json.dumps({"block_height": b.get('height'), "merkle": s, "pos": tx_pos})
 
 
+class MerkleBatch(ErrorThrowingRequestProcessor):
+    def POST(self):
+        """For every txhash return its blockhash and mempool flag, and
+        the merkle branch for those which are in a block. Each block
+        is fetched and hashed only once."""
+        data = json.loads(web.data())
+        self.require(data, 'txhashes', "MerkleBatch requires txhashes")
+
+        blockchainstate = BlockchainState.from_url(None, testnet)
+        result = {}
+        block_txhashes = {}
+        for txhash in data.get('txhashes'):
+            blockhash, in_mempool = blockchainstate.get_tx_blockhash(txhash)
+            result[txhash] = {"blockhash": blockhash,
+                              "in_mempool": in_mempool}
+            if blockhash:
+                block_txhashes.setdefault(blockhash, []).append(txhash)
+
+        for blockhash, txhashes in block_txhashes.items():
+            b = blockchainstate.get_block(blockhash)
+            tx_list = b.get('tx')
+            levels = merkle_tree_levels(tx_list)
+            for txhash in txhashes:
+                tx_pos = tx_list.index(txhash)
+                result[txhash].update({
+                    "block_height": b.get('height'),
+                    "merkle": merkle_branch(levels, tx_pos),
+                    "pos": tx_pos})
+
+        return json.dumps(result)
+
+
 if __name__ == "__main__":
     import signal
     def sigint_handler(signum, frame):
@@ -22,6 +22,9 @@ class COutpoint(object):
         self.hash = hash
         self.n = n
 
+    def is_null(self):
+        return self.hash == 'coinbase'
+
 
 class CTxIn(object):
     def __init__(self, op_hash, op_n):
@@ -48,6 +51,14 @@ class CTxOut(object):
         self.raw_address = script_to_raw_address(script)
 
 
+class RawTransaction(object):
+    """What color definitions need of a python-bitcoinlib
+    transaction: inputs with prevout and nSequence.
+    """
+    def __init__(self, vin):
+        self.vin = vin
+
+
 class CTransaction(object):
 
     def __init__(self, bs):
@@ -79,6 +90,27 @@ class CTransaction(object):
             tx.outputs.append(CTxOut(o.nValue, o.scriptPubKey))
         return tx
 
+    @classmethod
+    def from_pycoin(klass, txhash, pycoin_tx, bs):
+        """Same as from_bitcoincore for a pycoin Tx, raw is a
+        RawTransaction with our inputs.
+        """
+        tx = CTransaction(bs)
+        tx.hash = txhash
+        tx.inputs = []
+        for txin in pycoin_tx.txs_in:
+            if txin.is_coinbase():
+                inp = CTxIn('coinbase', 0)
+            else:
+                inp = CTxIn(txin.previous_hash[::-1].encode('hex'),
+                            txin.previous_index)
+            inp.set_nSequence(txin.sequence)
+            tx.inputs.append(inp)
+        tx.outputs = [CTxOut(txout.coin_value, txout.script)
+                      for txout in pycoin_tx.txs_out]
+        tx.raw = RawTransaction(tx.inputs)
+        return tx
+
     def ensure_input_values(self):
         if self.have_input_values:
             return
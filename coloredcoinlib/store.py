@@ -2,6 +2,7 @@
 
 import sqlite3
 
+from contextlib import contextmanager
 from UserDict import DictMixin
 import cPickle as pickle
 
@@ -33,8 +34,8 @@ class DataStore(object):
         return res is not None
 
     def column_exists(self, tablename, column_name):
-        info = self.execute("PRAGMA table_info(tx_data)")
-        return any(row[1] == 'block_height' for row in info)
+        info = self.execute("PRAGMA table_info({0})".format(tablename))
+        return any(row[1] == column_name for row in info)
 
     def execute(self, statement, params=()):
         cur = self.conn.cursor()
@@ -47,6 +48,25 @@ class DataStore(object):
     def transaction(self):
         return self.conn
 
+    @contextmanager
+    def atomic(self):
+        """Run the enclosed statements in a single transaction which
+        is rolled back on exception. Autocommit connections use a
+        savepoint, so transactions can be nested.
+        """
+        if self.conn.isolation_level is not None:
+            with self.conn:
+                yield self.conn
+            return
+        self.conn.execute("SAVEPOINT datastore")
+        try:
+            yield self.conn
+        except:
+            self.conn.execute("ROLLBACK TO datastore")
+            self.conn.execute("RELEASE datastore")
+            raise
+        self.conn.execute("RELEASE datastore")
+
 
 def unwrap1(val):
     if val:
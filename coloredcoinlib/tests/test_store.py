@@ -29,6 +29,20 @@ class TestStore(unittest.TestCase):
     def test_transaction(self):
         self.assertEqual(self.store.transaction(), self.dsc.conn)
 
+    def test_atomic(self):
+        c = DataStoreConnection(":memory:", True)
+        store = ColorDataStore(c.conn)
+        with store.atomic():
+            store.add(1, "1", 0, 1, "test0")
+        self.assertTrue(store.get(1, "1", 0))
+        try:
+            with store.atomic():
+                store.add(1, "1", 1, 1, "test1")
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertFalse(store.get(1, "1", 1))
+
     def test_colordata(self):
         self.assertFalse(self.store.get(1, "1", 0))
         self.assertFalse(self.store.get_any("1", 0))
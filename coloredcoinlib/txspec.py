@@ -4,6 +4,26 @@ from blockchain import CTxIn
 from colorvalue import ColorValue, SimpleColorValue
 
 
+# serialized sizes in bytes, a low s DER signature with the sighash
+# type byte takes at most 72 bytes
+TX_OVERHEAD_SIZE = 4 + 4            # version, lock time
+TXIN_OVERHEAD_SIZE = 32 + 4 + 4     # outpoint, sequence
+P2PKH_SCRIPT_SIG_SIZE = 1 + 72 + 1 + 65
+P2PKH_COMPRESSED_SCRIPT_SIG_SIZE = 1 + 72 + 1 + 33
+TXOUT_OVERHEAD_SIZE = 8             # value
+P2PKH_SCRIPT_SIZE = 25
+
+
+def varint_size(n):
+    if n < 0xfd:
+        return 1
+    if n <= 0xffff:
+        return 3
+    if n <= 0xffffffff:
+        return 5
+    return 9
+
+
 class InvalidColorIdError(Exception):
     pass
 
@@ -96,7 +116,15 @@ class ComposedTxSpec(object):
        but isn't signed yet"""
 
     class TxIn(CTxIn):
-        pass
+        def get_script_sig_size(self):
+            """Size of the script which will spend this input,
+            we assume P2PKH with an uncompressed key by default.
+            """
+            return P2PKH_SCRIPT_SIG_SIZE
+
+        def estimate_size(self):
+            script_size = self.get_script_sig_size()
+            return TXIN_OVERHEAD_SIZE + varint_size(script_size) + script_size
 
     class TxOut(object):
         __slots__ = ['value', 'target_addr']
@@ -105,6 +133,11 @@ class ComposedTxSpec(object):
             self.value = value
             self.target_addr = target_addr
 
+        def estimate_size(self):
+            # all outputs we make are P2PKH
+            return (TXOUT_OVERHEAD_SIZE + varint_size(P2PKH_SCRIPT_SIZE) +
+                    P2PKH_SCRIPT_SIZE)
+
     class FeeChangeTxOut(TxOut):
         pass
 
@@ -158,9 +191,23 @@ value isn't uncolored!")
         return self.txouts
 
     def estimate_size(self, extra_txins=0, extra_txouts=0, extra_bytes=0):
-        return (181 * (len(self.txins) + extra_txins) +
-                34 * (len(self.txouts) + extra_txouts) +
-                10 + extra_bytes)
+        """Size of the signed transaction. <extra_txins> is either a
+        number of inputs of the default kind or a list of TxIns to
+        be added, <extra_txouts> is a number of outputs (like change).
+        """
+        if isinstance(extra_txins, (int, long)):
+            default_txin_size = self.TxIn('', 0).estimate_size()
+            txins_size = default_txin_size * extra_txins
+            num_txins = len(self.txins) + extra_txins
+        else:
+            txins_size = sum(txin.estimate_size() for txin in extra_txins)
+            num_txins = len(self.txins) + len(extra_txins)
+        txins_size += sum(txin.estimate_size() for txin in self.txins)
+        num_txouts = len(self.txouts) + extra_txouts
+        txouts_size = (sum(txout.estimate_size() for txout in self.txouts) +
+                       self.TxOut(0, None).estimate_size() * extra_txouts)
+        return (TX_OVERHEAD_SIZE + varint_size(num_txins) + txins_size +
+                varint_size(num_txouts) + txouts_size + extra_bytes)
 
     def estimate_required_fee(self, extra_txins=0, extra_txouts=1, extra_bytes=0):
         return self.operational_tx_spec.get_required_fee(
@@ -1,8 +1,10 @@
+import abc
 import re
 from pycoin.ecdsa.secp256k1 import generator_secp256k1 as BasePoint
 from pycoin.encoding import (b2a_hashed_base58, from_bytes_32, to_bytes_32,
-                             a2b_hashed_base58, public_pair_to_bitcoin_address,
-                             public_pair_to_hash160_sec, secret_exponent_to_wif)
+                             a2b_hashed_base58, hash160_sec_to_bitcoin_address,
+                             public_pair_to_hash160_sec, public_pair_to_sec,
+                             sec_to_public_pair, secret_exponent_to_wif)
 
 
 class InvalidAddressError(Exception):
@@ -19,13 +21,65 @@ class AddressRecord(object):
     """Object that holds both address and color information
     Note this is now an Abstract Class.
     """
+    __metaclass__ = abc.ABCMeta
+
+    # keys of the wallet are used in the uncompressed form
+    compressed = False
+
     def __init__(self, **kwargs):
         self.color_set = kwargs.get('color_set')
         self.testnet = kwargs.get('testnet')
         self.prefix = self.testnet and b'\x6f' or b"\0"
+        self.secret_exponent = None
+        self.public_pair = None
+        self.hash160 = None
+        self.address = None
+
+    @abc.abstractmethod
+    def derive_secret_exponent(self):
+        """Computes the private key of records created from public
+        data only, see set_public_data.
+        """
+        pass
+
+    @property
+    def rawPrivKey(self):
+        """The private key (secret exponent), derived when first used.
+        """
+        if self.secret_exponent is None:
+            self.secret_exponent = self.derive_secret_exponent()
+        return self.secret_exponent
+
+    def set_secret_exponent(self, secret_exponent):
+        """Sets the private key and computes the public key and
+        address from it, which takes an EC multiplication.
+        """
+        self.secret_exponent = secret_exponent
+        self.public_pair = (BasePoint * secret_exponent).pair()
+        self.hash160 = public_pair_to_hash160_sec(self.public_pair,
+                                                  self.compressed)
+        self.address = hash160_sec_to_bitcoin_address(
+            self.hash160, address_prefix=self.prefix)
+
+    def set_public_data(self, address, hash160, sec):
+        """Sets public key data which get_public_data returned before,
+        the private key is derived later if needed.
+        """
+        self.address = address
+        self.hash160 = hash160
+        self.public_pair = sec_to_public_pair(sec)
+
+    def get_public_data(self):
+        """Returns (address, hash160, SEC encoded public key).
+        """
+        return (self.address, self.hash160,
+                public_pair_to_sec(self.public_pair, self.compressed))
+
+    def get_public_pair(self):
+        return self.public_pair
 
     def rawPubkey(self):
-        return public_pair_to_hash160_sec(self.publicPoint.pair(), False)
+        return self.hash160
 
     def get_color_set(self):
         """Access method for the color set associated
@@ -42,7 +96,8 @@ class AddressRecord(object):
                 "address_data": b2a_hashed_base58(raw)}
 
     def get_private_key(self):
-        return secret_exponent_to_wif(self.rawPrivKey, False, self.prefix)
+        return secret_exponent_to_wif(self.rawPrivKey, self.compressed,
+                                      self.prefix)
 
     def get_address(self):
         """Get the actual bitcoin address
@@ -76,8 +131,9 @@ class LooseAddressRecord(AddressRecord):
         if key_type != self.prefix:
             raise InvalidAddressError
 
-        self.rawPrivKey = from_bytes_32(bin_privkey[1:])
-        self.publicPoint = BasePoint * self.rawPrivKey
-        self.address = public_pair_to_bitcoin_address(
-            self.publicPoint.pair(), compressed=False, address_prefix=self.prefix)
+        self.set_secret_exponent(from_bytes_32(bin_privkey[1:]))
+
+    def derive_secret_exponent(self):
+        # imported records always have their private key
+        return self.secret_exponent
 
@@ -244,13 +244,16 @@ class Ngccc(apigen.Definition):
     @apigen.command()
     def sendmanycsv(self, path):
         """Send amounts in csv file with format 'moniker,coloraddress,amount'.
-        All entries must use the same color scheme.
+        Large payouts and entries of different color schemes are split
+        into several transactions, so one file can broadcast several
+        transactions, returns their ids. If publishing one fails, the
+        error lists the ids of those already broadcast.
         """
 
         # sanitize inputs
         sendmany_entries = sanitize.sendmanycsv(self.model, path)
 
-        return _print(self.controller.sendmany_coins(sendmany_entries))
+        return _print(self.controller.sendmany_batch(sendmany_entries))
 
     @apigen.command()
     def scan(self):
@@ -260,8 +263,10 @@ class Ngccc(apigen.Definition):
 
     @apigen.command()
     def fullrescan(self):
-        """Rebuild database of wallet transactions."""
-        self.controller.full_rescan()
+        """Rebuild database of wallet transactions,
+        shows how many seconds each phase took.
+        """
+        return _print(self.controller.full_rescan())
 
     @apigen.command()
     def history(self, moniker):
@@ -0,0 +1,206 @@
+"""
+batchpayout.py
+
+Pays out many (asset, address, value) entries, e.g. from a CSV file,
+with as few transactions as the transaction size limit allows.
+Coins are selected from one pool for the whole batch, change of each
+transaction goes into the pool for the next ones, and colors of the
+same kind (OBC or EPOBC) share transactions. Inputs of a transaction
+are signed in worker processes.
+"""
+
+import multiprocessing
+from collections import defaultdict
+
+from coloredcoinlib import ColorTarget, SimpleColorValue, UNCOLORED_MARKER
+from coindb import UTXO
+from txcons import SimpleOperationalTxSpec, RawTxSpec
+import pycoin_txcons
+
+
+class BatchOperationalTxSpec(SimpleOperationalTxSpec):
+    """Operational tx spec of one transaction of a batch, it doesn't
+    select coins which other transactions of the batch use, and can
+    select the unpublished <change_coins> of earlier transactions,
+    a dict from color id to coins.
+    """
+    def __init__(self, model, used_outpoints, change_coins=None):
+        super(BatchOperationalTxSpec, self).__init__(model, None)
+        self.used_outpoints = used_outpoints
+        self.change_coins = change_coins or {}
+        # color id -> colored change value and its address
+        self.colored_change = {}
+        self.change_addrs = {}
+
+    def get_spendable_coins(self, color_id):
+        coins = (super(BatchOperationalTxSpec, self).get_spendable_coins(
+                     color_id) + self.change_coins.get(color_id, []))
+        return [coin for coin in coins
+                if coin.get_outpoint() not in self.used_outpoints]
+
+    def select_coins(self, colorvalue, use_fee_estimator=None):
+        selection, total = super(BatchOperationalTxSpec, self).select_coins(
+            colorvalue, use_fee_estimator)
+        self.used_outpoints.update(coin.get_outpoint() for coin in selection)
+        colordef = colorvalue.get_colordef()
+        if colordef != UNCOLORED_MARKER:
+            self.colored_change[colordef.get_color_id()] = total - colorvalue
+        return selection, total
+
+    def get_change_addr(self, color_def):
+        address = super(BatchOperationalTxSpec, self).get_change_addr(
+            color_def)
+        self.change_addrs[color_def.get_color_id()] = address
+        return address
+
+    def get_change_colorvalues(self, composed_tx_spec):
+        """Returns {output index: colorvalue} of the change outputs of
+        <composed_tx_spec>, which was composed from this spec.
+        """
+        change = {}
+        txouts = composed_tx_spec.get_txouts()
+        for outindex, txout in enumerate(txouts):
+            if isinstance(txout, composed_tx_spec.FeeChangeTxOut):
+                change[outindex] = SimpleColorValue(
+                    colordef=UNCOLORED_MARKER, value=txout.value)
+        for color_id, colorvalue in self.colored_change.items():
+            address = self.change_addrs.get(color_id)
+            if address is None or colorvalue.get_value() <= 0:
+                continue
+            # colored change follows the targets of its color
+            outindices = [i for i, txout in enumerate(txouts)
+                          if txout.target_addr == address
+                          and i not in change]
+            if outindices:
+                change[outindices[-1]] = colorvalue
+        return change
+
+
+class BatchPayout(object):
+    """Composes and signs transactions for a list of payout entries.
+    """
+    # standard transactions can't be larger than this
+    MAX_TX_SIZE = 100000
+
+    def __init__(self, model, max_outputs=1000, max_tx_size=None,
+                 processes=None):
+        """<max_outputs> limits the number of payments per transaction,
+        transactions are split further if they get larger than
+        <max_tx_size> bytes. Signing uses <processes> worker processes,
+        one per CPU by default.
+        """
+        self.model = model
+        self.max_outputs = max_outputs
+        self.max_tx_size = max_tx_size or self.MAX_TX_SIZE
+        self.processes = processes or multiprocessing.cpu_count()
+        self.used_outpoints = set()
+        # color id -> change coins of transactions made so far
+        self.change_coins = defaultdict(list)
+
+    def group_entries(self, entries):
+        """Group (asset, address, value) <entries> by kind of color,
+        since OBC and EPOBC outputs can't be in the same transaction.
+        Uncolored payments go with the first group.
+        """
+        groups = []
+        kinds = {}
+        uncolored = []
+        for entry in entries:
+            colordef = self.model.get_color_def(entry[0].get_color_id())
+            if colordef == UNCOLORED_MARKER:
+                uncolored.append(entry)
+                continue
+            kind = colordef.__class__
+            if kind not in kinds:
+                kinds[kind] = len(groups)
+                groups.append([])
+            groups[kinds[kind]].append(entry)
+        if not groups:
+            return [uncolored] if uncolored else []
+        groups[0] = uncolored + groups[0]
+        return groups
+
+    def make_batches(self, entries):
+        """Split <entries> into lists for separate transactions.
+        """
+        return [group[i:i + self.max_outputs]
+                for group in self.group_entries(entries)
+                for i in xrange(0, len(group), self.max_outputs)]
+
+    def compose_tx(self, entries):
+        """Returns the composed tx spec paying <entries>, or None if
+        the transaction would be too large.
+        """
+        op_tx_spec = BatchOperationalTxSpec(self.model, self.used_outpoints,
+                                            self.change_coins)
+        for asset, address, value in entries:
+            colordef = self.model.get_color_def(asset.get_color_id())
+            colorvalue = SimpleColorValue(colordef=colordef, value=value)
+            op_tx_spec.add_target(ColorTarget(address, colorvalue))
+        composed_tx_spec = self.model.transform_tx_spec(op_tx_spec,
+                                                        'composed')
+        if (composed_tx_spec.estimate_size() > self.max_tx_size and
+                len(entries) > 1):
+            # give the coins back
+            self.used_outpoints.difference_update(
+                txin.get_outpoint() for txin in composed_tx_spec.get_txins())
+            return None
+        return composed_tx_spec
+
+    def sign(self, composed_tx_spec, pool=None):
+        """Returns the signed RawTxSpec for <composed_tx_spec>, inputs
+        are signed in the worker processes of <pool>.
+        """
+        raw_tx = RawTxSpec.from_composed_tx_spec(self.model, composed_tx_spec)
+        wam = self.model.get_address_manager()
+        pycoin_txcons.sign_txs(
+            [(raw_tx.pycoin_tx, composed_tx_spec.get_txins())],
+            wam.get_hash160_lookup(), self.processes, pool)
+        raw_tx.update_tx_data()
+        return raw_tx
+
+    def add_change_coins(self, raw_tx):
+        """Make the change outputs of signed <raw_tx> spendable by
+        the transactions composed after it.
+        """
+        composed_tx_spec = raw_tx.composed_tx_spec
+        op_tx_spec = composed_tx_spec.operational_tx_spec
+        wam = self.model.get_address_manager()
+        txouts = raw_tx.pycoin_tx.txs_out
+        for outindex, colorvalue in sorted(
+                op_tx_spec.get_change_colorvalues(composed_tx_spec).items()):
+            coin = UTXO({'txhash': raw_tx.get_hex_txhash(),
+                         'outindex': outindex,
+                         'value': txouts[outindex].coin_value,
+                         'script': txouts[outindex].script.encode('hex')})
+            coin.address_rec = wam.find_address_record(
+                composed_tx_spec.get_txouts()[outindex].target_addr)
+            coin.colorvalues = [colorvalue]
+            self.change_coins[colorvalue.get_color_id()].append(coin)
+
+    def make_txs(self, entries):
+        """Returns signed transactions paying all <entries>, in the
+        order they have to be published, since later transactions
+        may spend change of earlier ones.
+        """
+        raw_txs = []
+        batches = self.make_batches(entries)
+        pool = None
+        if self.processes > 1:
+            pool = multiprocessing.Pool(self.processes)
+        try:
+            while batches:
+                batch = batches.pop(0)
+                composed_tx_spec = self.compose_tx(batch)
+                if composed_tx_spec is None:
+                    # try with two smaller transactions
+                    half = len(batch) // 2
+                    batches[:0] = [batch[:half], batch[half:]]
+                    continue
+                raw_tx = self.sign(composed_tx_spec, pool)
+                self.add_change_coins(raw_tx)
+                raw_txs.append(raw_tx)
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return raw_txs
@@ -1,14 +1,11 @@
 import hashlib
 import os
 
-from pycoin.ecdsa.secp256k1 import generator_secp256k1 as BasePoint
-from pycoin.encoding import public_pair_to_bitcoin_address, from_bytes_32
-from pycoin.serialize import h2b
+from pycoin.encoding import from_bytes_32
 from pycoin.key.BIP32Node import BIP32Node
-from address import AddressRecord, LooseAddressRecord
+from address import AddressRecord
 from asset import AssetDefinition
-from coloredcoinlib import ColorSet
-from deterministic import DWalletAddressManager
+from deterministic import DWalletAddressManager, SigningKeys
 
 
 class BIP0032AddressRecord(AddressRecord):
@@ -19,34 +16,54 @@ class BIP0032AddressRecord(AddressRecord):
     def __init__(self, **kwargs):
         """Create an address for this color <color_set> and index <index>
         with the pycoin_wallet <pycoin_wallet> and on testnet or not
-        <testnet>
+        <testnet>. <branches> maps color keys to the branch nodes
+        of the wallet, it is shared by records of the same wallet.
         The address record returned for the same variables
         will be the same every time, hence "deterministic".
+        Given <public_data> (see AddressRecord.get_public_data)
+        the private key is only derived when needed.
         """
         super(BIP0032AddressRecord, self).__init__(**kwargs)
+        self.pycoin_wallet = kwargs.get('pycoin_wallet')
+        self.branches = kwargs.get('branches', {})
+        self.index = kwargs.get('index')
+        self.color_key = self.get_color_key(self.color_set)
+        public_data = kwargs.get('public_data')
+        if public_data:
+            self.set_public_data(*public_data)
+        else:
+            self.set_secret_exponent(self.derive_secret_exponent())
 
-        pycoin_wallet = kwargs.get('pycoin_wallet')
-        color_string = hashlib.sha256(self.color_set.get_earliest()).digest()
+    @staticmethod
+    def get_color_key(color_set):
+        """Hex hash of the earliest color of <color_set>, which
+        selects the branch of the wallet its addresses are in.
+        """
+        return hashlib.sha256(color_set.get_earliest()).hexdigest()
 
-        self.index = kwargs.get('index')
+    def get_branch(self):
+        """Returns the node of the wallet which addresses of this color
+        are children of, it is derived once per color.
+        """
+        branch = self.branches.get(self.color_key)
+        if branch is not None:
+            return branch
+        branch = self.pycoin_wallet
+        color_string = self.color_key.decode('hex')
 
         # use the hash of the color string to get the subkey we need
         while len(color_string):
             # XXX 'number' was to large, have a feeling this will break compatibility
             number = int(color_string[:4].encode('hex'), 16) & (0x80000000-0x1)
-            pycoin_wallet = pycoin_wallet.subkey(i=number, as_private=True)
+            branch = branch.subkey(i=number, as_private=True)
             color_string = color_string[4:]
+        self.branches[self.color_key] = branch
+        return branch
 
-        # now get the nth address in this wallet
-        pycoin_wallet = pycoin_wallet.subkey(i=self.index, as_private=True)
-
-        self.rawPrivKey = pycoin_wallet.secret_exponent()
-        self.publicPoint = BasePoint * self.rawPrivKey
-        self.address = public_pair_to_bitcoin_address(
-            self.publicPoint.pair(),
-            compressed=False,
-            address_prefix=self.prefix
-        )
+    def derive_secret_exponent(self):
+        # the nth address of this color
+        return self.get_branch().subkey(
+            i=self.index, as_private=True).secret_exponent()
 
 
 class HDWalletAddressManager(DWalletAddressManager):
@@ -56,15 +73,25 @@ class HDWalletAddressManager(DWalletAddressManager):
     created in this wallet. This is different from DWalletAddressManager
     in that it is BIP-0032 compliant.
     """
-    def __init__(self, colormap, config):
+    record_class = BIP0032AddressRecord
+
+    def __init__(self, colormap, config, store_conn=None):
         """Create a deterministic wallet address manager given
         a color map <colormap> and a configuration <config>.
         Note address manager configuration is in the key "hdwam".
+        Public data of addresses is kept in the store behind
+        <store_conn>, if given.
         """
         self.config = config
         self.testnet = config.get('testnet', False)
         self.colormap = colormap
         self.addresses = []
+        # address string and hash160 -> AddressRecord
+        self.address_index = {}
+        self.hash160_index = {}
+        self.hash160_lookup = SigningKeys(self.hash160_index)
+        # color key -> BIP32Node of the branch of that color
+        self.branches = {}
 
         # initialize the wallet manager if this is the first time
         #  this will generate a master key.
@@ -80,37 +107,12 @@ class HDWalletAddressManager(DWalletAddressManager):
             secret_exponent=from_bytes_32(master[:32])
         )
 
-        self.genesis_color_sets = params['genesis_color_sets']
-        self.color_set_states = params['color_set_states']
-
-        # import the genesis addresses
-        for i, color_desc_list in enumerate(self.genesis_color_sets):
-            addr = self.get_genesis_address(i)
-            addr.color_set = ColorSet(self.colormap,
-                                      color_desc_list)
-            self.addresses.append(addr)
-
-        # now import the specific color addresses
-        for color_set_st in self.color_set_states:
-            color_desc_list = color_set_st['color_set']
-            max_index = color_set_st['max_index']
-            color_set = ColorSet(self.colormap, color_desc_list)
-            params = {
-                'testnet': self.testnet,
-                'pycoin_wallet': self.pycoin_wallet,
-                'color_set': color_set
-                }
-            for index in xrange(max_index + 1):
-                params['index'] = index
-                self.addresses.append(BIP0032AddressRecord(**params))
-
-        # import the one-off addresses from the config
-        for addr_params in config.get('addresses', []):
-            addr_params['testnet'] = self.testnet
-            addr_params['color_set'] = ColorSet(self.colormap,
-                                                addr_params['color_set'])
-            address = LooseAddressRecord(**addr_params)
-            self.addresses.append(address)
+        self.init_address_store(store_conn, 'hdw')
+        self.import_addresses(params)
+
+    def get_record_params(self):
+        return {'pycoin_wallet': self.pycoin_wallet,
+                'branches': self.branches}
 
     def init_new_wallet(self):
         """Initialize the configuration if this is the first time
@@ -138,24 +140,11 @@ class HDWalletAddressManager(DWalletAddressManager):
         else:
             color_set = asset_or_color_set
         index = self.increment_max_index_for_color_set(color_set)
-        na = BIP0032AddressRecord(
-            pycoin_wallet=self.pycoin_wallet, color_set=color_set,
-            index=index, testnet=self.testnet)
-        self.addresses.append(na)
+        na = self.make_address_record(color_set, index)
+        self.add_address_record(na)
         self.update_config()
         return na
 
-    def get_genesis_address(self, genesis_index):
-        """Given the index <genesis_index>, will return
-        the BIP0032 Address Record associated with that
-        index. In general, that index corresponds to the nth
-        color created by this wallet.
-        """
-        return BIP0032AddressRecord(
-            pycoin_wallet=self.pycoin_wallet,
-            color_set=ColorSet(self.colormap, []),
-            index=genesis_index, testnet=self.testnet)
-
     def update_config(self):
         """Updates the configuration for the address manager.
         The data will persist in the key "dwam" and consists
@@ -5,6 +5,11 @@ import hashlib
 
 from coloredcoinlib import BlockchainStateBase
 from coloredcoinlib.store import DataStore
+from ngcccbase.services.electrum import ElectrumInterface
+
+
+DEFAULT_ELECTRUM_SERVER = "btc.it-zone.org"
+DEFAULT_ELECTRUM_PORT = 50001
 
 
 class BaseStore(object):
@@ -49,6 +54,9 @@ class BaseStore(object):
             return self.header_from_raw(data)
         return None
 
+    def read_headers(self, height, count):
+        return map(self.header_from_raw, self.read_raw_headers(height, count))
+
 
 class FileStore(BaseStore):
     def __init__(self, path):
@@ -70,6 +78,15 @@ class FileStore(BaseStore):
         except (OSError, AssertionError), e:
             return None
 
+    def read_raw_headers(self, height, count):
+        try:
+            with open(self.path, 'rb') as store:
+                store.seek(height*80)
+                data = store.read(count*80)
+        except (OSError, IOError), e:
+            return []
+        return [data[i*80:(i+1)*80] for i in xrange(len(data)/80)]
+
     def save_chunk(self, index, chunk):
         with open(self.path, 'ab+') as store:
             store.seek(index*2016*80)
@@ -90,102 +107,203 @@ class FileStore(BaseStore):
 class SQLStore(DataStore, BaseStore):
     _SQL_CREATE_TABLE = """\
 CREATE TABLE IF NOT EXISTS blockchain_headers (
-    height INTEGER,
-    version INTEGER,
-    prev_block_hash VARCHAR(64),
-    merkle_root VARCHAR(64),
-    timestamp INTEGER,
-    bits INTEGER,
-    nonce INTEGER
+    height INTEGER PRIMARY KEY,
+    header BLOB NOT NULL
 );
-"""
-
-    _SQL_INDEX_HEIGHT = """\
-CREATE UNIQUE INDEX IF NOT EXISTS blockchain_headers_height ON blockchain_headers (height);
-"""
-    _SQL_INDEX_PREV_BLOCK_HASH = """\
-CREATE UNIQUE INDEX IF NOT EXISTS blockchain_headers_prev_block_hash ON blockchain_headers (prev_block_hash);
 """
 
     def __init__(self, conn):
         DataStore.__init__(self, conn)
+        if (self.table_exists('blockchain_headers') and
+                not self.column_exists('blockchain_headers', 'header')):
+            # headers used to be stored field by field, fetch them again
+            self.execute("DROP TABLE blockchain_headers")
         self.execute(self._SQL_CREATE_TABLE)
-        self.execute(self._SQL_INDEX_HEIGHT)
-        self.execute(self._SQL_INDEX_PREV_BLOCK_HASH)
 
     def get_height(self):
-        return (self.execute("SELECT height FROM blockchain_headers ORDER BY height DESC LIMIT 1").fetchone() or [0])[0]
+        return self.execute(
+            "SELECT IFNULL(MAX(height), 0) FROM blockchain_headers").fetchone()[0]
 
     def read_raw_header(self, height):
-        header = self.read_header(height)
-        return (None if header is None else self.header_to_raw(header))
-
-    def read_header(self, height):
-        data = self.execute("SELECT * FROM blockchain_headers WHERE height = ?",(height, )).fetchone()
-        header = {
-            'version': data[1],
-            'prev_block_hash': data[2],
-            'merkle_root': data[3],
-            'timestamp': data[4],
-            'bits': data[5],
-            'nonce': data[6],
-        }
-        return header
-
-    def _save_header(self, h):
-        params = (h['block_height'], h['version'], h['prev_block_hash'], h['merkle_root'], h['timestamp'], h['bits'], h['nonce'])
-        self.execute("""\
-INSERT INTO blockchain_headers (
-    height,
-    version,
-    prev_block_hash,
-    merkle_root,
-    timestamp,
-    bits,
-    nonce
-) VALUES (?, ?, ?, ?, ?, ?, ?)""", params)
+        data = self.execute("SELECT header FROM blockchain_headers WHERE height = ?",
+                            (height, )).fetchone()
+        return (None if data is None else str(data[0]))
+
+    def read_raw_headers(self, height, count):
+        """Return up to <count> consecutive raw headers starting at
+        <height>, stops at the first missing header.
+        """
+        rows = self.execute("SELECT height, header FROM blockchain_headers "
+                            "WHERE height >= ? AND height < ? ORDER BY height",
+                            (height, height + count)).fetchall()
+        headers = []
+        for row in rows:
+            if row[0] != height + len(headers):
+                break
+            headers.append(str(row[1]))
+        return headers
+
+    def _save_raw_headers(self, height, raw_headers):
+        params = ((height + i, buffer(raw_header))
+                  for i, raw_header in enumerate(raw_headers))
+        with self.atomic():
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO blockchain_headers (height, header) "
+                "VALUES (?, ?)", params)
 
     def save_chunk(self, index, chunk):
-        import time
-        chunk = chunk.encode('hex')
-        for i in xrange(2016):
-            header = self.header_from_raw(chunk[i*80:(i+1)*80])
-            header['block_height'] = index*2016 + i
-            self._save_header(header)
+        self._save_raw_headers(
+            index*2016, [chunk[i*80:(i+1)*80] for i in xrange(len(chunk)/80)])
 
     def save_chain(self, chain):
-        pass
+        if chain:
+            self._save_raw_headers(chain[0]['block_height'],
+                                   map(self.header_to_raw, chain))
 
     def truncate(self, index):
         self.execute("""DELETE FROM blockchain_headers WHERE height >= ?""", (index,))
 
 
+class PollingNewBlocksSource(object):
+    """Source of new block heights which has nothing to push: NewBlocks
+    falls back to polling the blockchain state once the wait times out.
+    """
+    def __init__(self):
+        self.stop_event = threading.Event()
+
+    def wait_for_height(self, timeout):
+        self.stop_event.wait(timeout)
+        return None
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class ChromanodeNewBlocksSource(object):
+    """Uses the chromanode long-poll endpoint which returns as soon as
+    the server sees a block above the height we already know about.
+    """
+    def __init__(self, bcs):
+        self.bcs = bcs
+        self.height = None
+
+    def wait_for_height(self, timeout):
+        height = self.bcs.wait_for_block_count(self.height, timeout)
+        if height == self.height:
+            return None
+        self.height = height
+        return height
+
+    def stop(self):
+        pass
+
+
+class ElectrumNewBlocksSource(object):
+    """Subscribes to blockchain.numblocks.subscribe on a dedicated
+    Electrum connection and waits for the server to push new heights.
+    The connection is made by the first wait_for_height, so NewBlocks
+    falls back to polling if the server can't be reached.
+    """
+    def __init__(self, host, port):
+        self.connection = (host, port)
+        self.interface = None
+        self.height = None
+        self.stopped = False
+        self.lock = threading.Lock()
+
+    def get_interface(self):
+        with self.lock:
+            if self.interface is None and not self.stopped:
+                self.interface = ElectrumInterface(*self.connection)
+            return self.interface
+
+    def wait_for_height(self, timeout):
+        interface = self.get_interface()
+        if interface is None:
+            return None
+        if self.height is None:
+            self.height = interface.get_height()
+            return self.height
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            notification = interface.wait_for_notification(
+                deadline - time.time())
+            if notification is None:
+                break
+            if notification.get('method') == 'blockchain.numblocks.subscribe':
+                self.height = notification['params'][0]
+                return self.height
+        return None
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.interface is not None:
+                self.interface.close()
+
+
+def make_new_blocks_source(bcs, params):
+    """Create a source of new block notifications for <bcs> according
+    to <params> (the "new_blocks" section of the wallet config).
+    """
+    use = params.get('source')
+    if use is None:
+        use = 'chromanode' if hasattr(bcs, 'wait_for_block_count') else 'poll'
+    if use == 'chromanode':
+        return ChromanodeNewBlocksSource(bcs)
+    elif use == 'electrum':
+        return ElectrumNewBlocksSource(
+            params.get('electrum_server', DEFAULT_ELECTRUM_SERVER),
+            params.get('electrum_port', DEFAULT_ELECTRUM_PORT))
+    elif use == 'poll':
+        return PollingNewBlocksSource()
+    else:
+        raise Exception('Unknown source for NewBlocks!')
+
+
 class NewBlocks(threading.Thread):
-    def __init__(self, bcs, queue):
+    """Feeds the tip header into <queue> whenever <source> reports a new
+    block. The blockchain state is still polled every <interval> seconds,
+    and exclusively so once the source fails.
+    """
+    def __init__(self, bcs, queue, source=None, interval=30):
         threading.Thread.__init__(self)
         self.running = False
         self.lock = threading.Lock()
         self.daemon = True
         self.bcs = bcs
         self.queue = queue
+        self.source = source or PollingNewBlocksSource()
+        self.interval = interval
+
+    def _report_error(self, e):
+        sys.stderr.write('Error! %s: %s\n' % (type(e), e))
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.flush()
+
+    def _wait_for_height(self):
+        try:
+            return self.source.wait_for_height(self.interval)
+        except Exception, e:
+            self._report_error(e)
+            sys.stderr.write('Falling back to polling for new blocks\n')
+            sys.stderr.flush()
+            self.source = PollingNewBlocksSource()
+            return None
 
     def run(self):
         with self.lock:
             self.running = True
 
-        run_time = time.time()
+        height = None
         while self.is_running():
-            if run_time > time.time():
-                time.sleep(0.05)
-                continue
             try:
-                header = self.bcs.get_header(self.bcs.get_height())
-                self.queue.put(header)
+                if height is None:
+                    height = self.bcs.get_height()
+                self.queue.put(self.bcs.get_header(height))
             except Exception, e:
-                sys.stderr.write('Error! %s: %s\n' % (type(e), e))
-                traceback.print_exc(file=sys.stderr)
-                sys.stderr.flush()
-            run_time = time.time() + 30
+                self._report_error(e)
+            height = self._wait_for_height()
 
     def is_running(self):
         with self.lock:
@@ -194,6 +312,7 @@ class NewBlocks(threading.Thread):
     def stop(self):
         with self.lock:
             self.running = False
+        self.source.stop()
 
 
 class BlockHashingAlgorithm(object):
@@ -203,6 +322,17 @@ class BlockHashingAlgorithm(object):
     def __init__(self, store, testnet):
         self.store = store
         self.testnet = testnet
+        # retarget period index -> (bits, target), only for periods
+        # computed entirely from headers in the store
+        self.targets = {}
+
+    def invalidate_targets(self, height):
+        """Forget cached targets which depend on headers at <height>
+        or above, call before the store is truncated to <height>.
+        """
+        for index in self.targets.keys():
+            if index*2016 - 1 >= height:
+                del self.targets[index]
 
     def hash_header(self, raw_header):
         import hashlib
@@ -214,9 +344,12 @@ class BlockHashingAlgorithm(object):
 
         if index == 0:
             return self.max_bits, self.max_target
+        if index in self.targets:
+            return self.targets[index]
 
         first = self.store.read_header((index-1)*2016)
         last = self.store.read_header(index*2016-1)
+        cacheable = last is not None
         if last is None:
             for h in chain:
                 if h.get('block_height') == index*2016-1:
@@ -251,6 +384,8 @@ class BlockHashingAlgorithm(object):
             i += 1
 
         new_bits = c + MM * i
+        if cacheable:
+            self.targets[index] = (new_bits, new_target)
         return new_bits, new_target
 
     def verify_chunk(self, index, chunk):
@@ -290,8 +425,14 @@ class BlockHashingAlgorithm(object):
         prev_header = self.store.read_header(chain[0].get('block_height')-1)
         prev_hash = self.hash_header(self.store.header_to_raw(prev_header))
 
+        # headers of the chain are not verified yet, so targets derived
+        # from them are only reused within this call
+        targets = {}
         for header in chain:
-            bits, target = self.get_target(header.get('block_height')/2016, chain)
+            index = header.get('block_height')/2016
+            if index not in targets:
+                targets[index] = self.get_target(index, chain)
+            bits, target = targets[index]
             _hash = self.hash_header(self.store.header_to_raw(header))
 
             assert prev_hash == header.get('prev_block_hash')
@@ -310,13 +451,13 @@ class BlockHashingAlgorithm(object):
 
 
 class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
-    def __init__(self, bcs, txdb, testnet, path):
+    def __init__(self, bcs, txdb, testnet, path, new_blocks_source=None):
         threading.Thread.__init__(self)
         self.running = False
         self.sync = False
         self.lock = threading.Lock()
         self.queue = Queue.Queue()
-        self.newBlocks = NewBlocks(bcs, self.queue)
+        self.newBlocks = NewBlocks(bcs, self.queue, new_blocks_source)
 
         self.bcs = bcs
         self.txdb = txdb
@@ -334,10 +475,9 @@ class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
 
         self.newBlocks.start()
         while self.is_running():
-            try:
-                header = self.queue.get_nowait()
-            except Queue.Empty:
-                time.sleep(0.05)
+            header = self.queue.get()
+            if header is None:
+                # woken up by stop()
                 continue
 
             if header['block_height'] == self.height:
@@ -372,6 +512,7 @@ class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
         with self.lock:
             self.running = False
         self.newBlocks.stop()
+        self.queue.put(None)
 
     @property
     def height(self):
@@ -390,7 +531,7 @@ class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
         sys.stderr.flush()
         if hasattr(self.txdb, 'drop_from_height'):
             self.txdb.drop_from_height(height)
-        self.txdb.store.reset_from_height(height)
+        self.txdb.reset_from_height(height)
 
     def _get_chunks(self, header):
         max_index = (header['block_height'] + 1)/2016
@@ -432,6 +573,7 @@ class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
                 sys.stderr.flush()
                 return False
 
+            self.bha.invalidate_targets(index*2016)
             self.store.truncate(index*2016)
             self.store.save_chunk(index, chunk)
             index += 1
@@ -473,6 +615,7 @@ class VerifiedBlockchainState(BlockchainStateBase, threading.Thread):
                 sys.stderr.flush()
                 return False
 
+            self.bha.invalidate_targets(chain[0]['block_height'])
             self.store.truncate(chain[0]['block_height'])
             self.store.save_chain(chain)
             return True
@@ -12,9 +12,16 @@ Information about coins is added either by UTXO fetcher or by wallet
 controller through apply_tx.
 """
 
+import bisect
+import json
+from collections import defaultdict
+
 from coloredcoinlib.store import DataStore, DataStoreConnection, unwrap1
-from coloredcoinlib.txspec import ComposedTxSpec
+from coloredcoinlib.txspec import (ComposedTxSpec, P2PKH_SCRIPT_SIG_SIZE,
+                                   P2PKH_COMPRESSED_SCRIPT_SIG_SIZE)
 from txcons import RawTxSpec
+import pycoin_txcons
+from txdb import TX_STATUS_UNKNOWN, TX_STATUS_CONFIRMED, TX_STATUS_INVALID
 from coloredcoinlib import UNCOLORED_MARKER, SimpleColorValue
 
 def flatten1(lst):
@@ -48,6 +55,10 @@ class CoinStore(DataStore):
                          "(coin_id, txhash)")
             self.execute("CREATE INDEX coin_spends_txhash ON coin_spends "
                          "(txhash)")
+        if not self.column_exists('coin_data', 'colorvalues'):
+            # JSON list of [color_id, value, label] of confirmed coins
+            self.execute(
+                "ALTER TABLE coin_data ADD COLUMN colorvalues TEXT")
 
     def purge_coins(self):
         self.execute("DELETE FROM coin_spends")
@@ -80,6 +91,10 @@ class CoinStore(DataStore):
          return unwrap1(self.execute("SELECT id FROM coin_data WHERE txhash = ? and outindex = ?",
                                      (txhash, outindex)).fetchone())
 
+    def set_colorvalues(self, coin_id, colorvalues):
+        self.execute("UPDATE coin_data SET colorvalues = ? WHERE id = ?",
+                     (json.dumps(colorvalues), coin_id))
+
     def get_coin_spends(self, coin_id):
         return flatten1(self.execute("SELECT txhash FROM coin_spends WHERE coin_id = ?",
                                      (coin_id, )).fetchall())
@@ -94,6 +109,80 @@ class CoinStore(DataStore):
         return self.execute("SELECT * FROM coin_data WHERE id = ?",
                             (coin_id,)).fetchone()
 
+    # stay below SQLITE_MAX_VARIABLE_NUMBER
+    MAX_QUERY_ADDRESSES = 500
+
+    # coin_data rows together with status of their transaction
+    # (tx_status) and whether a valid transaction spends them (spent)
+    coin_state_query = """
+        SELECT * FROM (
+            SELECT coin_data.*,
+                   IFNULL(tx_data.status, {unknown}) AS tx_status,
+                   EXISTS (
+                       SELECT 1 FROM coin_spends
+                       LEFT JOIN tx_data AS spend_tx
+                           ON spend_tx.txhash = coin_spends.txhash
+                       WHERE coin_spends.coin_id = coin_data.id
+                           AND IFNULL(spend_tx.status, {unknown}) != {invalid}
+                   ) AS spent
+            FROM coin_data
+            LEFT JOIN tx_data ON tx_data.txhash = coin_data.txhash
+            WHERE {where}
+        ) WHERE {conditions} ORDER BY id"""
+
+    def query_coin_states(self, where, conditions, params):
+        return self.execute(self.coin_state_query.format(
+            unknown=TX_STATUS_UNKNOWN,
+            invalid=TX_STATUS_INVALID,
+            where=where,
+            conditions=" AND ".join(conditions) or "1"),
+            params).fetchall()
+
+    def query_coins(self, addresses, spent, confirmed=True):
+        """Return coins of <addresses> together with status of their
+        transaction (tx_status) and whether a valid transaction spends
+        them (spent). Coins of invalid transactions are skipped.
+        <spent> selects spent or unspent coins, <confirmed> selects
+        confirmed (True), unconfirmed (False) or all (None) coins.
+        """
+        conditions = ["tx_status != %d" % TX_STATUS_INVALID, "spent = ?"]
+        if confirmed is True:
+            conditions.append("tx_status = %d" % TX_STATUS_CONFIRMED)
+        elif confirmed is False:
+            conditions.append("tx_status != %d" % TX_STATUS_CONFIRMED)
+        addresses = list(addresses)
+        coins = []
+        for i in xrange(0, len(addresses), self.MAX_QUERY_ADDRESSES):
+            chunk = addresses[i:i + self.MAX_QUERY_ADDRESSES]
+            where = "coin_data.address IN (%s)" % ", ".join("?" * len(chunk))
+            coins.extend(self.query_coin_states(
+                where, conditions, tuple(chunk) + (int(spent),)))
+        return coins
+
+    def get_outpoint_addresses(self, txhashes):
+        """Returns {(txhash, outindex): address} for coins created by
+        transactions <txhashes>.
+        """
+        txhashes = list(set(txhashes))
+        addresses = {}
+        for i in xrange(0, len(txhashes), self.MAX_QUERY_ADDRESSES):
+            chunk = txhashes[i:i + self.MAX_QUERY_ADDRESSES]
+            rows = self.execute(
+                "SELECT txhash, outindex, address FROM coin_data "
+                "WHERE txhash IN (%s)" % ", ".join("?" * len(chunk)),
+                chunk).fetchall()
+            for txhash, outindex, address in rows:
+                addresses[(txhash, outindex)] = address
+        return addresses
+
+    def get_tx_coins(self, txhash):
+        """Return coins created or spent by transaction <txhash>,
+        with tx_status and spent like query_coins.
+        """
+        where = """coin_data.txhash = ? OR coin_data.id IN (
+            SELECT coin_id FROM coin_spends WHERE txhash = ?)"""
+        return self.query_coin_states(where, [], (txhash, txhash))
+
 class UTXO(ComposedTxSpec.TxIn):
     def __init__(self, utxo_data):
         super(UTXO, self).__init__(utxo_data['txhash'], utxo_data['outindex'])
@@ -104,12 +193,24 @@ class UTXO(ComposedTxSpec.TxIn):
         self.address_rec = None
         self.colorvalues = None
 
+    def get_script_sig_size(self):
+        if self.address_rec and self.address_rec.compressed:
+            return P2PKH_COMPRESSED_SCRIPT_SIG_SIZE
+        return P2PKH_SCRIPT_SIG_SIZE
+
 class Coin(UTXO):
     def __init__(self, coin_manager, coin_data):
         super(Coin, self).__init__(coin_data)
         self.coin_id = coin_data['id']
         self.address = coin_data['address']
         self.coin_manager = coin_manager
+        # filled in when the coin comes from CoinStore.query_coins
+        keys = coin_data.keys()
+        self.tx_status = coin_data['tx_status'] if 'tx_status' in keys else None
+        self.spent = bool(coin_data['spent']) if 'spent' in keys else None
+        # colorvalues resolved earlier, decoded by CoinManager
+        self.stored_colorvalues = coin_data['colorvalues'] \
+            if 'colorvalues' in keys else None
 
     def get_address(self):
         if self.address_rec:
@@ -128,12 +229,18 @@ class Coin(UTXO):
         return self.coin_manager.get_coin_spending_txs(self)
 
     def is_spent(self):
+        if self.spent is not None:
+            return self.spent
         return self.coin_manager.is_coin_spent(self)
     
     def is_confirmed(self):
+        if self.tx_status is not None:
+            return self.tx_status == TX_STATUS_CONFIRMED
         return self.coin_manager.is_coin_confirmed(self)
 
     def is_valid(self):
+        if self.tx_status is not None:
+            return self.tx_status != TX_STATUS_INVALID
         return self.coin_manager.is_coin_valid(self)
         
 class CoinQuery(object):
@@ -160,33 +267,35 @@ class CoinQuery(object):
             return True
         return coin.is_confirmed()    
 
-    def get_coins_for_address(self, address_rec):
-        """Given an address <address_rec>, return the list of coin's
-        straight from the DB. Note this specifically does NOT return
-        COIN objects.
+    def get_confirmed_filter(self):
+        if self.filter_options.get('only_unconfirmed', False):
+            return False
+        if self.filter_options.get('include_unconfirmed', False):
+            return None
+        return True
+
+    def query_coins(self, address_recs):
+        """Get coins of <address_recs> which match filter options with
+        a single query, spent and confirmed flags are checked in SQL.
+        """
+        self.model.get_tx_db().maybe_recheck_tx_statuses()
+        address_lookup = {ar.get_address(): ar for ar in address_recs}
+        coins = self.coin_manager.query_coins(
+            address_lookup.keys(), self.filter_options['spent'],
+            self.get_confirmed_filter())
+        for coin in coins:
+            coin.address_rec = address_lookup[coin.address]
+        return coins
+
+    def filter_relevant(self, coins):
+        """Compute colorvalues of <coins> and return those which have
+        a color from our color set.
         """
         color_set = self.color_set
-        addr_color_set = address_rec.get_color_set()
-        all_coins = filter(
-            self.coin_matches_filter,
-            self.coin_manager.get_coins_for_address(address_rec.get_address()))
-        cdata = self.model.ccc.colordata
-        address_is_uncolored = addr_color_set.color_id_set == set([0])
-        if address_is_uncolored:
-            for coin in all_coins:
-                coin.address_rec = address_rec
-                coin.colorvalues = [SimpleColorValue(colordef=UNCOLORED_MARKER,
-                                                     value=coin.value)]
-            return all_coins
-        for coin in all_coins:
-            coin.address_rec = address_rec
-            coin.colorvalues = None
-            try:
-                coin.colorvalues = cdata.get_colorvalues(
-                    addr_color_set.color_id_set, coin.txhash, coin.outindex)
-            except Exception as e:
-                raise
         def relevant(coin):
+            coin.colorvalues = self.coin_manager.compute_colorvalues(coin)
+            if coin.address_rec.get_color_set().uncolored_only():
+                return True
             cvl = coin.colorvalues
             if coin.colorvalues is None:
                 return False  # None indicates failure
@@ -196,17 +305,20 @@ class CoinQuery(object):
                 if color_set.has_color_id(cv.get_color_id()):
                     return True
                 return False
-        return filter(relevant, all_coins)
+        return filter(relevant, coins)
+
+    def get_coins_for_address(self, address_rec):
+        """Given an address <address_rec>, return the list of coins
+        which match this query.
+        """
+        return self.filter_relevant(self.query_coins([address_rec]))
 
     def get_result(self):
         """Returns all utxos for the color_set defined for this query.
         """
         addr_man = self.model.get_address_manager()
         addresses = addr_man.get_addresses_for_color_set(self.color_set)
-        utxos = []
-        for address in addresses:
-            utxos.extend(self.get_coins_for_address(address))
-        return utxos
+        return self.filter_relevant(self.query_coins(addresses))
 
 
 class CoinManager(object):
@@ -220,24 +332,175 @@ class CoinManager(object):
         params = config.get('utxodb', {})
         self.model = model
         self.store = CoinStore(self.model.store_conn.conn)
+        # unspent value by (color_id, confirmed), built on first use
+        self.balances = None
+        # coin_id -> [((color_id, confirmed), value)] counted in balances
+        self.balance_entries = {}
+        self.balances_reset_count = None
+        # color_id -> sorted [(value, coin_id)] of confirmed unspent coins,
+        # kept together with balances
+        self.spendable = defaultdict(list)
+        # coin_id -> Coin in self.spendable
+        self.spendable_coins = {}
+        # (txhash, outindex) -> address of outputs which aren't our
+        # coins, see get_prevout_addresses
+        self.prevout_addresses = pycoin_txcons.LRUCache(10000)
 
     def compute_colorvalues(self, coin):
-        wam = self.model.get_address_manager()
-        address_rec = wam.find_address_record(coin.address)
+        """Returns colorvalues of <coin>. They are taken from coin_data
+        if present and stored there once resolved for a confirmed coin.
+        """
+        if coin.stored_colorvalues:
+            return [SimpleColorValue(colordef=self.model.get_color_def(color_id),
+                                     value=value, label=label)
+                    for color_id, value, label
+                    in json.loads(coin.stored_colorvalues)]
+        address_rec = coin.address_rec
+        if not address_rec:
+            wam = self.model.get_address_manager()
+            address_rec = wam.find_address_record(coin.address)
         if not address_rec:
             raise Exception('Address record not found!')
         color_set = address_rec.get_color_set()
         if color_set.uncolored_only():
             return [SimpleColorValue(colordef=UNCOLORED_MARKER,
                                      value=coin.value)]
-        else:
-            cdata = self.model.ccc.colordata
-            return cdata.get_colorvalues(color_set.color_id_set,
-                                         coin.txhash, coin.outindex)
+        cdata = self.model.ccc.colordata
+        colorvalues = cdata.get_colorvalues(color_set.color_id_set,
+                                            coin.txhash, coin.outindex)
+        # colorvalues of confirmed outputs don't change, an empty list
+        # might if the address gets a color later (genesis address)
+        if colorvalues and coin.is_confirmed():
+            data = [[cv.get_color_id(), cv.get_value(), cv.get_label()]
+                    for cv in colorvalues]
+            self.store.set_colorvalues(coin.coin_id, data)
+            coin.stored_colorvalues = json.dumps(data)
+        return colorvalues
 
     def purge_coins(self):
         """full rescan"""
         self.store.purge_coins()
+        self.balances = None
+
+    def rebuild_balances(self):
+        """Compute balances and the spendable coin pool from scratch
+        using all unspent coins.
+        """
+        wam = self.model.get_address_manager()
+        addresses = [ar.get_address() for ar in wam.get_all_addresses()]
+        self.balances = None
+        self.balance_entries = {}
+        self.spendable = defaultdict(list)
+        self.spendable_coins = {}
+        self.balances_reset_count = self.model.get_tx_db().reset_count
+        balances = defaultdict(int)
+        for coin in self.query_coins(addresses, False, None):
+            self._add_balance_entry(balances, coin)
+        self.balances = balances
+
+    def _add_balance_entry(self, balances, coin):
+        if coin.spent or coin.tx_status == TX_STATUS_INVALID:
+            return
+        colorvalues = self.compute_colorvalues(coin)
+        if not colorvalues:
+            return
+        confirmed = coin.tx_status == TX_STATUS_CONFIRMED
+        entries = [((cv.get_color_id(), confirmed), cv.get_value())
+                   for cv in colorvalues]
+        for key, value in entries:
+            balances[key] += value
+        self.balance_entries[coin.coin_id] = entries
+        if confirmed:
+            wam = self.model.get_address_manager()
+            coin.address_rec = wam.find_address_record(coin.address)
+            coin.colorvalues = colorvalues
+            self.spendable_coins[coin.coin_id] = coin
+            for (color_id, _), value in entries:
+                bisect.insort(self.spendable[color_id],
+                              (value, coin.coin_id))
+
+    def _remove_balance_entry(self, balances, coin_id):
+        is_spendable = self.spendable_coins.pop(coin_id, None) is not None
+        for key, value in self.balance_entries.pop(coin_id, []):
+            balances[key] -= value
+            if is_spendable:
+                pool = self.spendable[key[0]]
+                del pool[bisect.bisect_left(pool, (value, coin_id))]
+
+    def update_balances(self, txhash):
+        """Update balances after coins created or spent by <txhash>
+        were added or status of <txhash> has changed.
+        """
+        balances = self.balances
+        if balances is None:
+            return
+        try:
+            for coin_rec in self.store.get_tx_coins(txhash):
+                coin = Coin(self, coin_rec)
+                self._remove_balance_entry(balances, coin.coin_id)
+                self._add_balance_entry(balances, coin)
+        except Exception:
+            # e.g. colorvalues can't be computed yet, rebuild on next read
+            self.balances = None
+
+    def ensure_balances(self):
+        """Rebuild balances and spendable coins unless they are current.
+        """
+        txdb = self.model.get_tx_db()
+        txdb.maybe_recheck_tx_statuses()
+        if (self.balances is None or
+                self.balances_reset_count != txdb.reset_count):
+            self.rebuild_balances()
+
+    def get_balance(self, color_set, confirmed=True):
+        """Returns unspent value of colors in <color_set>, <confirmed>
+        selects confirmed (True), unconfirmed (False) or all (None) coins.
+        """
+        self.ensure_balances()
+        if confirmed is None:
+            confirmed_flags = [True, False]
+        else:
+            confirmed_flags = [confirmed]
+        return sum(self.balances.get((color_id, flag), 0)
+                   for color_id in color_set.color_id_set
+                   for flag in confirmed_flags)
+
+    def get_spendable_coins(self, color_id):
+        """Returns confirmed unspent coins of <color_id> with colorvalues
+        and address records set, ordered by value.
+        """
+        self.ensure_balances()
+        return [self.spendable_coins[coin_id]
+                for value, coin_id in self.spendable.get(color_id, [])]
+
+    def get_prevout_addresses(self, outpoints):
+        """Returns addresses of outputs at (txhash, outindex)
+        <outpoints>, None for outputs without one. Our coins are
+        looked up in coin_data and other outputs in a cache, so
+        transactions are fetched (each once) only for the rest.
+        """
+        addresses = self.store.get_outpoint_addresses(
+            [txhash for txhash, outindex in outpoints])
+        missing = defaultdict(list)
+        for outpoint in outpoints:
+            if outpoint in addresses:
+                continue
+            address = self.prevout_addresses.get(outpoint)
+            if address is not None:
+                addresses[outpoint] = address
+            elif outpoint[0] != 'coinbase':
+                missing[outpoint[0]].append(outpoint)
+        bs = self.model.get_blockchain_state()
+        for txhash, tx_outpoints in missing.items():
+            tx = bs.get_tx(txhash)
+            for outpoint in tx_outpoints:
+                raw_address = tx.outputs[outpoint[1]].raw_address
+                if raw_address:
+                    address = pycoin_txcons.raw_to_address(self.model,
+                                                           raw_address)
+                    addresses[outpoint] = address
+                    self.prevout_addresses.put(outpoint, address)
+        return [addresses.get(outpoint) for outpoint in outpoints]
 
     def find_coin(self, txhash, outindex):
         coin_id = self.store.find_coin(txhash, outindex)
@@ -275,6 +538,12 @@ class CoinManager(object):
             coins.append(coin)
         return coins
 
+    def query_coins(self, addresses, spent, confirmed=True):
+        """Returns Coin objects found by CoinStore.query_coins
+        """
+        return [Coin(self, coin_rec) for coin_rec in
+                self.store.query_coins(addresses, spent, confirmed)]
+
     def add_coin(self, address, txhash, outindex, value, script):
         coin_id = self.store.find_coin(txhash, outindex)
         if coin_id is None:
@@ -303,8 +572,7 @@ class CoinManager(object):
         utxos that it spends and add any utxos that are new
         """
 
-        all_addresses = [a.get_address() for a in
-                         self.model.get_address_manager().get_all_addresses()]
+        wam = self.model.get_address_manager()
 
         ctxs = raw_tx.composed_tx_spec
 
@@ -317,8 +585,9 @@ class CoinManager(object):
                 
         # put the new utxo into the db
         for i, txout in enumerate(ctxs.txouts):
-            script = raw_tx.pycoin_tx.txs_out[i].script.encode('hex')
-            if txout.target_addr in all_addresses:
+            if wam.has_address(txout.target_addr):
+                script = raw_tx.pycoin_tx.txs_out[i].script.encode('hex')
                 self.add_coin(txout.target_addr, txhash, i,
                               txout.value, script)
+        self.update_balances(txhash)
                              
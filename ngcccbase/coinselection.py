@@ -0,0 +1,208 @@
+"""
+coinselection.py
+
+Strategies for choosing which coins to spend.
+
+A selector works on plain integer values: it gets the values of the
+candidate coins, a function which returns the sum required when a given
+number of coins is spent (fees only depend on the number of inputs) and
+the largest excess which can be left to fees instead of creating
+a change output. It returns indices of the coins to spend, or None
+if it couldn't find enough.
+"""
+
+import abc
+import random
+import time
+
+
+class CoinSelector(object):
+    """Base class for coin selection strategies."""
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def select(self, values, required, change_window=0):
+        pass
+
+    def select_in_order(self, values, order, required):
+        """Take coins in <order> until they cover the required sum.
+        """
+        total = 0
+        for count, index in enumerate(order, 1):
+            total += values[index]
+            if total >= required(count):
+                return order[:count]
+        return None
+
+
+class FirstFitSelector(CoinSelector):
+    """Take coins in the order they were given."""
+
+    def select(self, values, required, change_window=0):
+        return self.select_in_order(values, range(len(values)), required)
+
+
+class LargestFirstSelector(CoinSelector):
+    """Take the largest coins first, which gives the fewest inputs."""
+
+    def select(self, values, required, change_window=0):
+        order = sorted(range(len(values)), key=lambda i: values[i],
+                       reverse=True)
+        return self.select_in_order(values, order, required)
+
+
+class BranchAndBoundSelector(CoinSelector):
+    """Depth-first search for a set of coins whose sum is between the
+    required sum and the required sum plus <change_window>, so that
+    no change output is needed. Gives up after <max_tries> steps or
+    <max_time> seconds and returns None if no such set was found.
+    """
+
+    def __init__(self, max_tries=20000, max_time=0.05):
+        self.max_tries = max_tries
+        self.max_time = max_time
+
+    def select(self, values, required, change_window=0):
+        order = sorted(range(len(values)), key=lambda i: values[i],
+                       reverse=True)
+        vals = [values[i] for i in order]
+        # rest[k] is the sum of vals[k:]
+        rest = [0] * (len(vals) + 1)
+        for k in xrange(len(vals) - 1, -1, -1):
+            rest[k] = rest[k + 1] + vals[k]
+
+        deadline = time.time() + self.max_time
+        best, best_waste = None, None
+        selected, total, k = [], 0, 0
+        for tries in xrange(self.max_tries):
+            if tries % 1000 == 999 and time.time() > deadline:
+                break
+            target = required(len(selected))
+            backtrack = (total + rest[k] < target or
+                         total > target + change_window)
+            if not backtrack and total >= target:
+                waste = total - target
+                if best is None or waste < best_waste:
+                    best, best_waste = list(selected), waste
+                    if waste == 0:
+                        break
+                backtrack = True
+            if backtrack:
+                if not selected:
+                    break
+                # try again without the last coin we included, skipping
+                # coins of the same value, which would give the same sums
+                last = selected.pop()
+                total -= vals[last]
+                k = last + 1
+                while k < len(vals) and vals[k] == vals[last]:
+                    k += 1
+            else:
+                selected.append(k)
+                total += vals[k]
+                k += 1
+        if best is None:
+            return None
+        return [order[k] for k in best]
+
+
+class KnapsackSelector(CoinSelector):
+    """Randomized search for the smallest sum which covers the required
+    sum, compared with the smallest single coin which covers it.
+    """
+
+    def __init__(self, iterations=200, max_time=0.05, seed=None):
+        self.iterations = iterations
+        self.max_time = max_time
+        self.random = random.Random(seed)
+
+    def select(self, values, required, change_window=0):
+        target = required(1)
+        lowest_larger = None
+        smaller = []
+        for index, value in enumerate(values):
+            if value == target:
+                return [index]
+            elif value > target:
+                if (lowest_larger is None or
+                        value < values[lowest_larger]):
+                    lowest_larger = index
+            else:
+                smaller.append(index)
+
+        best = self.approximate_best_subset(values, smaller, required)
+        if best is None:
+            return [lowest_larger] if lowest_larger is not None else None
+        if lowest_larger is not None:
+            best_total = sum(values[i] for i in best)
+            if (values[lowest_larger] - target <=
+                    best_total - required(len(best))):
+                return [lowest_larger]
+        return best
+
+    def approximate_best_subset(self, values, candidates, required):
+        candidates = sorted(candidates, key=lambda i: values[i],
+                            reverse=True)
+        if sum(values[i] for i in candidates) < required(len(candidates)):
+            return None
+        best, best_total = list(candidates), sum(values[i]
+                                                 for i in candidates)
+        deadline = time.time() + self.max_time
+        for iteration in xrange(self.iterations):
+            if best_total == required(len(best)) or time.time() > deadline:
+                break
+            included = [False] * len(candidates)
+            total, count = 0, 0
+            reached = False
+            for npass in xrange(2):
+                if reached:
+                    break
+                for n, index in enumerate(candidates):
+                    if included[n] or (npass == 0 and
+                                       self.random.random() < 0.5):
+                        continue
+                    included[n] = True
+                    total += values[index]
+                    count += 1
+                    if total >= required(count):
+                        reached = True
+                        if total < best_total:
+                            best_total = total
+                            best = [candidates[m] for m, inc
+                                    in enumerate(included) if inc]
+                        included[n] = False
+                        total -= values[index]
+                        count -= 1
+        return best
+
+
+class CoinSelectionEngine(CoinSelector):
+    """Try <selectors> in turn until one of them finds a selection."""
+
+    def __init__(self, selectors):
+        self.selectors = selectors
+
+    def select(self, values, required, change_window=0):
+        for selector in self.selectors:
+            selection = selector.select(values, required, change_window)
+            if selection is not None:
+                return selection
+        return None
+
+
+COIN_SELECTORS = {
+    'bnb': lambda: CoinSelectionEngine([BranchAndBoundSelector(),
+                                        KnapsackSelector()]),
+    'knapsack': KnapsackSelector,
+    'largest_first': LargestFirstSelector,
+    'first_fit': FirstFitSelector,
+}
+
+
+def make_coin_selector(name='bnb'):
+    """Make the coin selector called <name>, the default tries to avoid
+    change with branch-and-bound and falls back on knapsack.
+    """
+    if name not in COIN_SELECTORS:
+        raise Exception('Unknown coin selection strategy %s!' % name)
+    return COIN_SELECTORS[name]()
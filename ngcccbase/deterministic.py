@@ -2,12 +2,12 @@ import hashlib
 import hmac
 import os
 
-from pycoin.ecdsa.secp256k1 import generator_secp256k1 as BasePoint
-from pycoin.encoding import from_bytes_32, public_pair_to_bitcoin_address
+from pycoin.encoding import from_bytes_32
 
 from address import AddressRecord, LooseAddressRecord
 from asset import AssetDefinition
 from coloredcoinlib import ColorSet
+from coloredcoinlib.store import DataStore
 
 
 class DeterministicAddressRecord(AddressRecord):
@@ -20,25 +20,87 @@ class DeterministicAddressRecord(AddressRecord):
         and index <index> with the master key <master_key>.
         The address record returned for the same three variables
         will be the same every time, hence "deterministic".
+        Given <public_data> (see AddressRecord.get_public_data)
+        the private key is only derived when needed.
         """
         super(DeterministicAddressRecord, self).__init__(**kwargs)
-
-        if len(self.color_set.get_data()) == 0:
-            color_string = "genesis block"
+        self.master_key = kwargs['master_key']
+        self.index = kwargs.get('index')
+        self.color_key = self.get_color_key(self.color_set)
+        public_data = kwargs.get('public_data')
+        if public_data:
+            self.set_public_data(*public_data)
         else:
-            color_string = self.color_set.get_hash_string()
+            self.set_secret_exponent(self.derive_secret_exponent())
+
+    @staticmethod
+    def get_color_key(color_set):
+        """String identifying <color_set> in key derivation.
+        """
+        if len(color_set.get_data()) == 0:
+            return "genesis block"
+        return color_set.get_hash_string()
+
+    def derive_secret_exponent(self):
+        h = hmac.new(str(self.master_key),
+                     "%s|%s" % (self.color_key, self.index), hashlib.sha256)
+        return from_bytes_32(h.digest())
+
+
+class SigningKeys(object):
+    """Maps hash160 of our keys to (secret exponent, public pair,
+    compressed), which is what pycoin uses to sign. Private keys are
+    derived when first asked for.
+    """
+    def __init__(self, hash160_index):
+        self.hash160_index = hash160_index
+        self.keys = {}
+
+    def get(self, hash160, default=None):
+        key = self.keys.get(hash160)
+        if key is None:
+            address_rec = self.hash160_index.get(hash160)
+            if address_rec is None:
+                return default
+            key = (address_rec.rawPrivKey, address_rec.get_public_pair(),
+                   address_rec.compressed)
+            self.keys[hash160] = key
+        return key
+
+
+class AddressStore(DataStore):
+    """Public data of derived addresses by wallet, color key and index,
+    so they needn't be derived again (an EC multiplication each) when
+    the wallet is loaded.
+    """
+    def __init__(self, conn):
+        super(AddressStore, self).__init__(conn)
+        if not self.table_exists('address_keys'):
+            self.execute("""
+                CREATE TABLE address_keys (
+                    wallet TEXT, color_key TEXT, idx INTEGER,
+                    address TEXT, hash160 TEXT, pubkey TEXT,
+                    PRIMARY KEY (wallet, color_key, idx))""")
+
+    def get_public_data(self, wallet):
+        """Returns {(color_key, index): (address, hash160, pubkey)}
+        of addresses of <wallet>.
+        """
+        rows = self.execute(
+            "SELECT color_key, idx, address, hash160, pubkey "
+            "FROM address_keys WHERE wallet = ?", (wallet,))
+        return dict(((str(color_key), idx),
+                     (str(address), str(hash160).decode('hex'),
+                      str(pubkey).decode('hex')))
+                    for color_key, idx, address, hash160, pubkey in rows)
+
+    def add_public_data(self, wallet, color_key, index, public_data):
+        address, hash160, pubkey = public_data
+        self.execute(
+            "INSERT OR REPLACE INTO address_keys VALUES (?, ?, ?, ?, ?, ?)",
+            (wallet, color_key, index, address, hash160.encode('hex'),
+             pubkey.encode('hex')))
 
-        self.index = kwargs.get('index')
-        h = hmac.new(str(kwargs['master_key']),
-                     "%s|%s" % (color_string, self.index), hashlib.sha256)
-        string = h.digest()
-        self.rawPrivKey = from_bytes_32(string)
-        self.publicPoint = BasePoint * self.rawPrivKey
-        self.address = public_pair_to_bitcoin_address(
-            self.publicPoint.pair(),
-            compressed=False,
-            address_prefix=self.prefix
-        )
 
 class DWalletAddressManager(object):
     """This class manages the creation of new AddressRecords.
@@ -46,15 +108,24 @@ class DWalletAddressManager(object):
     in this wallet and how many addresses of each color have been
     created in this wallet.
     """
-    def __init__(self, colormap, config):
+    record_class = DeterministicAddressRecord
+
+    def __init__(self, colormap, config, store_conn=None):
         """Create a deterministic wallet address manager given
         a colormap <colormap> and a configuration <config>.
         Note address manager configuration is in the key "dwam".
+        Public data of addresses is kept in the store behind
+        <store_conn>, if given, so loading the wallet needn't
+        derive keys again.
         """
         self.config = config
         self.testnet = config.get('testnet', False)
         self.colormap = colormap
         self.addresses = []
+        # address string and hash160 -> AddressRecord
+        self.address_index = {}
+        self.hash160_index = {}
+        self.hash160_lookup = SigningKeys(self.hash160_index)
 
         # initialize the wallet manager if this is the first time
         #  this will generate a master key.
@@ -65,6 +136,57 @@ class DWalletAddressManager(object):
         # master key is stored in a separate config entry
         self.master_key = config['dw_master_key']
 
+        self.init_address_store(store_conn, 'dw')
+        self.import_addresses(params)
+
+    def init_address_store(self, store_conn, kind):
+        """Load public data of addresses of this wallet from the store
+        behind <store_conn>, wallets are told apart by <kind>, testnet
+        and a hash of the master key.
+        """
+        self.wallet_id = hashlib.sha256("%s|%s|%s" % (
+            kind, self.testnet, self.master_key)).hexdigest()[:32]
+        self.address_store = None
+        self.public_data = {}
+        if store_conn is not None:
+            self.address_store = AddressStore(store_conn.conn)
+            self.public_data = self.address_store.get_public_data(
+                self.wallet_id)
+
+    def get_record_params(self):
+        """Parameters of record_class apart from color set and index.
+        """
+        return {'master_key': self.master_key}
+
+    def make_address_record(self, color_set, index):
+        """Returns the address record of <color_set> and <index>,
+        its key is only derived if the address store doesn't have
+        its public data.
+        """
+        key = (self.record_class.get_color_key(color_set), index)
+        public_data = self.public_data.get(key)
+        address_rec = self.record_class(
+            color_set=color_set, index=index, testnet=self.testnet,
+            public_data=public_data, **self.get_record_params())
+        if public_data is None:
+            public_data = address_rec.get_public_data()
+            self.public_data[key] = public_data
+            if self.address_store is not None:
+                self.address_store.add_public_data(
+                    self.wallet_id, key[0], index, public_data)
+        return address_rec
+
+    def import_addresses(self, params):
+        """Import the addresses described by the address manager
+        configuration <params> and the one-off addresses.
+        """
+        if self.address_store is not None:
+            with self.address_store.atomic():
+                self._import_addresses(params)
+        else:
+            self._import_addresses(params)
+
+    def _import_addresses(self, params):
         self.genesis_color_sets = params['genesis_color_sets']
         self.color_set_states = params['color_set_states']
 
@@ -73,29 +195,24 @@ class DWalletAddressManager(object):
             addr = self.get_genesis_address(i)
             addr.color_set = ColorSet(self.colormap,
                                       color_desc_list)
-            self.addresses.append(addr)
+            self.add_address_record(addr)
 
         # now import the specific color addresses
         for color_set_st in self.color_set_states:
             color_desc_list = color_set_st['color_set']
             max_index = color_set_st['max_index']
             color_set = ColorSet(self.colormap, color_desc_list)
-            params = {
-                'testnet': self.testnet,
-                'master_key': self.master_key,
-                'color_set': color_set
-                }
             for index in xrange(max_index + 1):
-                params['index'] = index
-                self.addresses.append(DeterministicAddressRecord(**params))
+                self.add_address_record(
+                    self.make_address_record(color_set, index))
 
         # import the one-off addresses from the config
-        for addr_params in config.get('addresses', []):
+        for addr_params in self.config.get('addresses', []):
             addr_params['testnet'] = self.testnet
             addr_params['color_set'] = ColorSet(self.colormap,
                                                 addr_params['color_set'])
             address = LooseAddressRecord(**addr_params)
-            self.addresses.append(address)
+            self.add_address_record(address)
 
     def init_new_wallet(self):
         """Initialize the configuration if this is the first time
@@ -141,10 +258,8 @@ class DWalletAddressManager(object):
         else:
             color_set = asset_or_color_set
         index = self.increment_max_index_for_color_set(color_set)
-        na = DeterministicAddressRecord(master_key=self.master_key,
-                                        color_set=color_set, index=index,
-                                        testnet=self.testnet)
-        self.addresses.append(na)
+        na = self.make_address_record(color_set, index)
+        self.add_address_record(na)
         self.update_config()
         return na
 
@@ -154,10 +269,8 @@ class DWalletAddressManager(object):
         index. In general, that index corresponds to the nth
         color created by this wallet.
         """
-        return DeterministicAddressRecord(
-            master_key=self.master_key,
-            color_set=ColorSet(self.colormap, []),
-            index=genesis_index, testnet=self.testnet)
+        return self.make_address_record(ColorSet(self.colormap, []),
+                                        genesis_index)
 
     def get_new_genesis_address(self):
         """Create a new genesis address and return it.
@@ -169,7 +282,7 @@ class DWalletAddressManager(object):
         self.update_config()
         address = self.get_genesis_address(index)
         address.index = index
-        self.addresses.append(address)
+        self.add_address_record(address)
         return address
 
     def update_genesis_address(self, address, color_set):
@@ -206,11 +319,33 @@ class DWalletAddressManager(object):
         """
         return self.addresses
 
+    def add_address_record(self, address_rec):
+        """Add <address_rec> to this wallet and index it by address
+        and hash160.
+        """
+        self.addresses.append(address_rec)
+        self.address_index[address_rec.get_address()] = address_rec
+        self.hash160_index[address_rec.rawPubkey()] = address_rec
+
+    def get_hash160_lookup(self):
+        """Returns a SigningKeys mapping hash160 of our keys to
+        (secret exponent, public pair, compressed), which is what
+        pycoin uses to sign. Unlike pycoin's build_hash160_lookup
+        it needs no EC multiplications, and only the private keys
+        of addresses which sign are derived.
+        """
+        return self.hash160_lookup
+
+    def has_address(self, address):
+        """Returns True if bitcoin address <address> belongs to this wallet.
+        """
+        return address in self.address_index
+
     def find_address_record(self, address):
-        for address_rec in self.addresses:
-            if address_rec.get_address() == address:
-                return address_rec
-        return None
+        return self.address_index.get(address)
+
+    def find_address_record_by_hash160(self, hash160):
+        return self.hash160_index.get(hash160)
 
     def get_addresses_for_color_set(self, color_set):
         """Given a color <color_set>, returns all AddressRecords
@@ -0,0 +1,87 @@
+"""
+feerate.py
+
+Sources of the fee rate transactions pay, in Satoshi per 1000 bytes.
+
+The wallet config key 'fee_rate' is either a number, or a dict like
+{"source": "electrum", "host": ..., "port": ..., "blocks": 6} to ask
+an Electrum server for the rate which gets a transaction into one of
+the next few blocks.
+"""
+
+import time
+
+from ngcccbase.services.electrum import ConnectionError, ElectrumInterface
+
+
+DEFAULT_FEE_RATE = 11000
+
+
+class FixedFeeRate(object):
+    """Always the same fee rate."""
+
+    def __init__(self, fee_rate=DEFAULT_FEE_RATE):
+        self.fee_rate = fee_rate
+
+    def get_fee_rate(self):
+        return self.fee_rate
+
+
+class ElectrumFeeRate(object):
+    """Fee rate the Electrum server estimates for confirmation within
+    <blocks> blocks. The interface to the server is made by calling
+    <make_interface> when an estimate is first needed. Estimates are
+    cached for <max_age> seconds, <fallback> is used when there is none,
+    e.g. because the server can't be reached.
+    """
+
+    def __init__(self, make_interface, blocks=6, fallback=DEFAULT_FEE_RATE,
+                 max_age=600):
+        self.make_interface = make_interface
+        self.interface = None
+        self.blocks = blocks
+        self.fallback = fallback
+        self.max_age = max_age
+        self.fee_rate = None
+        self.updated = 0
+
+    def estimate_fee(self):
+        try:
+            if self.interface is None:
+                self.interface = self.make_interface()
+            fee_rate = self.interface.estimate_fee(self.blocks)
+        except ConnectionError:
+            fee_rate = None
+            self.interface = None
+        if fee_rate is None and self.interface is not None and \
+                not self.interface.connected():
+            # the connection dropped, reconnect on the next refresh
+            self.interface = None
+        return fee_rate
+
+    def get_fee_rate(self):
+        now = time.time()
+        if self.fee_rate is None or now - self.updated > self.max_age:
+            fee_rate = self.estimate_fee()
+            self.fee_rate = fee_rate if fee_rate else self.fallback
+            self.updated = now
+        return self.fee_rate
+
+
+def make_fee_rate_source(config):
+    """Make the fee rate source <config> asks for, see above.
+    """
+    params = config.get('fee_rate', DEFAULT_FEE_RATE)
+    if not isinstance(params, dict):
+        return FixedFeeRate(int(params))
+    source = params.get('source', 'fixed')
+    fallback = int(params.get('fee_rate', DEFAULT_FEE_RATE))
+    if source == 'fixed':
+        return FixedFeeRate(fallback)
+    if source == 'electrum':
+        def make_interface():
+            return ElectrumInterface(params['host'],
+                                     params.get('port', 50001))
+        return ElectrumFeeRate(make_interface, params.get('blocks', 6),
+                               fallback)
+    raise Exception('Unknown fee rate source %s!' % source)
@@ -2,14 +2,13 @@ from collections import defaultdict
 
 from coloredcoinlib import (ColorSet, ColorTarget, UNCOLORED_MARKER,
                             InvalidColorIdError, ZeroSelectError,
-                            SimpleColorValue, CTransaction)
+                            SimpleColorValue)
 from protocol_objects import ETxSpec
 from ngcccbase.asset import AdditiveAssetValue
 from ngcccbase.txcons import (BaseOperationalTxSpec,
                               SimpleOperationalTxSpec, InsufficientFundsError)
 from ngcccbase.coindb import UTXO
 
-import bitcoin.core
 from bitcoin.wallet import CBitcoinAddress
 
 
@@ -147,10 +146,7 @@ class EWalletController(object):
 
     def check_tx(self, raw_tx, etx_spec):
         """check if raw tx satisfies spec's targets"""
-        bctx = bitcoin.core.CTransaction.deserialize(raw_tx.get_tx_data())
-        ctx = CTransaction.from_bitcoincore(raw_tx.get_hex_txhash(),
-                                            bctx,
-                                            self.model.ccc.blockchain_state)
+        ctx = raw_tx.get_ctransaction()
         color_id_set = set([])
         targets = []
         for target in etx_spec.targets:
@@ -211,7 +207,7 @@ class EWalletController(object):
             composed_tx_spec = op_tx_spec.make_composed_tx_spec()
             selection, total = op_tx_spec.select_coins(colorvalue, composed_tx_spec)
             change = total - colorvalue - \
-                composed_tx_spec.estimate_required_fee(extra_txins=len(selection))
+                composed_tx_spec.estimate_required_fee(extra_txins=selection)
             if change < op_tx_spec.get_dust_threshold():
                 change = SimpleColorValue(colordef=UNCOLORED_MARKER,
                                           value=0)
@@ -8,6 +8,7 @@ from ngcccbase.p2ptrade.ewctrl import EWalletController
 from ngcccbase.p2ptrade.protocol_objects import MyEOffer, EOffer
 from ngcccbase.p2ptrade.agent import EAgent
 from ngcccbase.p2ptrade.comm import CommBase
+from ngcccbase.coinselection import make_coin_selector
 
 
 class MockAddressRecord(object):
@@ -30,6 +31,8 @@ class MockUTXO(object):
                                              value=300000)] 
     def get_outpoint(self):
         return ('outp1', 1)
+    def estimate_size(self):
+        return 180
 
 class MockCoinQuery(object):
 
@@ -39,6 +42,10 @@ class MockCoinQuery(object):
     def get_result(self):
         return [MockUTXO()]
 
+class MockCoinManager(object):
+    def get_spendable_coins(self, color_id):
+        return [MockUTXO()]
+
 class MockColorMap(object):
     def find_color_desc(self, color_id):
         if color_id == 1:
@@ -68,6 +75,13 @@ class MockModel(object):
         return MockCoinQuery(params)
     def get_address_manager(self):
         return MockWAM()
+    def get_coin_manager(self):
+        return MockCoinManager()
+    def get_coin_selector(self):
+        return make_coin_selector()
+
+    def get_fee_rate(self):
+        return 11000
 
 class MockComm(CommBase):
     def __init__(self):
@@ -6,7 +6,9 @@ Construct and sign transactions using pycoin library
 
 from pycoin.tx.tx_utils import sign_tx as pycoin_sign_tx
 from pycoin.encoding import bitcoin_address_to_hash160_sec,\
-    wif_to_tuple_of_secret_exponent_compressed
+    wif_to_tuple_of_secret_exponent_compressed, public_pair_to_sec,\
+    double_sha256, from_bytes_32
+from pycoin.serialize.bitcoin_streamer import stream_struct
 from pycoin.serialize import b2h, b2h_rev
 
 from pycoin.tx.Tx import Tx, SIGHASH_ALL
@@ -16,24 +18,64 @@ from pycoin.tx.TxOut import TxOut
 from pycoin.tx.script import tools
 from pycoin.tx.script.vm import verify_script
 
+from collections import OrderedDict
 from io import BytesIO
+import multiprocessing
+import threading
 from pycoin.tx.pay_to import build_hash160_lookup
 
 
 from coloredcoinlib import txspec
-from coloredcoinlib.blockchain import script_to_raw_address
+import signing
+from coloredcoinlib.blockchain import script_to_raw_address, CTransaction
 
 
-def construct_standard_tx(composed_tx_spec, is_test):
-    txouts = []
+class LRUCache(object):
+    """Keeps the <size> most recently used items.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.pop(key, None)
+            if value is not None:
+                self.items[key] = value
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.items.pop(key, None)
+            self.items[key] = value
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+# OP_DUP OP_HASH160 <hash160> OP_EQUALVERIFY OP_CHECKSIG
+P2PKH_SCRIPT_PREFIX = '\x76\xa9\x14'
+P2PKH_SCRIPT_SUFFIX = '\x88\xac'
+
+p2pkh_scripts = LRUCache(10000)
+
+def p2pkh_script(hash160):
+    return P2PKH_SCRIPT_PREFIX + hash160 + P2PKH_SCRIPT_SUFFIX
+
+def address_to_script(address, is_test):
+    """Binary P2PKH script paying to <address>.
+    """
     prefix = is_test and b'\x6f' or b"\0"
-    STANDARD_SCRIPT_OUT = "OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG"
-    for txout in composed_tx_spec.get_txouts():
-        hash160 = bitcoin_address_to_hash160_sec(txout.target_addr, 
-                                                 address_prefix=prefix)
-        script_text = STANDARD_SCRIPT_OUT % b2h(hash160)
-        script_bin = tools.compile(script_text)
-        txouts.append(TxOut(txout.value, script_bin))
+    script = p2pkh_scripts.get((address, prefix))
+    if script is None:
+        script = p2pkh_script(bitcoin_address_to_hash160_sec(
+            address, address_prefix=prefix))
+        p2pkh_scripts.put((address, prefix), script)
+    return script
+
+def construct_standard_tx(composed_tx_spec, is_test):
+    txouts = [TxOut(txout.value, address_to_script(txout.target_addr, is_test))
+              for txout in composed_tx_spec.get_txouts()]
     txins = []
     for cts_txin in composed_tx_spec.get_txins():
         txin = TxIn(cts_txin.get_txhash(), cts_txin.prevout.n)
@@ -44,27 +86,205 @@ def construct_standard_tx(composed_tx_spec, is_test):
     lock_time = 0
     return Tx(version, txins, txouts, lock_time)
 
-def sign_tx(tx, utxo_list, is_test):
-    secret_exponents = [utxo.address_rec.rawPrivKey
-                        for utxo in utxo_list if utxo.address_rec]
-    hash160_lookup = build_hash160_lookup(secret_exponents)
-    txins = tx.txs_in[:]
-    for txin_idx in xrange(len(txins)):
-        blank_txin = txins[txin_idx]
-        utxo = None
-        for utxo_candidate in utxo_list:
-            if utxo_candidate.get_txhash() == blank_txin.previous_hash \
-                    and utxo_candidate.outindex == blank_txin.previous_index:
-                utxo = utxo_candidate
-                break
-        if not (utxo and utxo.address_rec):
+def p2pkh_hash160(script):
+    """Returns hash160 of pay-to-pubkey-hash <script>, None for
+    other scripts.
+    """
+    if (len(script) == 25 and script[:3] == P2PKH_SCRIPT_PREFIX and
+            script[23:] == P2PKH_SCRIPT_SUFFIX):
+        return script[3:23]
+    return None
+
+def make_hash160_lookup(utxo_list):
+    """Signing keys of <utxo_list> in the form pycoin wants them,
+    using public keys of address records.
+    """
+    return dict((utxo.address_rec.rawPubkey(),
+                 (utxo.address_rec.rawPrivKey,
+                  utxo.address_rec.get_public_pair(),
+                  utxo.address_rec.compressed))
+                for utxo in utxo_list if utxo.address_rec)
+
+class SignatureHasher(object):
+    """Computes SIGHASH_ALL signature hashes of inputs of <tx> like
+    Tx.signature_hash does, but serializes the unchanged parts of
+    the transaction only once.
+    """
+    def __init__(self, tx):
+        self.tx = tx
+        f = BytesIO()
+        stream_struct("LI", f, tx.version, len(tx.txs_in))
+        self.head = f.getvalue()
+        self.blank_txins = [self.serialize_txin(txin, b'')
+                            for txin in tx.txs_in]
+        f = BytesIO()
+        stream_struct("I", f, len(tx.txs_out))
+        for txout in tx.txs_out:
+            txout.stream(f)
+        stream_struct("LL", f, tx.lock_time, SIGHASH_ALL)
+        self.tail = f.getvalue()
+
+    def serialize_txin(self, txin, script):
+        f = BytesIO()
+        stream_struct("#LSL", f, txin.previous_hash, txin.previous_index,
+                      script, txin.sequence)
+        return f.getvalue()
+
+    def signature_hash(self, txout_script, txin_idx):
+        """<txout_script> must not contain OP_CODESEPARATOR.
+        """
+        txins = self.blank_txins[:]
+        txins[txin_idx] = self.serialize_txin(self.tx.txs_in[txin_idx],
+                                              txout_script)
+        return from_bytes_32(double_sha256(
+            self.head + b''.join(txins) + self.tail))
+
+def find_p2pkh_inputs(tx, utxo_list, hash160_lookup):
+    """Split unsigned inputs of <tx> which spend coins in <utxo_list>
+    into P2PKH inputs we have keys for, as a list of
+    (txin_idx, txout_script, key), and other inputs as a list of
+    (txin_idx, txout_script).
+    """
+    utxos = dict(((utxo.get_txhash(), utxo.outindex), utxo)
+                 for utxo in utxo_list)
+    p2pkh_inputs, other_inputs = [], []
+    for txin_idx, txin in enumerate(tx.txs_in):
+        utxo = utxos.get((txin.previous_hash, txin.previous_index))
+        if not (utxo and utxo.address_rec) or txin.script:
             continue
         txout_script = utxo.script.decode('hex')
-        tx.sign_tx_in(hash160_lookup, txin_idx, txout_script, SIGHASH_ALL)
+        key = hash160_lookup.get(p2pkh_hash160(txout_script))
+        if key:
+            p2pkh_inputs.append((txin_idx, txout_script, key))
+        else:
+            other_inputs.append((txin_idx, txout_script))
+    return p2pkh_inputs, other_inputs
+
+def sign_p2pkh_inputs(tx, inputs):
+    """Returns (txin_idx, script) with signature scripts for
+    (txin_idx, txout_script, key) <inputs> of <tx>.
+    Uses the fastest ECDSA backend available.
+    """
+    hasher = SignatureHasher(tx)
+    scripts = []
+    for txin_idx, txout_script, key in inputs:
+        secret_exponent, public_pair, compressed = key
+        sign_value = hasher.signature_hash(txout_script, txin_idx)
+        signature = signing.sign(secret_exponent, sign_value)
+        scripts.append((txin_idx, tools.bin_script([
+            signature + chr(SIGHASH_ALL),
+            public_pair_to_sec(public_pair, compressed=compressed)])))
+    return scripts
+
+def sign_p2pkh_inputs_job(job):
+    """sign_p2pkh_inputs for a worker process, <job> is
+    (serialized tx, inputs).
+    """
+    tx_data, inputs = job
+    return sign_p2pkh_inputs(deserialize(tx_data), inputs)
+
+def sign_tx(tx, utxo_list, is_test, hash160_lookup=None):
+    """Sign inputs of <tx> which spend coins in <utxo_list>, inputs
+    which already have a script are left alone.
+    <hash160_lookup> maps hash160 to signing keys, see
+    DWalletAddressManager.get_hash160_lookup.
+    """
+    sign_txs([(tx, utxo_list)], hash160_lookup)
+
+def sign_txs(items, hash160_lookup=None, processes=1, pool=None):
+    """Sign each (tx, utxo_list) of <items> like sign_tx. With more
+    than one of <processes>, P2PKH inputs are signed in a pool of
+    worker processes, in chunks of several inputs of the same tx.
+    The caller can give its multiprocessing <pool> of <processes>
+    workers to use instead of starting one.
+    """
+    jobs, others = [], []
+    for tx, utxo_list in items:
+        lookup = hash160_lookup
+        if lookup is None:
+            lookup = make_hash160_lookup(utxo_list)
+        p2pkh_inputs, other_inputs = find_p2pkh_inputs(
+            tx, utxo_list, lookup)
+        chunk_size = max(1, -(-len(p2pkh_inputs) // processes))
+        for i in xrange(0, len(p2pkh_inputs), chunk_size):
+            jobs.append((tx, p2pkh_inputs[i:i + chunk_size]))
+        others.append((tx, other_inputs, lookup))
+
+    if processes > 1 and len(jobs) > 1:
+        own_pool = pool is None
+        if own_pool:
+            pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(sign_p2pkh_inputs_job,
+                               [(serialize(tx), inputs)
+                                for tx, inputs in jobs])
+        finally:
+            if own_pool:
+                pool.terminate()
+    else:
+        results = [sign_p2pkh_inputs(tx, inputs) for tx, inputs in jobs]
+    for (tx, inputs), scripts in zip(jobs, results):
+        for txin_idx, script in scripts:
+            tx.txs_in[txin_idx].script = script
+
+    for tx, other_inputs, lookup in others:
+        for txin_idx, txout_script in other_inputs:
+            tx.sign_tx_in(lookup, txin_idx, txout_script, SIGHASH_ALL)
+
+def raw_to_address(model, raw_address):
+    """Bitcoin address for hash160 <raw_address>, wallet addresses
+    are looked up instead of being encoded again.
+    """
+    address_rec = model.get_address_manager().\
+        find_address_record_by_hash160(raw_address)
+    if address_rec:
+        return address_rec.get_address()
+    return model.ccc.raw_to_address(raw_address)
+
+def serialize(tx):
+    f = BytesIO()
+    tx.stream(f)
+    return f.getvalue()
 
 def deserialize(tx_data):
     return Tx.parse(BytesIO(tx_data))
 
+class ParsedTx(object):
+    """A transaction which is parsed once. Its serialized form and
+    hash are computed on first use and kept until it is changed.
+    """
+    def __init__(self, pycoin_tx, tx_data=None):
+        self.pycoin_tx = pycoin_tx
+        self.tx_data = tx_data
+        self.hex_txhash = None
+
+    @classmethod
+    def from_tx_data(cls, tx_data):
+        return cls(deserialize(tx_data), tx_data)
+
+    def changed(self):
+        """Call after modifying pycoin_tx, e.g. signing it.
+        """
+        self.tx_data = None
+        self.hex_txhash = None
+
+    def get_tx_data(self):
+        if self.tx_data is None:
+            self.tx_data = serialize(self.pycoin_tx)
+        return self.tx_data
+
+    def get_hex_txhash(self):
+        if self.hex_txhash is None:
+            self.hex_txhash = double_sha256(
+                self.get_tx_data())[::-1].encode('hex')
+        return self.hex_txhash
+
+    def get_ctransaction(self, blockchain_state):
+        """coloredcoinlib view of the transaction.
+        """
+        return CTransaction.from_pycoin(self.get_hex_txhash(),
+                                        self.pycoin_tx, blockchain_state)
+
 def reconstruct_composed_tx_spec(model, tx):
     if isinstance(tx, str):
         tx = deserialize(tx)
@@ -91,7 +311,7 @@ def reconstruct_composed_tx_spec(model, tx):
         script = py_txout.script
         raw_address = script_to_raw_address(script)
         if raw_address:
-            address = model.ccc.raw_to_address(raw_address)
+            address = raw_to_address(model, raw_address)
         else:
             address = None
         composed_tx_spec.add_txout(
@@ -10,6 +10,14 @@ for an address that haven't been spent yet.
 import urllib2
 import json
 
+from pycoin.encoding import a2b_hashed_base58
+
+
+def address_to_script(address):
+    """hex scriptPubKey paying to bitcoin address <address>"""
+    hash160 = a2b_hashed_base58(address)[1:]
+    return "76a914%s88ac" % hash160.encode('hex')
+
 
 class WebBlockchainInterface(object):
     """Abstract class for processing actual utxo's from a given web
@@ -17,6 +25,10 @@ class WebBlockchainInterface(object):
     """
     URL_TEMPLATE = None
     REVERSE_TXHASH = False
+    # limit for parallel requests, public services throttle clients
+    MAX_CONCURRENT_REQUESTS = 4
+    # number of addresses in a single get_utxo_many request
+    UTXO_BATCH_SIZE = 50
 
     def get_utxo(self, address):
         """Returns Unspent Transaction Outputs for a given address
@@ -24,22 +36,35 @@ class WebBlockchainInterface(object):
         four elements that are necessary to initialize a UTXO object
         from utxodb.py
         """
-        url = self.URL_TEMPLATE % address
+        return self.get_utxo_many([address])[address]
+
+    def get_utxo_many(self, addresses):
+        """Returns a dict mapping each of <addresses> to its
+        Unspent Transaction Outputs (see get_utxo), using one request.
+        """
+        result = {address: [] for address in addresses}
+        scripts = {address_to_script(address): address
+                   for address in addresses}
+        url = self.URL_TEMPLATE % "|".join(addresses)
         try:
             jsonData = urllib2.urlopen(url).read()
             data = json.loads(jsonData)
-            utxos = []
             for utxo_data in data['unspent_outputs']:
                 txhash = utxo_data['tx_hash']
                 if self.REVERSE_TXHASH:
                     txhash = txhash.decode('hex')[::-1].encode('hex')
                 utxo = [txhash, utxo_data['tx_output_n'],
                         utxo_data['value'], utxo_data['script']]
-                utxos.append(utxo)
-            return utxos
+                address = scripts.get(utxo_data['script'])
+                if address is None and len(addresses) == 1:
+                    # e.g. a non-standard script
+                    address = addresses[0]
+                if address:
+                    result[address].append(utxo)
+            return result
         except urllib2.HTTPError as e:
             if e.code == 500:         
-                return []             
+                return result
             raise                       # pragma: no cover
 
     def get_address_history(self, address):
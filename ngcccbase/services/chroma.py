@@ -73,6 +73,19 @@ class ChromaBlockchainState(BlockchainStateBase):
         data = urllib2.urlopen(url).read()
         return int(data)
 
+    def wait_for_block_count(self, known_count, timeout):
+        """Long-poll the server until its block count differs from
+        <known_count> or <timeout> seconds pass, return the block count.
+        """
+        url = "%s/blockcount_wait" % self.url_stem
+        data = {'known_count': known_count, 'timeout': timeout}
+        req = urllib2.Request(url, json.dumps(data),
+                              {'Content-Type': 'application/json'})
+        f = urllib2.urlopen(req, timeout=timeout + 30)
+        data = f.read()
+        f.close()
+        return int(data)
+
     def connected(self):
         try:
           return bool(self.get_block_count())
@@ -119,6 +132,19 @@ class ChromaBlockchainState(BlockchainStateBase):
             data, {'Content-Type': 'application/json'}))
         return json.loads(req.read())
 
+    def get_merkle_batch(self, txhashes):
+        """Returns a dict mapping each of <txhashes> to its blockhash,
+        in_mempool flag and, if it is in a block, the merkle data
+        get_merkle would return.
+        """
+        url = "%s/merkle_batch" % self.url_stem
+        data = json.dumps({
+            'txhashes': list(txhashes),
+        })
+        req = urllib2.urlopen(urllib2.Request(url,
+            data, {'Content-Type': 'application/json'}))
+        return json.loads(req.read())
+
     def get_raw(self, txhash):
         if self.tx_lookup.get(txhash):
             return self.tx_lookup[txhash]
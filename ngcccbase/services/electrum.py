@@ -16,10 +16,13 @@ from bitcoin.core import x as to_binary
 from bitcoin.core import b2lx as to_little_endian_hex
 from bitcoin.core import b2x as to_hex
 from coloredcoinlib import blockchain
+from ngcccbase.pycoin_txcons import LRUCache
 
 import json
+import Queue
 import socket
 import sys
+import threading
 import time
 import traceback
 import urllib2
@@ -30,15 +33,85 @@ class ConnectionError(Exception):
     pass
 
 
+class ServerError(Exception):
+    """The server answered a request with <error>."""
+    def __init__(self, message, error):
+        super(ServerError, self).__init__(message)
+        self.error = error
+
+    def is_unknown_method(self):
+        """True if the server doesn't know the method of the request,
+        as opposed to failing to carry it out.
+        """
+        if isinstance(self.error, dict):
+            return self.error.get('code') == -32601
+        error = str(self.error).lower()
+        return 'unknown method' in error or 'method not found' in error
+
+
+class PendingResponse(object):
+    """Response to a request which is in flight. The reader thread
+    sets it when the server answers.
+    """
+    def __init__(self, id):
+        self.id = id
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def set_result(self, result):
+        self.result = result
+        self.event.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.event.set()
+
+    def done(self):
+        return self.event.is_set()
+
+    def wait(self, timeout=None):
+        """Return the result, raise an exception if the server
+        answered with an error or there was no answer in <timeout>
+        seconds.
+        """
+        if not self.event.wait(timeout):
+            raise ConnectionError("No response to request %s!" % self.id)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
 class ElectrumInterface(object):
     """Interface for interacting with Electrum servers using the
-    stratum tcp protocol
+    stratum tcp protocol.
+    Requests are pipelined on a single socket: a reader thread matches
+    responses to requests by id, so any number of requests can be in
+    flight and the interface can be used from several threads.
     """
+    MAX_CONCURRENT_REQUESTS = 8
+    UTXO_BATCH_SIZE = 20
+    RECV_BUFFER_SIZE = 65536
+    RESPONSE_TIMEOUT = 120
+    RAW_TX_CACHE_SIZE = 10000
 
     def __init__(self, host, port, debug=False):
         """Make an interface object for connecting to electrum server
         """
         self.message_counter = 0
+        self.notifications = Queue.Queue()
+        # raw transactions by hash, they never change
+        self.raw_tx_cache = LRUCache(self.RAW_TX_CACHE_SIZE)
+        # address -> (history, {txhash: (spent outpoints, outputs)}, utxos)
+        self.utxo_sets = {}
+        # None until we know whether the server has listunspent
+        self.supports_listunspent = None
+        # chunks of the incomplete message at the end of received data
+        self.buffer = []
+        # id -> PendingResponse
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
         self.connection = (host, port)
         self.debug = debug
         self.is_connected = False
@@ -48,8 +121,8 @@ class ElectrumInterface(object):
         return self.is_connected
 
     def connect(self):
-        """Connects to an electrum server via TCP.
-        Uses a socket so we can listen for a response
+        """Connects to an electrum server via TCP and starts the thread
+        which reads responses from the socket.
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(1)
@@ -62,72 +135,176 @@ class ElectrumInterface(object):
             raise ConnectionError(msg % self.connection)
 
         sock.settimeout(60)
-        self.sock = sock
-        self.is_connected = True
+        self.start_reader(sock)
         if self.debug:
             print ("Connected to %s:%s!" % self.connection ) # pragma: no cover
         return True
 
-    def wait_for_response(self, target_id):
-        """Get a response message from an electrum server with
-        the id of <target_id>
+    def start_reader(self, sock):
+        """Use the connected socket <sock> for requests.
+        """
+        self.sock = sock
+        self.buffer = []
+        self.is_connected = True
+        thread = threading.Thread(target=self.reader_loop, args=(sock,))
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.is_connected = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+    def reader_loop(self, sock):
+        """Read from <sock> until the connection is closed and hand
+        out the messages. Requests still waiting for a response fail
+        when it is closed.
         """
         try:
-            out = ''
-            while self.is_connected or self.connect():
+            while True:
                 try:
-                    msg = self.sock.recv(1024)
-                    if self.debug:
-                        print (msg)  # pragma: no cover
-                except socket.timeout:         # pragma: no cover
-                    self.is_connected = False  # pragma: no cover
-                    continue                   # pragma: no cover
-                except socket.error:                      # pragma: no cover
-                    traceback.print_exc(file=sys.stdout)  # pragma: no cover
-                    raise                                 # pragma: no cover
-
-                out += msg
-                if msg == '':
-                    self.is_connected = False  # pragma: no cover
-
-                # get the list of messages by splitting on newline
-                raw_messages = out.split("\n")
-
-                # the last one isn't complete
-                out = raw_messages.pop()
-                for raw_message in raw_messages:
-                    message = json.loads(raw_message)
-
-                    id = message.get('id')
-                    error = message.get('error')
-                    result = message.get('result')
-
-                    if id == target_id:
-                        if error:
-                            raise Exception("Received error '%s'!" % message)
-                        else:
-                            return result
+                    data = sock.recv(self.RECV_BUFFER_SIZE)
+                except socket.timeout:
+                    continue
+                if data == '':
+                    break
+                if self.debug:
+                    print (data)  # pragma: no cover
+                for message in self._parse_messages(data):
+                    self.dispatch(message)
+        except:
+            if self.is_connected:
+                traceback.print_exc(file=sys.stdout)
+        with self.lock:
+            if self.sock is not sock:
+                return
+            self.is_connected = False
+            pending, self.pending = self.pending, {}
+        for response in pending.values():
+            response.set_error(ConnectionError(
+                "Connection to %s:%s closed!" % self.connection))
+
+    def _parse_messages(self, data):
+        """Add received <data> to the buffer and return the complete
+        messages. Only the new data is scanned for line breaks.
+        """
+        messages = []
+        start = 0
+        while True:
+            end = data.find("\n", start)
+            if end < 0:
+                if start < len(data):
+                    self.buffer.append(data[start:])
+                break
+            self.buffer.append(data[start:end])
+            raw_message = ''.join(self.buffer)
+            self.buffer = []
+            start = end + 1
+            if raw_message.strip():
+                messages.append(json.loads(raw_message))
+        return messages
+
+    def dispatch(self, message):
+        """Queue notifications, give responses to whoever waits for them.
+        """
+        id = message.get('id')
+        if id is None and 'method' in message:
+            self.notifications.put(message)
+            return
+        with self.lock:
+            response = self.pending.pop(id, None)
+        if response is None:
+            return
+        if message.get('error'):
+            response.set_error(ServerError("Received error '%s'!" % message,
+                                           message['error']))
+        else:
+            response.set_result(message.get('result'))
+
+    def wait_for_notification(self, timeout):
+        """Get the next message the server pushed on its own (e.g. for
+        a *.subscribe method), or None if none came in <timeout> seconds.
+        """
+        try:
+            return self.notifications.get(timeout=timeout)
+        except Queue.Empty:
+            if not self.is_connected:
+                raise ConnectionError(
+                    "Connection to %s:%s closed!" % self.connection)
+            return None
+
+    def send_request(self, method, params):
+        """Send a request without waiting for the response,
+        returns a PendingResponse.
+        """
+        with self.lock:
+            if not self.is_connected:
+                self.connect()
+            current_id = self.message_counter
+            self.message_counter += 1
+            response = PendingResponse(current_id)
+            self.pending[current_id] = response
+            sock = self.sock
+        try:
+            with self.send_lock:
+                sock.sendall(
+                    json.dumps({
+                        'id': current_id,
+                        'method': method,
+                        'params': params})
+                    + "\n")
+        except socket.error as e:
+            with self.lock:
+                self.pending.pop(current_id, None)
+            response.set_error(e)
+        return response
+
+    def wait_for_response(self, response):
+        """Result of the request <response> is for, or None if it failed.
+        An error of the server stays in response.error.
+        """
+        try:
+            return response.wait(self.RESPONSE_TIMEOUT)
         except:
             traceback.print_exc(file=sys.stdout)
-        self.is_connected = False
+            with self.lock:
+                self.pending.pop(response.id, None)
+            return None
 
     def get_response(self, method, params):
         """Given a message that consists of <method> which
         has <params>,
         Return the string response of the message sent to electrum"""
-        current_id = self.message_counter
-        self.message_counter += 1
         try:
-            self.sock.send(
-                json.dumps({
-                    'id': current_id,
-                    'method': method,
-                    'params': params})
-                + "\n")
-        except socket.error:                       # pragma: no cover
-            traceback.print_exc(file=sys.stdout)   # pragma: no cover
-            return None                            # pragma: no cover
-        return self.wait_for_response(current_id)
+            response = self.send_request(method, params)
+        except ConnectionError:
+            traceback.print_exc(file=sys.stdout)
+            return None
+        return self.wait_for_response(response)
+
+    def send_requests(self, requests):
+        """Send all (method, params) <requests> before waiting for
+        any response, returns their PendingResponses, or None if
+        we can't connect.
+        """
+        try:
+            return [self.send_request(method, params)
+                    for method, params in requests]
+        except ConnectionError:
+            traceback.print_exc(file=sys.stdout)
+            return None
+
+    def get_responses(self, requests):
+        """Send all (method, params) <requests> before waiting for
+        any response, returns the results in the same order.
+        """
+        responses = self.send_requests(requests)
+        if responses is None:
+            return [None] * len(requests)
+        return [self.wait_for_response(response) for response in responses]
 
     def get_version(self):
         """Get the server version of the electrum server
@@ -151,26 +328,141 @@ class ElectrumInterface(object):
         Note you may need to use another method to get the height
         from the transaction id hash.
         """
-        return self.get_response('blockchain.transaction.get', [tx_id, height])
+        return self.get_raw_transactions([(tx_id, height)])[tx_id]
+
+    def get_raw_transactions(self, txs):
+        """Get raw transactions for a list of (tx_id, height) <txs>,
+        those which aren't cached are requested together.
+        Returns a dict, with None for transactions we couldn't get.
+        """
+        raws = {}
+        missing = []
+        for tx_id, height in txs:
+            raws[tx_id] = self.raw_tx_cache.get(tx_id)
+            if raws[tx_id] is None:
+                missing.append((tx_id, height))
+        results = self.get_responses(
+            [('blockchain.transaction.get', [tx_id, height])
+             for tx_id, height in missing])
+        for (tx_id, height), raw in zip(missing, results):
+            raws[tx_id] = raw
+            if raw is not None:
+                self.raw_tx_cache.put(tx_id, raw)
+        return raws
+
+    def estimate_fee(self, blocks):
+        """Fee rate in Satoshi per 1000 bytes the server expects to get
+        a transaction confirmed within <blocks> blocks, None if it
+        doesn't know.
+        """
+        fee = self.get_response('blockchain.estimatefee', [blocks])
+        if fee is None or fee < 0:
+            return None
+        return int(round(fee * 100000000))
+
+    def get_address_status(self, address):
+        """Returns a hash of the history of <address>, which changes
+        whenever it gets a new transaction (None if it has none).
+        The server will also notify us about such changes.
+        """
+        return self.get_response('blockchain.address.subscribe', [address])
+
+    def get_address_statuses(self, addresses):
+        """get_address_status of each of <addresses> as a dict, the
+        requests for all of them are sent before waiting for responses.
+        """
+        return dict(zip(addresses, self.get_responses(
+            [('blockchain.address.subscribe', [address])
+             for address in addresses])))
+
+    def get_address_history(self, address):
+        """Returns hashes of transactions which involve <address>
+        """
+        txs = self.get_response('blockchain.address.get_history', [address])
+        if txs is None:
+            raise ConnectionError(
+                "Couldn't get history of %s from %s:%s!" %
+                ((address,) + self.connection))
+        return [tx['tx_hash'] for tx in txs]
 
     def get_utxo(self, address):
         """Gets all the Unspent Transaction Outs from a given <address>
         """
+        return self.get_utxo_many([address])[address]
+
+    def get_utxo_many(self, addresses):
+        """Unspent outputs of each of <addresses>, the requests for
+        all of them are sent before waiting for responses.
+        Servers which don't know listunspent aren't asked again,
+        if some requests merely fail histories are used this time.
+        """
+        if self.supports_listunspent is not False:
+            responses = self.send_requests(
+                [('blockchain.address.listunspent', [address])
+                 for address in addresses]) or []
+            results = [self.wait_for_response(response)
+                       for response in responses]
+            if responses and None not in results:
+                self.supports_listunspent = True
+                return dict(
+                    (address, self.listunspent_to_utxos(address, unspent))
+                    for address, unspent in zip(addresses, results))
+            if any(isinstance(response.error, ServerError) and
+                   response.error.is_unknown_method()
+                   for response in responses):
+                self.supports_listunspent = False
+        histories = self.get_responses(
+            [('blockchain.address.get_history', [address])
+             for address in addresses])
+        return dict((address, self.get_utxo_from_history(address, txs))
+                    for address, txs in zip(addresses, histories))
+
+    def listunspent_to_utxos(self, address, unspent):
+        script = to_hex(CBitcoinAddress(address).to_scriptPubKey())
+        return [(utxo['tx_hash'], utxo['tx_pos'], utxo['value'], script)
+                for utxo in unspent]
+
+    def get_utxo_from_history(self, address, txs):
+        """Work out unspent outputs of <address> from its history <txs>.
+        Only transactions which weren't seen before for this address
+        are downloaded and deserialized.
+        """
+        if txs is None:
+            raise ConnectionError(
+                "Couldn't get history of %s from %s:%s!" %
+                ((address,) + self.connection))
+        history = tuple(tx['tx_hash'] for tx in txs)
+        old_history, tx_data, utxos = self.utxo_sets.get(
+            address, ((), {}, []))
+        if history == old_history:
+            return utxos
+
         script_pubkey = CBitcoinAddress(address).to_scriptPubKey()
-        txs = self.get_response('blockchain.address.get_history', [address])
-        spent = {}
-        utxos = []
-        for tx in txs:
-            raw = self.get_raw_transaction(tx['tx_hash'], tx['height'])
-            data = CTransaction.deserialize(to_binary(raw))
-            for vin in data.vin:
-                spent[(to_little_endian_hex(vin.prevout.hash),
-                       vin.prevout.n)] = 1
-            for outindex, vout in enumerate(data.vout):
-                if vout.scriptPubKey == script_pubkey:
-                    utxos += [(tx['tx_hash'], outindex, vout.nValue,
-                               to_hex(vout.scriptPubKey))]
-        return [u for u in utxos if not u[0:2] in spent]
+        tx_data = dict((txhash, tx_data[txhash])
+                       for txhash in history if txhash in tx_data)
+        new_txs = [(tx['tx_hash'], tx['height']) for tx in txs
+                   if tx['tx_hash'] not in tx_data]
+        raw_txs = self.get_raw_transactions(new_txs)
+        for txhash, height in new_txs:
+            if raw_txs[txhash] is None:
+                raise ConnectionError(
+                    "Couldn't get transaction %s from %s:%s!" %
+                    ((txhash,) + self.connection))
+            data = CTransaction.deserialize(to_binary(raw_txs[txhash]))
+            spent = [(to_little_endian_hex(vin.prevout.hash), vin.prevout.n)
+                     for vin in data.vin]
+            outputs = [(txhash, outindex, vout.nValue,
+                        to_hex(vout.scriptPubKey))
+                       for outindex, vout in enumerate(data.vout)
+                       if vout.scriptPubKey == script_pubkey]
+            tx_data[txhash] = (spent, outputs)
+
+        spent = set(outpoint for txhash in history
+                    for outpoint in tx_data[txhash][0])
+        utxos = [u for txhash in history for u in tx_data[txhash][1]
+                 if not u[0:2] in spent]
+        self.utxo_sets[address] = (history, tx_data, utxos)
+        return utxos
 
     def get_chunk(self, index):
         return self.get_response('blockchain.block.get_chunk', [index])
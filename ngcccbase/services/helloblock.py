@@ -3,6 +3,9 @@ import json
 
 
 class HelloBlockInterface(object):
+    MAX_CONCURRENT_REQUESTS = 8
+    UTXO_BATCH_SIZE = 20
+
     def __init__(self, testnet):
         self.net_prefix = "testnet" if testnet else "mainnet"
 
@@ -25,22 +28,30 @@ class HelloBlockInterface(object):
         return 0
 
     def get_utxo(self, address):
-        url = "https://%s.helloblock.io/v1/addresses/unspents?addresses=%s" % \
-            (self.net_prefix, address)
+        return self.get_utxo_many([address])[address]
+
+    def get_utxo_many(self, addresses):
+        """Returns a dict mapping each of <addresses> to its unspent
+        outputs, using a single request.
+        """
+        url = "https://%s.helloblock.io/v1/addresses/unspents?%s" % \
+            (self.net_prefix,
+             "&".join("addresses=%s" % address for address in addresses))
+        result = {address: [] for address in addresses}
         try:
             resp = json.loads(urllib2.urlopen(url).read())
             if resp['status'] == 'success':
                 unspents = resp['data']['unspents']
-                utxos = []
                 for utxo_data in unspents:
-                    utxos.append([utxo_data['txHash'],
-                                  utxo_data['index'],
-                                  utxo_data['value'],
-                                  utxo_data['scriptPubKey']])
-                return utxos
+                    address = utxo_data['address']
+                    if address in result:
+                        result[address].append([utxo_data['txHash'],
+                                                utxo_data['index'],
+                                                utxo_data['value'],
+                                                utxo_data['scriptPubKey']])
         except:
             raise
-        return []
+        return result
 
     def get_address_history(self, address):
         url = "https://%s.helloblock.io/v1/addresses/%s/transactions?limit=10000" % \
@@ -0,0 +1,33 @@
+"""
+parallel.py
+
+Fan out requests to a blockchain service interface on a bounded
+thread pool. Each interface class limits how many requests may be in
+flight at once with MAX_CONCURRENT_REQUESTS.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+
+DEFAULT_MAX_CONCURRENT_REQUESTS = 1
+
+
+def get_max_concurrent_requests(interface):
+    return getattr(interface, 'MAX_CONCURRENT_REQUESTS',
+                   DEFAULT_MAX_CONCURRENT_REQUESTS)
+
+
+def parallel_map(interface, fn, items):
+    """Call <fn> for each of <items> using at most as many threads
+    as <interface> allows. Results are returned in the order of
+    <items>, the first exception raised by <fn> is re-raised.
+    """
+    items = list(items)
+    num_threads = min(get_max_concurrent_requests(interface), len(items))
+    if num_threads <= 1:
+        return map(fn, items)
+    pool = ThreadPool(num_threads)
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
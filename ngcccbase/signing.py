@@ -0,0 +1,122 @@
+"""
+signing.py
+
+ECDSA signatures for transaction inputs. libsecp256k1 is used through
+the coincurve or secp256k1 module when one of them is installed,
+otherwise signatures are computed in Python, multiplying the generator
+with a precomputed table in Jacobian coordinates, which is much faster
+than pycoin's affine point arithmetic.
+"""
+
+from pycoin.ecdsa import generator_secp256k1, sign as pycoin_sign
+from pycoin.ecdsa.ecdsa import deterministic_generate_k
+from pycoin.encoding import to_bytes_32
+from pycoin.tx.script import der
+
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+try:
+    import secp256k1
+except ImportError:
+    secp256k1 = None
+
+
+P = generator_secp256k1.curve().p()
+N = generator_secp256k1.order()
+
+# affine (x, y) of G * 2**i, computed on first use
+generator_powers = []
+
+
+def get_generator_powers():
+    if not generator_powers:
+        point = generator_secp256k1
+        for i in xrange(256):
+            generator_powers.append((point.x(), point.y()))
+            point = point.double()
+    return generator_powers
+
+
+def jacobian_double(X, Y, Z):
+    YY = Y * Y % P
+    S = 4 * X * YY % P
+    M = 3 * X * X % P
+    X3 = (M * M - 2 * S) % P
+    return X3, (M * (S - X3) - 8 * YY * YY) % P, 2 * Y * Z % P
+
+
+def jacobian_add_affine(X1, Y1, Z1, x2, y2):
+    """Adds affine point (x2, y2) to Jacobian point (X1, Y1, Z1),
+    Z1 == 0 is the point at infinity.
+    """
+    if Z1 == 0:
+        return x2, y2, 1
+    Z1Z1 = Z1 * Z1 % P
+    H = (x2 * Z1Z1 - X1) % P
+    r = (y2 * Z1 * Z1Z1 - Y1) % P
+    if H == 0:
+        if r == 0:
+            return jacobian_double(X1, Y1, Z1)
+        return 0, 1, 0
+    HH = H * H % P
+    HHH = H * HH % P
+    V = X1 * HH % P
+    X3 = (r * r - HHH - 2 * V) % P
+    return X3, (r * (V - X3) - Y1 * HHH) % P, Z1 * H % P
+
+
+def generator_multiple_x(k):
+    """x coordinate of G * <k>.
+    """
+    X, Y, Z = 0, 1, 0
+    for x, y in get_generator_powers():
+        if k & 1:
+            X, Y, Z = jacobian_add_affine(X, Y, Z, x, y)
+        k >>= 1
+        if not k:
+            break
+    return X * pow(Z, 2 * (P - 2), P) % P
+
+
+def sign_python(secret_exponent, sign_value):
+    """Same signature as pycoin computes (including the RFC 6979 k),
+    in the low s form.
+    """
+    k = deterministic_generate_k(N, secret_exponent, sign_value)
+    r = generator_multiple_x(k) % N
+    s = pow(k, N - 2, N) * (sign_value + secret_exponent * r) % N
+    if r == 0 or s == 0:
+        # practically impossible, let pycoin deal with it
+        return sign_pycoin(secret_exponent, sign_value)
+    if s + s > N:
+        s = N - s
+    return der.sigencode_der(r, s)
+
+
+def sign_pycoin(secret_exponent, sign_value):
+    r, s = pycoin_sign(generator_secp256k1, secret_exponent, sign_value)
+    if s + s > N:
+        s = N - s
+    return der.sigencode_der(r, s)
+
+
+def sign_coincurve(secret_exponent, sign_value):
+    key = coincurve.PrivateKey(to_bytes_32(secret_exponent))
+    return key.sign(to_bytes_32(sign_value), hasher=None)
+
+
+def sign_secp256k1(secret_exponent, sign_value):
+    key = secp256k1.PrivateKey(to_bytes_32(secret_exponent), raw=True)
+    return key.ecdsa_serialize(
+        key.ecdsa_sign(to_bytes_32(sign_value), raw=True))
+
+
+if coincurve is not None:
+    BACKEND, sign = 'coincurve', sign_coincurve
+elif secp256k1 is not None:
+    BACKEND, sign = 'secp256k1', sign_secp256k1
+else:
+    BACKEND, sign = 'python', sign_python
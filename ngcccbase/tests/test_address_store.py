@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+import sqlite3
+import unittest
+
+from coloredcoinlib import ColorSet
+from coloredcoinlib.store import DataStoreConnection
+from coloredcoinlib.tests.test_colorset import MockColorMap
+from ngcccbase.bip0032 import HDWalletAddressManager
+from ngcccbase.deterministic import AddressStore, DWalletAddressManager
+
+
+class TestAddressStore(unittest.TestCase):
+    manager_class = DWalletAddressManager
+    key_name = 'dw_master_key'
+    params_name = 'dwam'
+
+    def setUp(self):
+        self.colormap = MockColorMap()
+        d = self.colormap.d
+        self.colorset0 = ColorSet(self.colormap, [''])
+        self.colorset1 = ColorSet(self.colormap, [d[1]])
+        self.store_conn = DataStoreConnection(':memory:', True)
+        self.store_conn.conn.row_factory = sqlite3.Row
+        self.config = {
+            self.key_name: '265a1a0ad05e82fa321e3f6f6767679df0c68515797e0e4e'
+                           '24be1afc3272ee658ec53cecb683ab76a8377273347161e1',
+            self.params_name: {
+                'genesis_color_sets': [self.colorset1.get_data()],
+                'color_set_states': [
+                    {'color_set': self.colorset0.get_data(), 'max_index': 2},
+                    {'color_set': self.colorset1.get_data(), 'max_index': 1},
+                    ],
+                },
+            'testnet': False,
+            }
+
+    def make_manager(self, store_conn=None):
+        return self.manager_class(self.colormap, self.config, store_conn)
+
+    def addresses(self, manager):
+        return [(addr.get_address(), addr.rawPubkey(), addr.get_public_pair())
+                for addr in manager.get_all_addresses()]
+
+    def test_load(self):
+        derived = self.make_manager()
+        first = self.make_manager(self.store_conn)
+        self.assertEqual(self.addresses(first), self.addresses(derived))
+        self.assertEqual(len(AddressStore(self.store_conn.conn)
+                             .get_public_data(first.wallet_id)), 6)
+
+        loaded = self.make_manager(self.store_conn)
+        self.assertEqual(self.addresses(loaded), self.addresses(derived))
+        for addr in loaded.get_all_addresses():
+            self.assertTrue(addr.secret_exponent is None)
+
+        # private keys are derived when signing needs them
+        addr = loaded.get_all_addresses()[1]
+        key = loaded.get_hash160_lookup().get(addr.rawPubkey())
+        expected = derived.get_all_addresses()[1]
+        self.assertEqual(key, (expected.rawPrivKey,
+                               expected.get_public_pair(), False))
+        self.assertEqual(loaded.get_all_addresses()[0].secret_exponent, None)
+        self.assertEqual(loaded.get_hash160_lookup().get('\0' * 20), None)
+
+    def test_new_address(self):
+        first = self.make_manager(self.store_conn)
+        new = first.get_new_address(self.colorset1)
+        loaded = self.make_manager(self.store_conn)
+        self.assertTrue(loaded.has_address(new.get_address()))
+        self.assertEqual(loaded.find_address_record(new.get_address()).index,
+                         2)
+
+    def test_find_address_record(self):
+        manager = self.make_manager(self.store_conn)
+        addr = manager.get_all_addresses()[2]
+        self.assertEqual(manager.find_address_record(addr.get_address()),
+                         addr)
+        self.assertEqual(
+            manager.find_address_record_by_hash160(addr.rawPubkey()), addr)
+        self.assertTrue(manager.has_address(addr.get_address()))
+        new_addr = manager.get_new_address(self.colorset1)
+        self.assertEqual(manager.find_address_record(new_addr.get_address()),
+                         new_addr)
+        self.assertEqual(
+            manager.find_address_record_by_hash160(new_addr.rawPubkey()),
+            new_addr)
+        self.assertFalse(manager.has_address('notreal'))
+        self.assertEqual(manager.find_address_record('notreal'), None)
+        self.assertEqual(manager.find_address_record_by_hash160('\0' * 20),
+                         None)
+
+    def test_wallets_apart(self):
+        first = self.make_manager(self.store_conn)
+        self.config[self.key_name] = '00' * 64
+        other = self.make_manager(self.store_conn)
+        self.assertNotEqual(first.wallet_id, other.wallet_id)
+        self.assertNotEqual(self.addresses(first), self.addresses(other))
+
+
+class TestHDAddressStore(TestAddressStore):
+    manager_class = HDWalletAddressManager
+    key_name = 'hdw_master_key'
+    params_name = 'hdwam'
+
+    def test_branches(self):
+        manager = self.make_manager()
+        color_keys = set(addr.color_key
+                         for addr in manager.get_all_addresses())
+        self.assertEqual(set(manager.branches), color_keys)
+        addr = manager.get_new_address(self.colorset1)
+        self.assertTrue(addr.get_branch() is
+                        manager.branches[addr.color_key])
+        self.assertEqual(
+            addr.get_branch().subkey(i=addr.index).secret_exponent(),
+            addr.rawPrivKey)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+
+import multiprocessing
+import unittest
+
+from pycoin.tx.Tx import Tx
+from pycoin.tx.TxIn import TxIn
+from pycoin.tx.TxOut import TxOut
+
+from coloredcoinlib import (ColorDefinition, SimpleColorValue,
+                            UNCOLORED_MARKER)
+from coloredcoinlib.tests.test_colorset import MockColorMap
+from coloredcoinlib.txspec import ComposedTxSpec
+from ngcccbase import pycoin_txcons
+from ngcccbase.batchpayout import BatchOperationalTxSpec, BatchPayout
+from ngcccbase.coindb import UTXO
+from ngcccbase.coinselection import make_coin_selector
+from ngcccbase.txcons import compose_uncolored_tx
+from ngcccbase.wallet_controller import PartialPublishError, WalletController
+from ngcccbase.tests.test_pycoin_txcons import FakeUTXO, make_address_rec
+
+
+class FakeColorDef(ColorDefinition):
+    pass
+
+
+class OtherColorDef(ColorDefinition):
+    pass
+
+
+class FakeAsset(object):
+    def __init__(self, color_id):
+        self.color_id = color_id
+
+    def get_color_id(self):
+        return self.color_id
+
+
+class FakeCoin(ComposedTxSpec.TxIn):
+    def __init__(self, txhash, outindex, value):
+        super(FakeCoin, self).__init__(txhash, outindex)
+        self.colorvalues = [SimpleColorValue(colordef=UNCOLORED_MARKER,
+                                             value=value)]
+
+
+class FakeCoinManager(object):
+    def __init__(self, coins):
+        self.coins = coins
+
+    def get_spendable_coins(self, color_id):
+        return self.coins
+
+
+class FakeModel(object):
+    def __init__(self, coins=()):
+        self.colordefs = {0: UNCOLORED_MARKER,
+                          1: FakeColorDef(1), 2: FakeColorDef(2),
+                          3: OtherColorDef(3)}
+        self.coin_manager = FakeCoinManager(list(coins))
+
+    def get_color_def(self, color_id):
+        return self.colordefs[color_id]
+
+    def get_coin_manager(self):
+        return self.coin_manager
+
+    def get_coin_selector(self):
+        return make_coin_selector('first_fit')
+
+
+class FakeAddressManager(object):
+    def __init__(self, address_rec):
+        self.address_rec = address_rec
+
+    def get_change_address(self, color_set):
+        return self.address_rec
+
+    def find_address_record(self, address):
+        if address == self.address_rec.get_address():
+            return self.address_rec
+
+    def get_hash160_lookup(self):
+        return None
+
+
+class FakeAssetDefinitionManager(object):
+    def get_asset_by_color_id(self, color_id):
+        return None
+
+
+class ComposingModel(FakeModel):
+    """Composes uncolored transactions for real."""
+    def __init__(self, coins, address_rec):
+        super(ComposingModel, self).__init__(coins)
+        self.address_man = FakeAddressManager(address_rec)
+        self.colormap = MockColorMap()
+
+    def transform_tx_spec(self, tx_spec, target_spec_kind):
+        return compose_uncolored_tx(tx_spec)
+
+    def get_fee_rate(self):
+        return 10000
+
+    def get_address_manager(self):
+        return self.address_man
+
+    def get_asset_definition_manager(self):
+        return FakeAssetDefinitionManager()
+
+    def get_color_map(self):
+        return self.colormap
+
+    def is_testnet(self):
+        return False
+
+
+class FailingController(WalletController):
+    """Publishes <count> transactions, then fails."""
+    def __init__(self, model, count):
+        super(FailingController, self).__init__(model)
+        self.count = count
+
+    def validate_sendmany_balances(self, sums):
+        pass
+
+    def publish_tx(self, signed_tx_spec):
+        if self.count == 0:
+            raise Exception('connection lost')
+        self.count -= 1
+        return signed_tx_spec.get_hex_txhash()
+
+
+class TestBatchPayout(unittest.TestCase):
+
+    def setUp(self):
+        self.coins = [FakeCoin('%064x' % i, 0, 1000) for i in xrange(10)]
+        self.model = FakeModel(self.coins)
+
+    def entry(self, color_id, value=1):
+        return (FakeAsset(color_id), 'addr%s' % color_id, value)
+
+    def test_make_batches(self):
+        payout = BatchPayout(self.model, max_outputs=2)
+        e0, e1, e2, e3 = [self.entry(i) for i in xrange(4)]
+        self.assertEqual(payout.group_entries([e1, e3, e0, e2]),
+                         [[e0, e1, e2], [e3]])
+        self.assertEqual(payout.group_entries([e0, e0]), [[e0, e0]])
+        self.assertEqual(payout.make_batches([e1, e3, e0, e2]),
+                         [[e0, e1], [e2], [e3]])
+
+    def test_used_outpoints(self):
+        used = set([self.coins[0].get_outpoint()])
+        op_tx_spec = BatchOperationalTxSpec(self.model, used)
+        selection, total = op_tx_spec.select_coins(
+            SimpleColorValue(colordef=UNCOLORED_MARKER, value=1500))
+        self.assertEqual(selection, self.coins[1:3])
+        self.assertEqual(used, set(coin.get_outpoint()
+                                   for coin in self.coins[:3]))
+        self.assertEqual(len(op_tx_spec.get_spendable_coins(0)), 7)
+
+    def make_composing_model(self):
+        address_rec = make_address_rec(1234)
+        script = pycoin_txcons.address_to_script(address_rec.get_address(),
+                                                 False)
+        coin = UTXO({'txhash': '%064x' % 1, 'outindex': 0,
+                     'value': 1000000, 'script': script.encode('hex')})
+        coin.address_rec = address_rec
+        coin.colorvalues = [SimpleColorValue(colordef=UNCOLORED_MARKER,
+                                             value=1000000)]
+        return ComposingModel([coin], address_rec), script
+
+    def payout_entries(self, count, value=10000):
+        target = make_address_rec(5678).get_address()
+        return [(FakeAsset(0), target, value) for i in xrange(count)]
+
+    def test_chain_change(self):
+        model, script = self.make_composing_model()
+        raw_txs = BatchPayout(model, max_outputs=2, processes=1).make_txs(
+            self.payout_entries(5))
+
+        self.assertEqual(len(raw_txs), 3)
+        prev_script = script
+        for i, raw_tx in enumerate(raw_txs):
+            tx = raw_tx.pycoin_tx
+            # each transaction spends the change of the one before
+            self.assertEqual(len(tx.txs_in), 1)
+            if i > 0:
+                self.assertEqual(tx.txs_in[0].previous_hash,
+                                 raw_txs[i - 1].pycoin_tx.hash())
+            tx.verify_tx_in(0, prev_script)
+            change = tx.txs_out[-1]
+            self.assertEqual(change.script, script)
+            prev_script = change.script
+        self.assertEqual(sum(len(raw_tx.pycoin_tx.txs_out) - 1
+                             for raw_tx in raw_txs), 5)
+
+    def test_split(self):
+        model, script = self.make_composing_model()
+        # one input, two targets and change, signed in a shared pool
+        raw_txs = BatchPayout(model, max_tx_size=300, processes=2).make_txs(
+            self.payout_entries(5))
+
+        self.assertEqual([len(raw_tx.pycoin_tx.txs_out) - 1
+                          for raw_tx in raw_txs], [2, 1, 2])
+        prev_script = script
+        for i, raw_tx in enumerate(raw_txs):
+            tx = raw_tx.pycoin_tx
+            self.assertTrue(len(raw_tx.get_tx_data()) <= 300)
+            if i > 0:
+                self.assertEqual(tx.txs_in[0].previous_hash,
+                                 raw_txs[i - 1].pycoin_tx.hash())
+            tx.verify_tx_in(0, prev_script)
+            prev_script = tx.txs_out[-1].script
+
+    def test_partial_publish(self):
+        model, script = self.make_composing_model()
+        controller = FailingController(model, 1)
+        try:
+            controller.sendmany_batch(self.payout_entries(1001, 100),
+                                      processes=1)
+            self.fail('publishing should fail')
+        except PartialPublishError as e:
+            self.assertEqual(len(e.published), 1)
+            self.assertTrue(e.published[0] in str(e))
+
+    def test_sign_txs(self):
+        address_recs = [make_address_rec(k) for k in (1234, 5678)]
+        items = []
+        for t in xrange(2):
+            utxos = [FakeUTXO(chr(t * 10 + i) * 32, i, address_recs[i % 2])
+                     for i in xrange(3)]
+            tx = Tx(1, [TxIn(utxo.txhash, utxo.outindex) for utxo in utxos],
+                    [TxOut(1000, utxos[0].script.decode('hex'))], 0)
+            items.append((tx, utxos))
+        pycoin_txcons.sign_txs(items[:1], processes=2)
+        pool = multiprocessing.Pool(2)
+        try:
+            pycoin_txcons.sign_txs(items[1:], processes=2, pool=pool)
+            # the pool of the caller is left running
+            self.assertEqual(pool.map(abs, [-1]), [1])
+        finally:
+            pool.terminate()
+        for tx, utxos in items:
+            for idx, utxo in enumerate(utxos):
+                tx.verify_tx_in(idx, utxo.script.decode('hex'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+
+import sqlite3
+import time
+import unittest
+
+from coloredcoinlib import ColorMap, ColorSet, SimpleColorValue
+from coloredcoinlib.store import DataStoreConnection, ColorMetaStore
+from coloredcoinlib.blockchain import CTxOut
+from ngcccbase.coindb import CoinStore, CoinManager
+from ngcccbase.txdb import (TxDataStore, NaiveTxDb, TX_STATUS_CONFIRMED,
+                            TX_STATUS_UNCONFIRMED, TX_STATUS_INVALID)
+
+
+class TestCoinStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.store_conn.conn.row_factory = sqlite3.Row
+        self.txstore = TxDataStore(self.store_conn.conn)
+        self.store = CoinStore(self.store_conn.conn)
+        self.txstore.add_tx('confirmed', '', TX_STATUS_CONFIRMED)
+        self.txstore.add_tx('unconfirmed', '', TX_STATUS_UNCONFIRMED)
+        self.txstore.add_tx('invalid', '', TX_STATUS_INVALID)
+        for txhash in ['confirmed', 'unconfirmed', 'invalid']:
+            self.store.add_coin('addr1', txhash, 0, 100, '')
+            self.store.add_coin('addr2', txhash, 1, 200, '')
+        # spends by an invalid transaction don't count
+        self.store.add_spend(self.store.find_coin('confirmed', 0), 'invalid')
+        self.store.add_spend(self.store.find_coin('confirmed', 1),
+                             'unconfirmed')
+
+    def outpoints(self, coins):
+        return sorted((coin['txhash'], coin['outindex']) for coin in coins)
+
+    def test_query_coins(self):
+        self.assertEqual(
+            self.outpoints(self.store.query_coins(['addr1', 'addr2'], False)),
+            [('confirmed', 0)])
+        self.assertEqual(
+            self.outpoints(self.store.query_coins(['addr1', 'addr2'], True)),
+            [('confirmed', 1)])
+        self.assertEqual(
+            self.outpoints(self.store.query_coins(['addr1'], False, None)),
+            [('confirmed', 0), ('unconfirmed', 0)])
+        self.assertEqual(
+            self.outpoints(self.store.query_coins(['addr2'], False, False)),
+            [('unconfirmed', 1)])
+        self.assertEqual(self.store.query_coins([], False), [])
+
+    def test_query_coins_status(self):
+        coin = self.store.query_coins(['addr2'], True)[0]
+        self.assertEqual(coin['tx_status'], TX_STATUS_CONFIRMED)
+        self.assertTrue(coin['spent'])
+
+
+class FakeTx(object):
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+
+class FakeBlockchainState(object):
+    def __init__(self):
+        self.statuses = {}
+        self.txs = {}
+        self.requested = []
+
+    def get_tx(self, txhash):
+        self.requested.append(txhash)
+        return self.txs[txhash]
+
+    def get_tx_blockhash(self, txhash):
+        status = self.statuses.get(txhash)
+        if status == TX_STATUS_CONFIRMED:
+            return 'blockhash', True
+        return None, status == TX_STATUS_UNCONFIRMED
+
+    def get_block_height(self, blockhash):
+        return 1
+
+
+class FakeAddressRecord(object):
+    def __init__(self, address, color_set):
+        self.address = address
+        self.color_set = color_set
+
+    def get_address(self):
+        return self.address
+
+    def get_color_set(self):
+        return self.color_set
+
+
+class FakeAddressManager(object):
+    def __init__(self, addresses):
+        self.addresses = addresses
+
+    def get_all_addresses(self):
+        return self.addresses
+
+    def has_address(self, address):
+        return self.find_address_record(address) is not None
+
+    def find_address_record(self, address):
+        for ar in self.addresses:
+            if ar.get_address() == address:
+                return ar
+
+    def find_address_record_by_hash160(self, hash160):
+        return None
+
+
+class FakeColorData(object):
+    def __init__(self, colormap):
+        self.colormap = colormap
+        self.requests = 0
+
+    def get_colorvalues(self, color_id_set, txhash, outindex):
+        self.requests += 1
+        color_id = list(color_id_set)[0]
+        return [SimpleColorValue(colordef=self.colormap.get_color_def(color_id),
+                                 value=outindex + 1)]
+
+
+class FakeColoredCoinContext(object):
+    def raw_to_address(self, raw_address):
+        return 'addr-' + raw_address.encode('hex')
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.store_conn.conn.row_factory = sqlite3.Row
+        self.bs = FakeBlockchainState()
+        self.colormap = ColorMap(ColorMetaStore(self.store_conn.conn))
+        self.color_set = ColorSet(self.colormap, [''])
+        self.colored_set = ColorSet(self.colormap, [
+            "epobc:b95323a763fa507110a89ab857af8e949810cf1e67e91104cd64222a04ccd0bb:0:180679"])
+        self.ccc = FakeColoredCoinContext()
+        self.ccc.colordata = FakeColorData(self.colormap)
+        self.address_man = FakeAddressManager(
+            [FakeAddressRecord('addr1', self.color_set),
+             FakeAddressRecord('addr2', self.colored_set)])
+        self.txdb = NaiveTxDb(self, {})
+        self.coin_man = CoinManager(self, {})
+
+    def get_blockchain_state(self):
+        return self.bs
+
+    def get_tx_db(self):
+        return self.txdb
+
+    def get_address_manager(self):
+        return self.address_man
+
+    def get_coin_manager(self):
+        return self.coin_man
+
+    def get_color_def(self, color_id):
+        return self.colormap.get_color_def(color_id)
+
+
+class TestCoinBalances(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FakeModel()
+        self.txdb = self.model.txdb
+        self.coin_man = self.model.coin_man
+        self.add_tx('a', TX_STATUS_CONFIRMED, 100)
+        self.add_tx('b', TX_STATUS_UNCONFIRMED, 50, spends='a')
+
+    def add_tx(self, txhash, status, value, spends=None):
+        self.model.bs.statuses[txhash] = status
+        self.txdb.store.add_tx(txhash, '', status)
+        self.txdb.last_status_check[txhash] = time.time()
+        self.coin_man.add_coin('addr1', txhash, 0, value, '')
+        if spends:
+            self.coin_man.store.add_spend(
+                self.coin_man.store.find_coin(spends, 0), txhash)
+        self.coin_man.update_balances(txhash)
+
+    def get_balances(self):
+        color_set = self.model.color_set
+        return [self.coin_man.get_balance(color_set, confirmed)
+                for confirmed in [True, False, None]]
+
+    def test_balances(self):
+        self.assertEqual(self.get_balances(), [0, 50, 50])
+        self.add_tx('c', TX_STATUS_CONFIRMED, 25)
+        self.assertEqual(self.get_balances(), [25, 50, 75])
+        self.add_tx('d', TX_STATUS_UNCONFIRMED, 5, spends='c')
+        self.assertEqual(self.get_balances(), [0, 55, 55])
+
+    def test_status_change(self):
+        self.get_balances()
+        self.model.bs.statuses['b'] = TX_STATUS_INVALID
+        self.txdb.recheck_tx_status('b')
+        self.assertEqual(self.get_balances(), [100, 0, 100])
+
+    def get_spendable(self):
+        return [(coin.txhash, coin.value) for coin in
+                self.coin_man.get_spendable_coins(0)]
+
+    def test_spendable_coins(self):
+        self.assertEqual(self.get_spendable(), [])
+        self.add_tx('c', TX_STATUS_CONFIRMED, 25)
+        self.add_tx('e', TX_STATUS_CONFIRMED, 75)
+        self.add_tx('f', TX_STATUS_CONFIRMED, 10)
+        self.assertEqual(self.get_spendable(),
+                         [('f', 10), ('c', 25), ('e', 75)])
+        coin = self.coin_man.get_spendable_coins(0)[0]
+        self.assertEqual(coin.address_rec.get_address(), 'addr1')
+        self.assertEqual(coin.colorvalues[0].get_value(), 10)
+        self.add_tx('d', TX_STATUS_UNCONFIRMED, 5, spends='c')
+        self.assertEqual(self.get_spendable(), [('f', 10), ('e', 75)])
+        self.model.bs.statuses['d'] = TX_STATUS_CONFIRMED
+        self.txdb.recheck_tx_status('d')
+        self.assertEqual(self.get_spendable(),
+                         [('d', 5), ('f', 10), ('e', 75)])
+
+    def test_reset(self):
+        self.txdb.store.set_block_height('a', 1)
+        self.txdb.store.set_block_height('b', 1)
+        self.assertEqual(self.get_balances(), [0, 50, 50])
+        # changed behind the cache's back
+        self.txdb.store.set_tx_status('b', TX_STATUS_INVALID)
+        self.assertEqual(self.get_balances(), [0, 50, 50])
+        self.txdb.reset_from_height(2)
+        self.assertEqual(self.get_balances(), [100, 0, 100])
+
+
+class TestStoredColorvalues(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FakeModel()
+        self.coin_man = self.model.coin_man
+        self.cdata = self.model.ccc.colordata
+        self.model.txdb.store.add_tx('a', '', TX_STATUS_CONFIRMED)
+        self.model.txdb.store.add_tx('b', '', TX_STATUS_UNCONFIRMED)
+        self.coin_man.add_coin('addr2', 'a', 1, 600, '')
+        self.coin_man.add_coin('addr2', 'b', 2, 600, '')
+
+    def get_colorvalues(self, txhash, outindex):
+        coin = self.coin_man.find_coin(txhash, outindex)
+        return [(cv.get_color_id(), cv.get_value())
+                for cv in self.coin_man.compute_colorvalues(coin)]
+
+    def test_confirmed(self):
+        color_id = list(self.model.colored_set.color_id_set)[0]
+        self.assertEqual(self.get_colorvalues('a', 1), [(color_id, 2)])
+        self.assertEqual(self.get_colorvalues('a', 1), [(color_id, 2)])
+        self.assertEqual(self.cdata.requests, 1)
+        coins = self.coin_man.query_coins(['addr2'], False)
+        self.assertTrue(coins[0].stored_colorvalues)
+
+    def test_unconfirmed(self):
+        self.get_colorvalues('b', 2)
+        self.get_colorvalues('b', 2)
+        self.assertEqual(self.cdata.requests, 2)
+
+
+class TestPrevoutAddresses(unittest.TestCase):
+
+    def test_prevout_addresses(self):
+        model = FakeModel()
+        coin_man = model.coin_man
+        coin_man.add_coin('addr1', 'a', 0, 100, '')
+        p2pkh = '\x76\xa9\x14' + '\x01' * 20 + '\x88\xac'
+        model.bs.txs['b'] = FakeTx([CTxOut(1, p2pkh), CTxOut(2, ''),
+                                    CTxOut(3, p2pkh)])
+        outpoints = [('a', 0), ('b', 0), ('b', 1), ('b', 2), ('coinbase', 0)]
+        expected = ['addr1', 'addr-' + '01' * 20, None, 'addr-' + '01' * 20,
+                    None]
+        self.assertEqual(coin_man.get_prevout_addresses(outpoints), expected)
+        self.assertEqual(model.bs.requested, ['b'])
+        # foreign outputs with an address are cached
+        self.assertEqual(coin_man.get_prevout_addresses(
+            [('b', 0), ('b', 2), ('a', 0)]),
+            ['addr-' + '01' * 20, 'addr-' + '01' * 20, 'addr1'])
+        self.assertEqual(model.bs.requested, ['b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+import unittest
+
+from coloredcoinlib import SimpleColorValue, UNCOLORED_MARKER
+from coloredcoinlib.txspec import ComposedTxSpec
+from ngcccbase.coinselection import (BranchAndBoundSelector,
+                                     CoinSelectionEngine, FirstFitSelector,
+                                     KnapsackSelector, LargestFirstSelector,
+                                     make_coin_selector)
+from ngcccbase.txcons import BaseOperationalTxSpec, InsufficientFundsError
+
+
+def fixed_fee(target, fee_per_coin):
+    return lambda count: target + fee_per_coin * count
+
+
+def selected_values(values, indices):
+    return sorted(values[i] for i in indices)
+
+
+class TestSelectors(unittest.TestCase):
+
+    def setUp(self):
+        self.values = [500, 7000, 3000, 1000, 20000, 2000]
+
+    def test_first_fit(self):
+        indices = FirstFitSelector().select(self.values, fixed_fee(4000, 0))
+        self.assertEqual(indices, [0, 1])
+        self.assertEqual(
+            FirstFitSelector().select(self.values, fixed_fee(40000, 0)), None)
+
+    def test_largest_first(self):
+        indices = LargestFirstSelector().select(self.values,
+                                                fixed_fee(25000, 100))
+        self.assertEqual(selected_values(self.values, indices),
+                         [7000, 20000])
+
+    def test_branch_and_bound_exact(self):
+        indices = BranchAndBoundSelector().select(self.values,
+                                                  fixed_fee(5700, 100))
+        self.assertEqual(selected_values(self.values, indices),
+                         [1000, 2000, 3000])
+
+    def test_branch_and_bound_window(self):
+        required = fixed_fee(5650, 100)
+        selector = BranchAndBoundSelector()
+        self.assertEqual(selector.select(self.values, required), None)
+        indices = selector.select(self.values, required, change_window=100)
+        self.assertEqual(selected_values(self.values, indices),
+                         [1000, 2000, 3000])
+
+    def test_branch_and_bound_gives_up(self):
+        values = [3 ** i for i in xrange(20)]
+        selector = BranchAndBoundSelector(max_tries=10)
+        self.assertEqual(selector.select(values, fixed_fee(2, 0)), None)
+
+    def test_knapsack(self):
+        selector = KnapsackSelector(seed=1)
+        self.assertEqual(selector.select(self.values, fixed_fee(2900, 100)),
+                         [2])
+        indices = selector.select(self.values, fixed_fee(8000, 0))
+        self.assertEqual(sum(self.values[i] for i in indices), 8000)
+        self.assertEqual(selector.select(self.values, fixed_fee(40000, 0)),
+                         None)
+
+    def test_engine(self):
+        engine = CoinSelectionEngine([BranchAndBoundSelector(),
+                                      LargestFirstSelector()])
+        indices = engine.select(self.values, fixed_fee(25000, 100))
+        self.assertEqual(selected_values(self.values, indices),
+                         [7000, 20000])
+        self.assertTrue(isinstance(make_coin_selector(), CoinSelectionEngine))
+        self.assertRaises(Exception, make_coin_selector, 'nonexistent')
+
+
+class FakeUTXO(ComposedTxSpec.TxIn):
+    def __init__(self, value):
+        super(FakeUTXO, self).__init__('', 0)
+        self.colorvalues = [SimpleColorValue(colordef=UNCOLORED_MARKER,
+                                             value=value)]
+
+
+class FakeOperationalTxSpec(BaseOperationalTxSpec):
+    def get_coin_selector(self):
+        return make_coin_selector('largest_first')
+
+
+class TestSelectEnoughCoins(unittest.TestCase):
+
+    def test_required_sum_of_selection(self):
+        utxos = [FakeUTXO(v) for v in [100, 5000, 300, 6000]]
+        selections = []
+        def required_sum_fn(selection):
+            selections.append(selection)
+            return SimpleColorValue(colordef=UNCOLORED_MARKER,
+                                    value=10000 + 100 * len(selection))
+        op = FakeOperationalTxSpec()
+        selection, ssum = op._select_enough_coins(UNCOLORED_MARKER, utxos,
+                                                  required_sum_fn)
+        self.assertEqual(selection, [utxos[1], utxos[3]])
+        self.assertEqual(ssum.get_value(), 11000)
+        self.assertEqual(selections[-1], selection)
+        self.assertRaises(InsufficientFundsError, op._select_enough_coins,
+                          UNCOLORED_MARKER, utxos[:2], required_sum_fn)
+
+
+if __name__ == '__main__':
+    unittest.main()
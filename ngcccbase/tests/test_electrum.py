@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+
+import io
+import json
+import socket
+import threading
+import unittest
+
+from bitcoin.wallet import CBitcoinAddress
+from pycoin.tx.Tx import Tx
+from pycoin.tx.TxIn import TxIn
+from pycoin.tx.TxOut import TxOut
+
+from ngcccbase.services.electrum import (ElectrumInterface, ConnectionError,
+                                         PendingResponse, ServerError)
+from ngcccbase.pycoin_txcons import LRUCache
+from ngcccbase.wallet_controller import WalletController
+
+
+ADDRESS = '1CC3X2gu58d6wXUWMffpuzN9JAfTUWu4Kj'
+SCRIPT = CBitcoinAddress(ADDRESS).to_scriptPubKey()
+
+
+def make_tx(prev_hash, prev_index, values):
+    tx = Tx(1, [TxIn(prev_hash.decode('hex')[::-1], prev_index)],
+            [TxOut(value, str(SCRIPT)) for value in values], 0)
+    s = io.BytesIO()
+    tx.stream(s)
+    return tx.hash()[::-1].encode('hex'), s.getvalue().encode('hex')
+
+
+class FakeElectrumInterface(ElectrumInterface):
+    """ElectrumInterface which answers requests from dicts,
+    exceptions are answered as errors."""
+    def __init__(self, listunspent=None):
+        self.raw_tx_cache = LRUCache(2)
+        self.utxo_sets = {}
+        self.supports_listunspent = None
+        self.connection = ('localhost', 50001)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.listunspent = listunspent
+        self.history = []
+        self.raw = {}
+        self.requests = []
+
+    def get_response(self, method, params):
+        self.requests.append(method)
+        if method == 'blockchain.address.listunspent':
+            return self.listunspent
+        if method == 'blockchain.address.get_history':
+            if self.history is None:
+                return None
+            return [{'tx_hash': txhash, 'height': 1}
+                    for txhash in self.history]
+        if method == 'blockchain.transaction.get':
+            return self.raw[params[0]]
+        if method == 'blockchain.address.subscribe':
+            return 'status_' + params[0]
+
+    def send_request(self, method, params):
+        response = PendingResponse(len(self.requests))
+        result = self.get_response(method, params)
+        if isinstance(result, Exception):
+            response.set_error(result)
+        else:
+            response.set_result(result)
+        return response
+
+    def add_tx(self, txhash, raw):
+        self.raw[txhash] = raw
+        self.history.append(txhash)
+
+
+class TestElectrumUTXO(unittest.TestCase):
+
+    def setUp(self):
+        self.ei = FakeElectrumInterface(ServerError(
+            'unknown method', 'unknown method: listunspent'))
+        self.tx1, raw1 = make_tx('00' * 32, 0, [100, 200])
+        self.ei.add_tx(self.tx1, raw1)
+
+    def count(self, method):
+        return self.ei.requests.count(method)
+
+    def test_incremental(self):
+        self.assertEqual([u[:3] for u in self.ei.get_utxo(ADDRESS)],
+                         [(self.tx1, 0, 100), (self.tx1, 1, 200)])
+        self.assertEqual(self.ei.supports_listunspent, False)
+        self.ei.get_utxo(ADDRESS)
+        self.assertEqual(self.count('blockchain.transaction.get'), 1)
+        self.assertEqual(self.count('blockchain.address.listunspent'), 1)
+
+        tx2, raw2 = make_tx(self.tx1, 0, [50])
+        self.ei.add_tx(tx2, raw2)
+        self.assertEqual([u[:3] for u in self.ei.get_utxo(ADDRESS)],
+                         [(self.tx1, 1, 200), (tx2, 0, 50)])
+        self.assertEqual(self.count('blockchain.transaction.get'), 2)
+
+    def test_listunspent(self):
+        self.ei.listunspent = [{'tx_hash': self.tx1, 'tx_pos': 1,
+                                'value': 200, 'height': 1}]
+        self.assertEqual(self.ei.get_utxo(ADDRESS),
+                         [(self.tx1, 1, 200, SCRIPT.encode('hex'))])
+        self.assertEqual(self.ei.supports_listunspent, True)
+        self.assertEqual(self.count('blockchain.address.get_history'), 0)
+
+    def test_raw_tx_cache(self):
+        txs = [make_tx('%064x' % i, 0, [100]) for i in xrange(3)]
+        self.ei.raw.update(txs)
+        result = self.ei.get_raw_transactions([(txhash, 1)
+                                               for txhash, raw in txs])
+        self.assertEqual(result, dict(txs))
+        # only the two most recent transactions are kept
+        self.assertEqual(len(self.ei.raw_tx_cache.items), 2)
+        self.ei.get_raw_transaction(txs[2][0], 1)
+        self.assertEqual(self.count('blockchain.transaction.get'), 3)
+        self.ei.get_raw_transaction(txs[0][0], 1)
+        self.assertEqual(self.count('blockchain.transaction.get'), 4)
+
+    def test_listunspent_failure(self):
+        # no answer is no reason to stop asking for listunspent
+        self.ei.listunspent = None
+        self.assertEqual(len(self.ei.get_utxo(ADDRESS)), 2)
+        self.assertEqual(self.ei.supports_listunspent, None)
+        self.ei.listunspent = ServerError('busy', {'code': -32603,
+                                                   'message': 'busy'})
+        self.ei.get_utxo(ADDRESS)
+        self.assertEqual(self.ei.supports_listunspent, None)
+        self.ei.listunspent = ServerError('unknown', {'code': -32601,
+                                                      'message': 'unknown'})
+        self.ei.get_utxo(ADDRESS)
+        self.assertEqual(self.ei.supports_listunspent, False)
+        self.ei.get_utxo(ADDRESS)
+        self.assertEqual(self.count('blockchain.address.listunspent'), 3)
+
+
+class FakeAddressRecord(object):
+    def get_address(self):
+        return ADDRESS
+
+
+class FakeRescanModel(object):
+    """Wallet model parts full_rescan uses, it records purges."""
+    def __init__(self, interface):
+        self.utxo_fetcher = self
+        self.interface = interface
+        self.purged = []
+        self.added = []
+        self.tx_history = self
+        self.entries = {}
+
+    def get_address_manager(self):
+        return self
+
+    def get_all_addresses(self):
+        return [FakeAddressRecord()]
+
+    def get_coin_manager(self):
+        return self
+
+    def purge_coins(self):
+        self.purged.append('coins')
+
+    def get_tx_db(self):
+        return self
+
+    def purge_tx_db(self):
+        self.purged.append('txs')
+
+    def add_txs_bulk(self, txhashes):
+        self.added.extend(txhashes)
+        return {'fetch': 0.0}
+
+    def populate_history(self):
+        pass
+
+
+class TestElectrumHistory(unittest.TestCase):
+
+    def test_history(self):
+        ei = FakeElectrumInterface()
+        ei.history = ['aa', 'bb']
+        self.assertEqual(ei.get_address_history(ADDRESS), ['aa', 'bb'])
+        ei.history = None
+        self.assertRaises(ConnectionError, ei.get_address_history, ADDRESS)
+
+    def test_statuses(self):
+        ei = FakeElectrumInterface()
+        self.assertEqual(ei.get_address_statuses(['a', 'b']),
+                         {'a': 'status_a', 'b': 'status_b'})
+
+    def test_failed_rescan(self):
+        ei = FakeElectrumInterface()
+        ei.history = None
+        model = FakeRescanModel(ei)
+        self.assertRaises(ConnectionError,
+                          WalletController(model).full_rescan)
+        self.assertEqual(model.purged, [])
+
+    def test_rescan_timings(self):
+        ei = FakeElectrumInterface()
+        ei.history = ['aa']
+        model = FakeRescanModel(ei)
+        timings = WalletController(model).full_rescan()
+        self.assertEqual(sorted(timings), ['fetch', 'history', 'tx_history'])
+        self.assertEqual(model.purged, ['coins', 'txs'])
+        self.assertEqual(model.added, ['aa'])
+
+
+class SocketPairElectrumInterface(ElectrumInterface):
+    """ElectrumInterface talking to a server on the other end
+    of a socket pair."""
+    def connect(self):
+        client, self.server = socket.socketpair()
+        self.start_reader(client)
+        return True
+
+    def read_requests(self, count):
+        data = ''
+        while data.count('\n') < count:
+            data += self.server.recv(4096)
+        return [json.loads(line) for line in data.splitlines()]
+
+
+class TestElectrumPipelining(unittest.TestCase):
+
+    def setUp(self):
+        self.ei = SocketPairElectrumInterface('localhost', 50001)
+
+    def tearDown(self):
+        self.ei.close()
+        self.ei.server.close()
+
+    def test_parse_messages(self):
+        self.assertEqual(self.ei._parse_messages('{"id": 1, "res'), [])
+        self.assertEqual(self.ei._parse_messages('ult": 2}\n{"id": 2,'),
+                         [{'id': 1, 'result': 2}])
+        self.assertEqual(self.ei._parse_messages(' "result": 3}\n\n'),
+                         [{'id': 2, 'result': 3}])
+        self.assertEqual(self.ei.buffer, [])
+
+    def test_out_of_order(self):
+        def serve():
+            requests = self.ei.read_requests(3)
+            data = json.dumps({'method': 'blockchain.address.subscribe',
+                               'params': ['addr', 'status']}) + '\n'
+            for request in reversed(requests):
+                data += json.dumps({'id': request['id'],
+                                    'result': request['params'][0]}) + '\n'
+            # deliver the answers in pieces which split messages
+            for i in xrange(0, len(data), 7):
+                self.ei.server.sendall(data[i:i + 7])
+        thread = threading.Thread(target=serve)
+        thread.start()
+        results = self.ei.get_responses(
+            [('blockchain.transaction.get', [n, 1]) for n in 'abc'])
+        thread.join()
+        self.assertEqual(results, ['a', 'b', 'c'])
+        self.assertEqual(self.ei.pending, {})
+        notification = self.ei.wait_for_notification(1)
+        self.assertEqual(notification['params'], ['addr', 'status'])
+        self.assertEqual(self.ei.wait_for_notification(0.01), None)
+
+    def test_error_response(self):
+        response = self.ei.send_request('blockchain.address.listunspent',
+                                        ['addr'])
+        request = self.ei.read_requests(1)[0]
+        self.ei.server.sendall(json.dumps(
+            {'id': request['id'], 'error': 'unknown method'}) + '\n')
+        self.assertRaises(Exception, response.wait, 1)
+
+    def test_connection_closed(self):
+        response = self.ei.send_request('blockchain.numblocks.subscribe', [])
+        self.ei.server.close()
+        self.assertRaises(ConnectionError, response.wait, 1)
+        self.assertEqual(self.ei.pending, {})
+        self.assertFalse(self.ei.connected())
+
+
+if __name__ == '__main__':
+    unittest.main()
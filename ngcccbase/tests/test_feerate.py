@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import unittest
+
+from coloredcoinlib.txspec import ComposedTxSpec
+from ngcccbase.feerate import (DEFAULT_FEE_RATE, ElectrumFeeRate,
+                               FixedFeeRate, make_fee_rate_source)
+from ngcccbase.services.electrum import ConnectionError
+
+
+class FakeInterface(object):
+    def __init__(self, estimates):
+        self.estimates = estimates
+        self.calls = 0
+        self.is_connected = True
+
+    def connected(self):
+        return self.is_connected
+
+    def estimate_fee(self, blocks):
+        self.calls += 1
+        estimate = self.estimates.pop(0)
+        if isinstance(estimate, Exception):
+            raise estimate
+        return estimate
+
+
+class TestFeeRate(unittest.TestCase):
+
+    def test_fixed(self):
+        self.assertEqual(make_fee_rate_source({}).get_fee_rate(),
+                         DEFAULT_FEE_RATE)
+        self.assertEqual(
+            make_fee_rate_source({'fee_rate': 5000}).get_fee_rate(), 5000)
+        source = make_fee_rate_source({'fee_rate': {'source': 'fixed',
+                                                    'fee_rate': 2000}})
+        self.assertTrue(isinstance(source, FixedFeeRate))
+        self.assertEqual(source.get_fee_rate(), 2000)
+        self.assertRaises(Exception, make_fee_rate_source,
+                          {'fee_rate': {'source': 'oracle'}})
+
+    def test_electrum(self):
+        interface = FakeInterface([None, 20000])
+        source = ElectrumFeeRate(lambda: interface, fallback=1000,
+                                 max_age=600)
+        self.assertEqual(source.get_fee_rate(), 1000)
+        self.assertEqual(source.get_fee_rate(), 1000)
+        self.assertEqual(interface.calls, 1)
+        source.updated -= 601
+        self.assertEqual(source.get_fee_rate(), 20000)
+
+    def test_electrum_unreachable(self):
+        interface = FakeInterface([5000])
+        attempts = []
+        def make_interface():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionError('unreachable')
+            return interface
+        # nothing connects until a fee rate is needed
+        source = make_fee_rate_source({'fee_rate': {
+            'source': 'electrum', 'host': 'localhost', 'port': 1}})
+        self.assertEqual(source.interface, None)
+        source = ElectrumFeeRate(make_interface, fallback=1000)
+        self.assertEqual(source.get_fee_rate(), 1000)
+        source.updated -= 601
+        self.assertEqual(source.get_fee_rate(), 5000)
+        self.assertEqual(len(attempts), 2)
+
+    def test_electrum_reconnect(self):
+        interfaces = []
+        def make_interface():
+            interfaces.append(FakeInterface([None, 7000]))
+            return interfaces[-1]
+        source = ElectrumFeeRate(make_interface, fallback=1000)
+        self.assertEqual(source.get_fee_rate(), 1000)
+        # the server doesn't know yet, the connection is kept
+        self.assertTrue(source.interface is interfaces[0])
+        source.updated -= 601
+        interfaces[0].is_connected = False
+        interfaces[0].estimates = [None]
+        self.assertEqual(source.get_fee_rate(), 1000)
+        self.assertEqual(source.interface, None)
+        source.updated -= 601
+        self.assertEqual(source.get_fee_rate(), 1000)
+        source.updated -= 601
+        self.assertEqual(source.get_fee_rate(), 7000)
+        self.assertEqual(len(interfaces), 2)
+
+        interfaces[1].estimates = [ConnectionError('connection lost')]
+        source.updated -= 601
+        self.assertEqual(source.get_fee_rate(), 1000)
+        self.assertEqual(source.interface, None)
+
+
+class TestEstimateSize(unittest.TestCase):
+
+    def test_estimate_size(self):
+        c = ComposedTxSpec(None)
+        c.add_txout(ComposedTxSpec.TxOut(1, '1BoatSLRHtKNngkdXEeobR76b53LETtpyT'))
+        c.add_txout(ComposedTxSpec.TxOut(1, '1BoatSLRHtKNngkdXEeobR76b53LETtpyT'))
+        # version, locktime, counts, two outputs
+        self.assertEqual(c.estimate_size(), 8 + 2 + 34 + 34)
+        c.add_txin(ComposedTxSpec.TxIn('00' * 32, 0))
+        self.assertEqual(c.estimate_size(), 8 + 2 + 180 + 34 + 34)
+        compressed = ComposedTxSpec.TxIn('00' * 32, 1)
+        compressed.get_script_sig_size = lambda: 1 + 72 + 1 + 33
+        self.assertEqual(c.estimate_size(extra_txins=[compressed],
+                                         extra_txouts=1),
+                         8 + 2 + 180 + 148 + 34 + 34 + 34)
+        self.assertEqual(c.estimate_size(extra_txins=2),
+                         c.estimate_size(extra_txins=[compressed] * 2) + 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+import socket
+import unittest
+import Queue
+
+from coloredcoinlib.store import DataStoreConnection
+from ngcccbase.blockchain import (NewBlocks, PollingNewBlocksSource,
+                                  ElectrumNewBlocksSource,
+                                  BlockHashingAlgorithm, SQLStore)
+
+
+class FakeBlockchainState(object):
+    def __init__(self):
+        self.height = 10
+
+    def get_height(self):
+        return self.height
+
+    def get_header(self, height):
+        return {'block_height': height}
+
+
+class FakeNewBlocksSource(object):
+    def __init__(self, heights):
+        self.heights = heights
+
+    def wait_for_height(self, timeout):
+        if not self.heights:
+            raise Exception('Connection lost!')
+        return self.heights.pop(0)
+
+    def stop(self):
+        pass
+
+
+class TestNewBlocks(unittest.TestCase):
+
+    def setUp(self):
+        self.bcs = FakeBlockchainState()
+        self.queue = Queue.Queue()
+
+    def test_pushed_heights(self):
+        nb = NewBlocks(self.bcs, self.queue, FakeNewBlocksSource([11, 12]))
+        nb.start()
+        heights = [self.queue.get(timeout=5)['block_height']
+                   for i in range(3)]
+        self.assertEqual(heights, [10, 11, 12])
+        nb.stop()
+
+    def test_fallback_to_polling(self):
+        nb = NewBlocks(self.bcs, self.queue, FakeNewBlocksSource([]),
+                       interval=0.01)
+        nb.start()
+        self.queue.get(timeout=5)
+        self.bcs.height = 20
+        while self.queue.get(timeout=5)['block_height'] != 20:
+            pass
+        self.assertTrue(isinstance(nb.source, PollingNewBlocksSource))
+        nb.stop()
+
+    def test_electrum_unreachable(self):
+        # nothing listens on a port we bound and closed again
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        source = ElectrumNewBlocksSource('127.0.0.1', port)
+        nb = NewBlocks(self.bcs, self.queue, source, interval=0.01)
+        self.assertEqual(nb._wait_for_height(), None)
+        self.assertTrue(isinstance(nb.source, PollingNewBlocksSource))
+        source.stop()
+        self.assertEqual(source.wait_for_height(0.01), None)
+
+    def test_electrum_stop(self):
+        closed = []
+        class FakeInterface(object):
+            def close(self):
+                closed.append(True)
+        source = ElectrumNewBlocksSource('127.0.0.1', 50001)
+        source.interface = FakeInterface()
+        source.stop()
+        self.assertEqual(closed, [True])
+
+
+class FakeHeaderStore(object):
+    def __init__(self, height):
+        self.height = height
+        self.reads = 0
+
+    def read_header(self, height):
+        self.reads += 1
+        if height > self.height:
+            return None
+        return {'timestamp': height * 600, 'bits': 0x1d00ffff}
+
+
+class TestBlockHashingAlgorithm(unittest.TestCase):
+
+    def setUp(self):
+        self.store = FakeHeaderStore(3*2016)
+        self.bha = BlockHashingAlgorithm(self.store, False)
+
+    def test_get_target_cached(self):
+        target = self.bha.get_target(2)
+        reads = self.store.reads
+        for i in range(10):
+            self.assertEqual(self.bha.get_target(2), target)
+        self.assertEqual(self.store.reads, reads)
+
+    def test_invalidate_targets(self):
+        self.bha.get_target(1)
+        self.bha.get_target(2)
+        self.bha.invalidate_targets(2016)
+        self.assertEqual(self.bha.targets.keys(), [1])
+        self.bha.invalidate_targets(2015)
+        self.assertEqual(self.bha.targets, {})
+
+    def test_chain_targets_not_cached(self):
+        self.store.height = 2*2016 - 2
+        chain = [{'block_height': 2*2016 - 1, 'timestamp': 0,
+                  'bits': 0x1d00ffff}]
+        self.bha.get_target(2, chain)
+        self.assertEqual(self.bha.targets, {})
+
+
+class TestSQLStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.store = SQLStore(self.store_conn.conn)
+        self.header = {
+            'version': 1,
+            'prev_block_hash': '00' * 32,
+            'merkle_root': '4a' * 32,
+            'timestamp': 1231006505,
+            'bits': 0x1d00ffff,
+            'nonce': 2083236893,
+        }
+        raw = self.store.header_to_raw(self.header)
+        self.chunk = ''.join(raw[:76] + chr(i % 256) + chr(i / 256) + raw[78:]
+                             for i in range(2016))
+
+    def test_save_chunk(self):
+        self.store.save_chunk(1, self.chunk)
+        self.assertEqual(self.store.get_height(), 2*2016 - 1)
+        self.assertEqual(self.store.read_raw_header(2016 + 5),
+                         self.chunk[5*80:6*80])
+        self.assertEqual(self.store.read_header(2016)['merkle_root'],
+                         self.header['merkle_root'])
+        self.assertEqual(self.store.read_raw_header(0), None)
+
+    def test_read_raw_headers(self):
+        self.store.save_chunk(0, self.chunk)
+        self.store.truncate(100)
+        headers = self.store.read_raw_headers(90, 20)
+        self.assertEqual(headers, [self.chunk[i*80:(i+1)*80]
+                                   for i in range(90, 100)])
+        self.assertEqual(len(self.store.read_headers(0, 2016)), 100)
+
+    def test_save_chain(self):
+        self.store.save_chunk(0, self.chunk)
+        header = dict(self.header, block_height=2016, nonce=1)
+        self.store.save_chain([header])
+        self.assertEqual(self.store.get_height(), 2016)
+        self.assertEqual(self.store.read_header(2016)['nonce'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+import threading
+import time
+import unittest
+
+from ngcccbase.services.parallel import parallel_map
+
+
+class FakeInterface(object):
+    MAX_CONCURRENT_REQUESTS = 3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def get_address_history(self, address):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        if address == 'bad':
+            raise Exception('Error when retrieving history!')
+        return [address + '_tx']
+
+
+class TestParallelMap(unittest.TestCase):
+
+    def setUp(self):
+        self.interface = FakeInterface()
+        self.addresses = ['addr%d' % i for i in range(20)]
+
+    def test_order(self):
+        result = parallel_map(self.interface,
+                              self.interface.get_address_history,
+                              self.addresses)
+        self.assertEqual(result, [[a + '_tx'] for a in self.addresses])
+
+    def test_concurrency_limit(self):
+        parallel_map(self.interface, self.interface.get_address_history,
+                     self.addresses)
+        self.assertTrue(1 < self.interface.max_active <= 3)
+        self.interface.MAX_CONCURRENT_REQUESTS = 1
+        self.interface.max_active = 0
+        parallel_map(self.interface, self.interface.get_address_history,
+                     self.addresses)
+        self.assertEqual(self.interface.max_active, 1)
+
+    def test_error(self):
+        self.assertRaises(Exception, parallel_map, self.interface,
+                          self.interface.get_address_history,
+                          self.addresses + ['bad'])
+
+    def test_empty(self):
+        self.assertEqual(parallel_map(self.interface, len, []), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+import unittest
+
+import bitcoin.core
+from pycoin.ecdsa import generator_secp256k1
+from pycoin.encoding import b2a_hashed_base58, to_bytes_32
+from pycoin.tx.script import der
+from pycoin.tx.Tx import Tx, SIGHASH_ALL
+from pycoin.tx.TxIn import TxIn
+from pycoin.tx.TxOut import TxOut
+
+from coloredcoinlib.blockchain import CTransaction
+from ngcccbase import pycoin_txcons, signing
+from ngcccbase.address import LooseAddressRecord
+
+
+def make_address_rec(secret_exponent):
+    return LooseAddressRecord(
+        address_data=b2a_hashed_base58('\0' + to_bytes_32(secret_exponent)),
+        color_set=None, testnet=False)
+
+
+class FakeUTXO(object):
+    def __init__(self, txhash, outindex, address_rec):
+        self.txhash = txhash
+        self.outindex = outindex
+        self.address_rec = address_rec
+        self.script = pycoin_txcons.tools.compile(
+            "OP_DUP OP_HASH160 %s OP_EQUALVERIFY OP_CHECKSIG" %
+            address_rec.rawPubkey().encode('hex')).encode('hex')
+
+    def get_txhash(self):
+        return self.txhash
+
+
+class TestSignTx(unittest.TestCase):
+
+    def setUp(self):
+        self.address_recs = [make_address_rec(k) for k in (1234, 5678)]
+        self.utxos = [FakeUTXO(chr(i) * 32, i, self.address_recs[i % 2])
+                      for i in xrange(3)]
+        self.tx = Tx(1, [TxIn(utxo.txhash, utxo.outindex)
+                         for utxo in reversed(self.utxos)],
+                     [TxOut(1000, self.utxos[0].script.decode('hex'))], 0)
+
+    def check_signed(self):
+        for idx, utxo in enumerate(reversed(self.utxos)):
+            self.tx.verify_tx_in(idx, utxo.script.decode('hex'))
+
+    def test_p2pkh_hash160(self):
+        script = self.utxos[1].script.decode('hex')
+        self.assertEqual(pycoin_txcons.p2pkh_hash160(script),
+                         self.address_recs[1].rawPubkey())
+        self.assertEqual(pycoin_txcons.p2pkh_hash160(script[:-1]), None)
+
+    def test_address_to_script(self):
+        # utxos[i] pays to address_recs[i]
+        for address_rec, utxo in zip(self.address_recs, self.utxos):
+            for i in xrange(2):
+                self.assertEqual(pycoin_txcons.address_to_script(
+                    address_rec.get_address(), False),
+                    utxo.script.decode('hex'))
+        self.assertRaises(Exception, pycoin_txcons.address_to_script,
+                          self.address_recs[0].get_address(), True)
+
+    def test_lru_cache(self):
+        cache = pycoin_txcons.LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_signature_hash(self):
+        hasher = pycoin_txcons.SignatureHasher(self.tx)
+        script = self.utxos[0].script.decode('hex')
+        for idx in xrange(3):
+            self.assertEqual(hasher.signature_hash(script, idx),
+                             self.tx.signature_hash(script, idx, SIGHASH_ALL))
+
+    def test_sign_tx(self):
+        pycoin_txcons.sign_tx(self.tx, self.utxos, False)
+        self.check_signed()
+
+    def test_sign_tx_lookup(self):
+        lookup = pycoin_txcons.make_hash160_lookup(self.utxos)
+        pycoin_txcons.sign_tx(self.tx, self.utxos[1:], False, lookup)
+        # the input we have no coin for is left alone
+        self.assertEqual(self.tx.txs_in[2].script, '')
+        pycoin_txcons.sign_tx(self.tx, self.utxos, False, lookup)
+        self.check_signed()
+
+    def test_low_s(self):
+        order = generator_secp256k1.order()
+        for value in xrange(10):
+            r, s = der.sigdecode_der(signing.sign_pycoin(1234, value))
+            self.assertTrue(s + s <= order)
+
+    def test_sign_python(self):
+        for secret_exponent, value in [(1, 2), (1234, 5678),
+                                       (2 ** 255 + 1, 2 ** 200 + 7)]:
+            self.assertEqual(signing.sign_python(secret_exponent, value),
+                             signing.sign_pycoin(secret_exponent, value))
+
+
+class TestParsedTx(unittest.TestCase):
+
+    def setUp(self):
+        utxo = FakeUTXO('\1' * 32, 2, make_address_rec(1234))
+        tx = Tx(1, [TxIn(utxo.txhash, utxo.outindex, sequence=7)],
+                [TxOut(1000, utxo.script.decode('hex'))], 0)
+        self.utxo = utxo
+        self.tx_data = pycoin_txcons.serialize(tx)
+
+    def test_memoized(self):
+        parsed = pycoin_txcons.ParsedTx.from_tx_data(self.tx_data)
+        txhash = parsed.pycoin_tx.hash()[::-1].encode('hex')
+        self.assertEqual(parsed.get_hex_txhash(), txhash)
+        self.assertTrue(parsed.get_tx_data() is self.tx_data)
+        pycoin_txcons.sign_tx(parsed.pycoin_tx, [self.utxo], False)
+        parsed.changed()
+        self.assertNotEqual(parsed.get_hex_txhash(), txhash)
+        self.assertEqual(parsed.get_tx_data(),
+                         pycoin_txcons.serialize(parsed.pycoin_tx))
+
+    def test_ctransaction(self):
+        parsed = pycoin_txcons.ParsedTx.from_tx_data(self.tx_data)
+        ctx = parsed.get_ctransaction(None)
+        bctx = CTransaction.from_bitcoincore(
+            parsed.get_hex_txhash(),
+            bitcoin.core.CTransaction.deserialize(self.tx_data), None)
+        self.assertEqual(ctx.hash, bctx.hash)
+        self.assertEqual([inp.get_outpoint() for inp in ctx.inputs],
+                         [inp.get_outpoint() for inp in bctx.inputs])
+        self.assertEqual([(out.value, out.raw_address) for out in ctx.outputs],
+                         [(out.value, out.raw_address) for out in bctx.outputs])
+        self.assertEqual(ctx.raw.vin[0].nSequence, bctx.raw.vin[0].nSequence)
+        self.assertFalse(ctx.raw.vin[0].prevout.is_null())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+import io
+import unittest
+
+from pycoin.tx.Tx import Tx
+from pycoin.tx.TxIn import TxIn
+from pycoin.tx.TxOut import TxOut
+
+from coloredcoinlib.store import DataStoreConnection
+from ngcccbase.txdb import (NaiveTxDb, TX_STATUS_CONFIRMED,
+                            TX_STATUS_UNCONFIRMED)
+
+
+def make_tx(prev_hash, value):
+    script = '76a914%s88ac' % ('11' * 20)
+    tx = Tx(1, [TxIn(prev_hash, 0)], [TxOut(value, script.decode('hex'))], 0)
+    s = io.BytesIO()
+    tx.stream(s)
+    return tx.hash()[::-1].encode('hex'), s.getvalue().encode('hex')
+
+
+class FakeBlockchainState(object):
+    def __init__(self):
+        self.raw = {}
+
+    def get_raw(self, txhash):
+        return self.raw[txhash]
+
+    def get_tx_blockhash(self, txhash):
+        return 'blockhash', True
+
+    def get_block_height(self, blockhash):
+        return 1
+
+
+class FakeAddressManager(object):
+    def find_address_record_by_hash160(self, hash160):
+        return None
+
+
+class FakeColoredCoinContext(object):
+    def raw_to_address(self, raw_address):
+        return raw_address.encode('hex')
+
+
+class FakeTxHistory(object):
+    def __init__(self):
+        self.entries = {}
+
+    def add_entry_from_tx(self, raw_tx):
+        pass
+
+
+class FakeCoinManager(object):
+    def __init__(self):
+        self.applied = []
+        self.fail = None
+
+    def apply_tx(self, txhash, raw_tx):
+        if txhash == self.fail:
+            raise Exception('apply_tx failed')
+        self.applied.append(txhash)
+
+
+class FakeModel(object):
+    def __init__(self):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.bs = FakeBlockchainState()
+        self.ccc = FakeColoredCoinContext()
+        self.tx_history = FakeTxHistory()
+        self.coin_man = FakeCoinManager()
+
+    def get_blockchain_state(self):
+        return self.bs
+
+    def get_address_manager(self):
+        return FakeAddressManager()
+
+    def get_coin_manager(self):
+        return self.coin_man
+
+
+class TestAddTxsBulk(unittest.TestCase):
+
+    def setUp(self):
+        self.model = FakeModel()
+        self.txdb = NaiveTxDb(self.model, {})
+        # a chain of transactions, each spending the previous one
+        self.txhashes = []
+        prev_hash = '\x01' * 32
+        for i in range(5):
+            txhash, txdata = make_tx(prev_hash, 1000 - i)
+            self.model.bs.raw[txhash] = txdata
+            self.txhashes.append(txhash)
+            prev_hash = txhash.decode('hex')[::-1]
+
+    def test_add_txs_bulk(self):
+        timings = self.txdb.add_txs_bulk(reversed(self.txhashes))
+        self.assertEqual(sorted(timings.keys()),
+                         ['apply', 'fetch', 'parse', 'status'])
+        self.assertEqual(self.model.coin_man.applied, self.txhashes)
+        for txhash in self.txhashes:
+            self.assertEqual(self.txdb.store.get_tx_status(txhash),
+                             TX_STATUS_CONFIRMED)
+        self.txdb.add_txs_bulk(self.txhashes)
+        self.assertEqual(len(self.model.coin_man.applied), 5)
+
+    def test_rollback(self):
+        self.model.coin_man.fail = self.txhashes[3]
+        self.assertRaises(Exception, self.txdb.add_txs_bulk, self.txhashes)
+        self.assertEqual(self.txdb.get_all_tx_hashes(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+import json
+import unittest
+import urllib2
+
+from ngcccbase.services import blockchain
+from ngcccbase.services.blockchain import (BlockchainInfoInterface,
+                                           address_to_script)
+from ngcccbase.utxo_fetcher import BaseUTXOFetcher, AsyncUTXOFetcher
+
+
+ADDRESS1 = '1CC3X2gu58d6wXUWMffpuzN9JAfTUWu4Kj'
+ADDRESS2 = '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2'
+
+
+class FakeResponse(object):
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeUrllib2(object):
+    HTTPError = urllib2.HTTPError
+
+    def __init__(self):
+        self.urls = []
+
+    def urlopen(self, url):
+        self.urls.append(url)
+        return FakeResponse(json.dumps({'unspent_outputs': [
+            {'tx_hash': '00' * 31 + '01', 'tx_output_n': 0, 'value': 100,
+             'script': address_to_script(ADDRESS2)},
+            {'tx_hash': '00' * 31 + '02', 'tx_output_n': 1, 'value': 200,
+             'script': address_to_script(ADDRESS1)}]}))
+
+
+class TestWebBlockchainInterface(unittest.TestCase):
+
+    def setUp(self):
+        self.urllib2 = FakeUrllib2()
+        blockchain.urllib2 = self.urllib2
+
+    def tearDown(self):
+        blockchain.urllib2 = urllib2
+
+    def test_get_utxo_many(self):
+        utxos = BlockchainInfoInterface().get_utxo_many([ADDRESS1, ADDRESS2])
+        self.assertEqual(self.urllib2.urls, [
+            "https://blockchain.info/unspent?active=%s|%s" %
+            (ADDRESS1, ADDRESS2)])
+        self.assertEqual(utxos, {
+            ADDRESS1: [['02' + '00' * 31, 1, 200, address_to_script(ADDRESS1)]],
+            ADDRESS2: [['01' + '00' * 31, 0, 100, address_to_script(ADDRESS2)]]})
+
+
+class FakeInterface(object):
+    MAX_CONCURRENT_REQUESTS = 2
+    UTXO_BATCH_SIZE = 3
+
+    def __init__(self):
+        self.requests = []
+        self.utxos = {}
+
+    def get_utxo_many(self, addresses):
+        self.requests.append(addresses)
+        return {address: self.utxos.get(address, [[address + '_tx', 0]])
+                for address in addresses}
+
+
+class FakeStatusInterface(FakeInterface):
+    def __init__(self):
+        super(FakeStatusInterface, self).__init__()
+        self.statuses = {}
+        self.status_requests = []
+
+    def get_address_statuses(self, addresses):
+        self.status_requests.append(addresses)
+        return dict((address, self.statuses.get(address))
+                    for address in addresses)
+
+
+class FakeUTXOFetcher(BaseUTXOFetcher):
+    def __init__(self, interface):
+        super(FakeUTXOFetcher, self).__init__(interface)
+        self.added = []
+
+    def add_utxo(self, address, data):
+        self.added.append(data[0])
+
+
+class TestUTXOFetcher(unittest.TestCase):
+
+    def test_scan_addresses(self):
+        interface = FakeInterface()
+        fetcher = FakeUTXOFetcher(interface)
+        addresses = ['addr%d' % i for i in range(10)]
+        fetcher.scan_addresses(addresses)
+        self.assertEqual(len(interface.requests), 4)
+        self.assertEqual(fetcher.added, [a + '_tx' for a in addresses])
+
+
+class FakeModel(object):
+    testnet = False
+
+
+class TestAsyncUTXOFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = AsyncUTXOFetcher(FakeModel(), {'min_interval': 10,
+                                                      'max_interval': 100,
+                                                      'priority_interval': 40})
+        self.interface = self.fetcher.interface = FakeInterface()
+        self.added = []
+        self.fetcher.add_utxo = lambda address, data: \
+            self.added.append(data[0])
+        self.addresses = ['addr%d' % i for i in range(3)]
+
+    def test_check_addresses(self):
+        self.fetcher.check_addresses(self.addresses, 0)
+        self.assertEqual(self.added, ['addr0_tx', 'addr1_tx', 'addr2_tx'])
+        self.assertEqual(self.fetcher.get_due_addresses(self.addresses, 5), [])
+        self.assertEqual(self.fetcher.get_due_addresses(self.addresses, 10),
+                         self.addresses)
+        self.added = []
+        self.interface.utxos['addr1'] = [['addr1_tx2', 1]]
+        self.assertEqual(self.fetcher.check_addresses(self.addresses, 10),
+                         ['addr1'])
+        self.assertEqual(self.added, ['addr1_tx2'])
+        self.assertEqual(self.fetcher.get_state('addr0').next_check, 30)
+        self.assertEqual(self.fetcher.get_state('addr1').next_check, 20)
+
+    def test_backoff(self):
+        self.fetcher.priority_addresses = set(['addr2'])
+        for now in range(0, 1000, 100):
+            self.fetcher.check_addresses(self.addresses, now)
+        self.assertEqual(self.fetcher.get_state('addr0').interval, 100)
+        self.assertEqual(self.fetcher.get_state('addr2').interval, 40)
+
+    def test_due_order(self):
+        self.fetcher.check_addresses(['addr0', 'addr1'], 0)
+        self.fetcher.priority_addresses = set(['addr1'])
+        self.assertEqual(self.fetcher.get_due_addresses(self.addresses, 100),
+                         ['addr2', 'addr1', 'addr0'])
+
+    def test_status_interface(self):
+        self.interface = self.fetcher.interface = FakeStatusInterface()
+        self.interface.statuses['addr0'] = 'status'
+        self.fetcher.check_addresses(self.addresses, 0)
+        self.assertEqual(len(self.added), 3)
+        self.interface.requests = []
+        self.interface.statuses['addr0'] = 'status2'
+        self.assertEqual(self.fetcher.check_addresses(self.addresses, 10),
+                         ['addr0'])
+        self.assertEqual(self.interface.requests, [['addr0']])
+        # statuses of all addresses are asked for at once
+        self.assertEqual(self.interface.status_requests,
+                         [self.addresses, self.addresses])
+
+
+if __name__ == '__main__':
+    unittest.main()
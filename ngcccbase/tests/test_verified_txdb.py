@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import threading
+import unittest
+
+from coloredcoinlib.store import DataStoreConnection
+from ngcccbase.txdb import (VerifiedTxDb, VerifiedTxDataStore,
+                            TX_STATUS_CONFIRMED, TX_STATUS_UNCONFIRMED,
+                            TX_STATUS_INVALID)
+
+
+# example from here: https://bitcointalk.org/index.php?topic=44707.0
+MERKLE_ROOT = "9cdf7722eb64015731ba9794e32bdefd9cf69b42456d31f5e59aedb68c57ed52"
+TXHASH = "be38f46f0eccba72416aed715851fd07b881ffb7928b7622847314588e06a6b7"
+MERKLE = ["3a459eab5f0cf8394a21e04d2ed3b2beeaa59795912e20b9c680e9db74dfb18c",
+          "f6ae335dc2d2aecb6a255ebd03caaf6820e6c0534531051066810080e0d822c8",
+          "15eca0aa3e2cc2b9b4fbe0629f1dda87f329500fcdcd6ef546d163211266b3b3"]
+
+
+class FakeBlockchainState(object):
+    def __init__(self):
+        self.requests = []
+
+    def get_merkle_batch(self, txhashes):
+        self.requests.append(sorted(txhashes))
+        result = {}
+        for txhash in txhashes:
+            if txhash == TXHASH:
+                result[txhash] = {'blockhash': 'blockhash',
+                                  'in_mempool': True,
+                                  'block_height': 99,
+                                  'merkle': MERKLE, 'pos': 1}
+            elif txhash == 'mempool':
+                result[txhash] = {'blockhash': None, 'in_mempool': True}
+            else:
+                result[txhash] = {'blockhash': None, 'in_mempool': False}
+        return result
+
+
+class FakeVerifiedBlockchainState(object):
+    height = 100
+
+    def get_header(self, height):
+        if height == 99:
+            return {'merkle_root': MERKLE_ROOT}
+        return None
+
+    def stop(self):
+        pass
+
+
+class TestVerifiedTxDb(unittest.TestCase):
+
+    def setUp(self):
+        self.store_conn = DataStoreConnection(":memory:", True)
+        self.txdb = self.make_txdb()
+
+    def make_txdb(self, vbs=None):
+        # bypass __init__, which starts header synchronization
+        txdb = VerifiedTxDb.__new__(VerifiedTxDb)
+        txdb.bs = FakeBlockchainState()
+        txdb.vbs = vbs or FakeVerifiedBlockchainState()
+        txdb.lock = threading.Lock()
+        txdb.verified_store = VerifiedTxDataStore(self.store_conn.conn)
+        txdb.check_verified_tx()
+        return txdb
+
+    def test_identify_tx_statuses(self):
+        statuses = self.txdb.identify_tx_statuses(
+            [TXHASH, 'mempool', 'unknown', TXHASH])
+        self.assertEqual(statuses, {TXHASH: TX_STATUS_CONFIRMED,
+                                    'mempool': TX_STATUS_UNCONFIRMED,
+                                    'unknown': TX_STATUS_INVALID})
+        self.assertEqual(len(self.txdb.bs.requests), 1)
+        self.assertEqual(self.txdb.get_confirmations(TXHASH), 2)
+
+    def test_verified_tx_persist(self):
+        self.txdb.identify_tx_statuses([TXHASH])
+        txdb = self.make_txdb()
+        self.assertEqual(txdb.identify_tx_statuses([TXHASH]),
+                         {TXHASH: TX_STATUS_CONFIRMED})
+        self.assertEqual(txdb.bs.requests, [])
+        txdb.drop_from_height(99)
+        self.assertEqual(self.make_txdb().get_confirmations(TXHASH), None)
+
+    def test_check_verified_tx(self):
+        self.txdb.identify_tx_statuses([TXHASH])
+        self.assertEqual(self.make_txdb().get_confirmations(TXHASH), 2)
+        vbs = FakeVerifiedBlockchainState()
+        vbs.get_header = lambda height: {'merkle_root': '00' * 32}
+        self.assertEqual(self.make_txdb(vbs).get_confirmations(TXHASH), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
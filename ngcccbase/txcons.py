@@ -11,9 +11,10 @@ from coloredcoinlib import (ColorSet, ColorTarget, SimpleColorValue,
                             UNCOLORED_MARKER, OBColorDefinition,
                             InvalidColorIdError, ZeroSelectError)
 from binascii import hexlify
+from coinselection import make_coin_selector
+from feerate import DEFAULT_FEE_RATE
 import pycoin_txcons
 
-import io
 import math
 
 
@@ -89,31 +90,60 @@ class BasicTxSpec(object):
 
 
 class BaseOperationalTxSpec(OperationalTxSpec):
+    def get_fee_rate(self):
+        """Fee in Satoshi per 1000 bytes.
+        """
+        return DEFAULT_FEE_RATE
+
     def get_required_fee(self, tx_size):
         """Given a transaction that is of size <tx_size>,
         return the transaction fee in Satoshi that needs to be
         paid out to miners.
         """
-        base_fee = 11000.0
-        fee_value = math.ceil((tx_size * base_fee) / 1000)
+        fee_value = math.ceil((tx_size * self.get_fee_rate()) / 1000.0)
         return SimpleColorValue(colordef=UNCOLORED_MARKER,
                                 value=fee_value)
 
     def get_dust_threshold(self):
         return SimpleColorValue(colordef=UNCOLORED_MARKER, value=600)
 
-    def _select_enough_coins(self, colordef, utxo_list, required_sum_fn):
+    def get_coin_selector(self):
+        return make_coin_selector()
+
+    def _select_enough_coins(self, colordef, utxo_list, required_sum_fn,
+                             change_window=0):
+        """Select coins from <utxo_list> whose sum is at least
+        required_sum_fn(selection), using the coin selector.
+        Selecting coins which exceed it by at most <change_window>
+        lets us do without a change output.
+        """
+        values = [SimpleColorValue.sum(utxo.colorvalues).get_value()
+                  for utxo in utxo_list]
+        # selectors assume the required sum only depends on the number
+        # of coins, so take it for the coins which are largest to spend
+        by_size = sorted(utxo_list, key=lambda utxo: utxo.estimate_size(),
+                         reverse=True)
+        required_sums = {}
+        def required(count):
+            if count not in required_sums:
+                required_sums[count] = \
+                    required_sum_fn(by_size[:count]).get_value()
+            return required_sums[count]
+        indices = self.get_coin_selector().select(values, required,
+                                                  change_window)
+        if indices is None:
+            selection = utxo_list
+        else:
+            selection = [utxo_list[i] for i in sorted(indices)]
         ssum = SimpleColorValue(colordef=colordef, value=0)
-        selection = []
-        required_sum = None
-        for utxo in utxo_list:
+        for utxo in selection:
             ssum += SimpleColorValue.sum(utxo.colorvalues)
-            selection.append(utxo)
-            required_sum = required_sum_fn(utxo_list)
-            if ssum >= required_sum:
-                return selection, ssum
-        raise InsufficientFundsError('Not enough coins: %s requested, %s found!'
-                                     % (required_sum, ssum))
+        required_sum = required_sum_fn(selection)
+        if indices is None or ssum < required_sum:
+            raise InsufficientFundsError(
+                'Not enough coins: %s requested, %s found!'
+                % (required_sum, ssum))
+        return selection, ssum
 
     def _validate_select_coins_parameters(self, colorvalue, use_fee_estimator):
         fee = None
@@ -156,6 +186,17 @@ class SimpleOperationalTxSpec(BaseOperationalTxSpec):
         """
         return self.targets
 
+    def get_coin_selector(self):
+        return self.model.get_coin_selector()
+
+    def get_fee_rate(self):
+        return self.model.get_fee_rate()
+
+    def get_spendable_coins(self, color_id):
+        """Coins of <color_id> select_coins can choose from.
+        """
+        return self.model.get_coin_manager().get_spendable_coins(color_id)
+
     def get_change_addr(self, color_def):
         """Get an address associated with color definition <color_def>
         that is in the current wallet for receiving change.
@@ -185,7 +226,7 @@ class SimpleOperationalTxSpec(BaseOperationalTxSpec):
         def required_sum_fn(selection):
             if use_fee_estimator:
                 return colorvalue + use_fee_estimator.estimate_required_fee(
-                    extra_txins=len(selection))
+                    extra_txins=selection)
             else:
                 return colorvalue
         required_sum_0 = required_sum_fn([])
@@ -193,36 +234,44 @@ class SimpleOperationalTxSpec(BaseOperationalTxSpec):
             # no coins need to be selected
             return [], required_sum_0
         colordef = colorvalue.get_colordef()
-        color_id = colordef.get_color_id()
-        cq = self.model.make_coin_query({"color_id_set": set([color_id])})
-        utxo_list = cq.get_result()
-        return self._select_enough_coins(colordef, utxo_list, required_sum_fn)
+        utxo_list = self.get_spendable_coins(colordef.get_color_id())
+        change_window = 0
+        if use_fee_estimator:
+            # change below the dust threshold goes to fees
+            change_window = self.get_dust_threshold().get_value()
+        return self._select_enough_coins(colordef, utxo_list, required_sum_fn,
+                                         change_window)
 
 
 
 class RawTxSpec(object):
     """Represents a transaction which can be serialized.
     """
-    def __init__(self, model, pycoin_tx, composed_tx_spec=None):
+    def __init__(self, model, pycoin_tx, composed_tx_spec=None,
+                 tx_data=None):
         self.model = model
+        self.parsed_tx = pycoin_txcons.ParsedTx(pycoin_tx, tx_data)
         self.pycoin_tx = pycoin_tx
         self.composed_tx_spec = composed_tx_spec
-        self.update_tx_data()
         self.intent = None
 
     def get_intent(self):
         return self.intent
 
     def get_hex_txhash(self):
-        the_hash = self.pycoin_tx.hash()
-        return the_hash[::-1].encode('hex')
+        return self.parsed_tx.get_hex_txhash()
 
     def update_tx_data(self):
-        """Updates serialized form of transaction.
+        """Call after changing pycoin_tx, its serialized form and
+        hash are computed again when needed.
         """
-        s = io.BytesIO()
-        self.pycoin_tx.stream(s)
-        self.tx_data = s.getvalue()
+        self.parsed_tx.changed()
+
+    def get_ctransaction(self):
+        """coloredcoinlib CTransaction for this transaction.
+        """
+        return self.parsed_tx.get_ctransaction(
+            self.model.get_blockchain_state())
 
     @classmethod
     def from_composed_tx_spec(cls, model, composed_tx_spec):
@@ -235,29 +284,30 @@ class RawTxSpec(object):
         pycoin_tx = pycoin_txcons.deserialize(tx_data)
         composed_tx_spec = pycoin_txcons.reconstruct_composed_tx_spec(
             model, pycoin_tx)
-        return cls(model, pycoin_tx, composed_tx_spec)
+        return cls(model, pycoin_tx, composed_tx_spec, tx_data)
 
     def sign(self, utxo_list):
         pycoin_txcons.sign_tx(
-            self.pycoin_tx, utxo_list, self.model.is_testnet())
+            self.pycoin_tx, utxo_list, self.model.is_testnet(),
+            self.model.get_address_manager().get_hash160_lookup())
         self.update_tx_data()
 
     def get_tx_data(self):
         """Returns the signed transaction data.
         """
-        return self.tx_data
+        return self.parsed_tx.get_tx_data()
 
     def get_hex_tx_data(self):
         """Returns the hex version of the signed transaction data.
         """
-        return hexlify(self.tx_data).decode("utf8")
+        return hexlify(self.get_tx_data()).decode("utf8")
 
     def get_input_addresses(self):
-        ccc = self.model.ccc
-        bs = self.model.get_blockchain_state()
+        """Addresses of the outputs this transaction spends,
+        see CoinManager.get_prevout_addresses.
+        """
         inputs = [ti.get_outpoint() for ti in self.composed_tx_spec.txins]
-        raw_addrs = [bs.get_tx(tx).outputs[n].raw_address for tx, n in inputs]
-        return [ccc.raw_to_address(raw) for raw in raw_addrs]
+        return self.model.get_coin_manager().get_prevout_addresses(inputs)
 
 def compose_uncolored_tx(tx_spec):
     """ compose a simple bitcoin transaction """
@@ -1,14 +1,16 @@
 from time import time
 from urllib2 import HTTPError
+from multiprocessing.pool import ThreadPool
 import threading
 import os
 
 from pycoin.encoding import double_sha256
 
+from coloredcoinlib import toposorted
 from coloredcoinlib.store import DataStore, DataStoreConnection, PersistentDictStore, unwrap1
 from ngcccbase.services.blockchain import BlockchainInfoInterface
 from txcons import RawTxSpec
-from blockchain import VerifiedBlockchainState
+from blockchain import VerifiedBlockchainState, make_new_blocks_source
 
 
 
@@ -27,6 +29,14 @@ CREATE TABLE tx_data (
 );
 """
 
+create_verified_tx_table = """\
+CREATE TABLE verified_tx (
+    txhash TEXT PRIMARY KEY,
+    block_height INTEGER,
+    merkle_root TEXT
+);
+"""
+
 class TxDataStore(DataStore):
     def __init__(self, conn):
         super(TxDataStore, self).__init__(conn)
@@ -62,6 +72,10 @@ class TxDataStore(DataStore):
         return map(unwrap1,
                    self.execute("SELECT txhash FROM tx_data").fetchall())
 
+    def get_unconfirmed_txs(self):
+        return self.execute("SELECT txhash, status FROM tx_data WHERE status != ?",
+                            (TX_STATUS_CONFIRMED, )).fetchall()
+
     def set_block_height(self, txhash, height):
         self.execute("UPDATE tx_data SET block_height = ? WHERE txhash = ?",
                      (height, txhash))
@@ -71,16 +85,60 @@ class TxDataStore(DataStore):
 WHERE (block_height >= ?) OR (block_height IS NULL)",
                      (height,))
 
+class VerifiedTxDataStore(DataStore):
+    """Transactions whose merkle branch was checked against
+    a verified block header."""
+    def __init__(self, conn):
+        super(VerifiedTxDataStore, self).__init__(conn)
+        if not self.table_exists('verified_tx'):
+            self.execute(create_verified_tx_table)
+            self.execute(
+                "CREATE INDEX verified_tx_block_height ON verified_tx (block_height)")
+        if not self.column_exists('verified_tx', 'merkle_root'):
+            # proofs without a merkle root can't be rechecked
+            self.execute("DELETE FROM verified_tx")
+            self.execute(
+                "ALTER TABLE verified_tx ADD COLUMN merkle_root TEXT")
+
+    def add_verified_tx(self, txhash, height, merkle_root):
+        self.execute(
+            "INSERT OR REPLACE INTO verified_tx (txhash, block_height, merkle_root) "
+            "VALUES (?, ?, ?)", (txhash, height, merkle_root))
+
+    def get_verified_tx_height(self, txhash):
+        return unwrap1(self.execute(
+            "SELECT block_height FROM verified_tx WHERE txhash = ?",
+            (txhash, )).fetchone())
+
+    def get_verified_merkle_roots(self):
+        return self.execute(
+            "SELECT DISTINCT block_height, merkle_root FROM verified_tx").fetchall()
+
+    def drop_block(self, height):
+        self.execute("DELETE FROM verified_tx WHERE block_height = ?",
+                     (height,))
+
+    def drop_from_height(self, height):
+        self.execute("DELETE FROM verified_tx WHERE block_height >= ?",
+                     (height,))
+
 class BaseTxDb(object):
     def __init__(self, model, config):
         self.model = model
         self.store = TxDataStore(self.model.store_conn.conn)
         self.last_status_check = dict()
         self.recheck_interval = 60
+        # incremented when statuses are reset in bulk
+        self.reset_count = 0
         self.bs = self.model.get_blockchain_state()
 
     def purge_tx_db(self):
         self.store.purge_tx_data()
+        self.reset_count += 1
+
+    def reset_from_height(self, height):
+        self.store.reset_from_height(height)
+        self.reset_count += 1
 
     def get_all_tx_hashes(self):
         return self.store.get_all_tx_hashes()
@@ -128,10 +186,69 @@ class BaseTxDb(object):
             new_status = self.maybe_recheck_tx_status(txhash, old_status)
             return old_status != new_status
 
+    # number of threads fetching raw transactions in add_txs_bulk
+    bulk_fetch_threads = 8
+
+    def add_txs_bulk(self, txhashes):
+        """Add transactions <txhashes> which aren't in the db yet.
+        Raw transactions are fetched in parallel and statuses are
+        identified at once, then transactions are added in topological
+        order in a single db transaction.
+        Returns time spent in each phase.
+        """
+        timings = {}
+        start = time()
+        txhashes = [txhash for txhash in sorted(set(txhashes))
+                    if not self.store.get_tx_by_hash(txhash)]
+        bs = self.model.get_blockchain_state()
+        pool = ThreadPool(min(self.bulk_fetch_threads, len(txhashes)) or 1)
+        try:
+            txdata_list = pool.map(bs.get_raw, txhashes)
+        finally:
+            pool.close()
+        timings['fetch'] = time() - start
+
+        start = time()
+        raw_txs = {}
+        for txhash, txdata in zip(txhashes, txdata_list):
+            raw_txs[txhash] = (txdata, RawTxSpec.from_tx_data(
+                self.model, txdata.decode('hex')))
+
+        def dependent_txs(raw_tx):
+            """transactions from this batch which <raw_tx> spends"""
+            return [raw_txs[txin.prevout.hash][1]
+                    for txin in raw_tx.composed_tx_spec.txins
+                    if txin.prevout.hash in raw_txs]
+        sorted_txs = toposorted([raw_txs[txhash][1] for txhash in txhashes],
+                                dependent_txs)
+        timings['parse'] = time() - start
+
+        start = time()
+        statuses = self.identify_tx_statuses(txhashes)
+        timings['status'] = time() - start
+
+        start = time()
+        with self.store.atomic():
+            for raw_tx in sorted_txs:
+                txhash = raw_tx.get_hex_txhash()
+                self.add_tx(txhash, raw_txs[txhash][0], raw_tx,
+                            statuses.get(txhash))
+        timings['apply'] = time() - start
+        return timings
+
+    def identify_tx_statuses(self, txhashes):
+        """Returns a dict mapping each of <txhashes> to its status.
+        """
+        return {txhash: self.identify_tx_status(txhash)
+                for txhash in set(txhashes)}
+
     def recheck_tx_status(self, txhash):
+        old_status = self.store.get_tx_status(txhash)
         status = self.identify_tx_status(txhash)
         self.store.set_tx_status(txhash, status)
         self.update_tx_block_height(txhash, status)
+        if status != old_status:
+            self.model.get_coin_manager().update_balances(txhash)
         return status
    
     def maybe_recheck_tx_status(self, txhash, status):
@@ -144,6 +261,13 @@ class BaseTxDb(object):
         self.last_status_check[txhash] = time()
         return status
 
+    def maybe_recheck_tx_statuses(self):
+        """Recheck all transactions which are not confirmed yet
+        and weren't checked recently.
+        """
+        for txhash, status in self.store.get_unconfirmed_txs():
+            self.maybe_recheck_tx_status(txhash, status)
+
     def is_tx_valid(self, txhash):
         status = self.store.get_tx_status(txhash)
         if status == TX_STATUS_CONFIRMED:
@@ -202,15 +326,17 @@ class VerifiedTxDb(BaseTxDb):
     def __init__(self, model, config):
         super(VerifiedTxDb, self).__init__(model, config)
         self.bs = self.model.get_blockchain_state()
+        self.lock = threading.Lock()
+        self.verified_store = VerifiedTxDataStore(self.model.store_conn.conn)
         self.vbs = VerifiedBlockchainState(
             self.bs,
             self,
             config.get('testnet', False),
-            os.path.dirname(self.model.store_conn.path)
+            os.path.dirname(self.model.store_conn.path),
+            make_new_blocks_source(self.bs, config.get('new_blocks', {}))
         )
+        self.check_verified_tx()
         self.vbs.start()
-        self.lock = threading.Lock()
-        self.verified_tx = {}
 
     def __del__(self):
         if self.vbs:
@@ -233,53 +359,106 @@ class VerifiedTxDb(BaseTxDb):
                 h = double_sha256(h + hash_decode(item))
         return hash_encode(h)
 
-    def _verify_merkle(self, txhash):
-        result = self.bs.get_merkle(txhash)
+    def _verify_merkle_data(self, txhash, result, headers=None):
+        """Check merkle data <result> as returned by get_merkle
+        against our block headers, <headers> caches them by height.
+        """
         merkle, tx_height, pos = result.get('merkle'), \
             result.get('block_height'), result.get('pos')
 
         merkle_root = self._get_merkle_root(merkle, txhash, pos)
-        header = self.vbs.get_header(tx_height)
+        if headers is None:
+            headers = {}
+        if tx_height not in headers:
+            headers[tx_height] = self.vbs.get_header(tx_height)
+        header = headers[tx_height]
         if header is None:
             return False
         if header.get('merkle_root') != merkle_root:
             return False
 
         with self.lock:
-            self.verified_tx[txhash] = tx_height
+            self.verified_store.add_verified_tx(txhash, tx_height,
+                                                merkle_root)
         return True
 
+    def _verify_merkle(self, txhash):
+        return self._verify_merkle_data(txhash, self.bs.get_merkle(txhash))
+
+    def check_verified_tx(self):
+        """Drop stored proofs which don't match the merkle root of our
+        block header at that height anymore (e.g. after a reorg which
+        happened while the wallet was closed).
+        """
+        with self.lock:
+            for height, merkle_root in \
+                    self.verified_store.get_verified_merkle_roots():
+                header = self.vbs.get_header(height)
+                if header and header.get('merkle_root') != merkle_root:
+                    self.verified_store.drop_block(height)
+
     def update_tx_block_height(self, txhash, status):
         with self.lock:
-            if txhash in self.verified_tx:
-                self.store.set_block_height(txhash,
-                                            self.verified_tx[txhash])
+            height = self.verified_store.get_verified_tx_height(txhash)
+            if height is not None:
+                self.store.set_block_height(txhash, height)
 
     def drop_from_height(self, height):
         with self.lock:
-            self.verified_tx = {key: value for key, value in self.verified_tx.items() if value < height}
+            self.verified_store.drop_from_height(height)
 
     def get_confirmations(self, txhash):
         with self.lock:
-            if txhash in self.verified_tx:
-                height = self.verified_tx[txhash]
+            height = self.verified_store.get_verified_tx_height(txhash)
+            if height is not None:
                 return self.vbs.height - height + 1
             else:
                 return None
 
+    def _get_verified_status(self, txhash):
+        confirmations = self.get_confirmations(txhash)
+        if confirmations is None or confirmations <= 0:
+            return TX_STATUS_UNCONFIRMED
+        return TX_STATUS_CONFIRMED
+
     def identify_tx_status(self, txhash):
+        if self._get_verified_status(txhash) == TX_STATUS_CONFIRMED:
+            return TX_STATUS_CONFIRMED
         block_hash, in_mempool = self.bs.get_tx_blockhash(txhash)
         if (not block_hash) and (not in_mempool):
             return TX_STATUS_INVALID
         if not block_hash:
             return TX_STATUS_UNCONFIRMED
-        confirmations = self.get_confirmations(txhash)
-        if confirmations is None:
-            verified = self._verify_merkle(txhash)
-            if verified:
-                return self.identify_tx_status(txhash)
+        if self.get_confirmations(txhash) is None:
+            self._verify_merkle(txhash)
+        return self._get_verified_status(txhash)
+
+    def identify_tx_statuses(self, txhashes):
+        """Like identify_tx_status, but requests merkle branches of
+        all transactions which are not verified yet at once.
+        """
+        if not hasattr(self.bs, 'get_merkle_batch'):
+            return super(VerifiedTxDb, self).identify_tx_statuses(txhashes)
+        statuses = {}
+        unverified = []
+        for txhash in set(txhashes):
+            if self._get_verified_status(txhash) == TX_STATUS_CONFIRMED:
+                statuses[txhash] = TX_STATUS_CONFIRMED
             else:
-                return TX_STATUS_UNCONFIRMED
-        if confirmations == 0:
-            return TX_STATUS_UNCONFIRMED
-        return TX_STATUS_CONFIRMED
+                unverified.append(txhash)
+        if not unverified:
+            return statuses
+
+        merkle_data = self.bs.get_merkle_batch(unverified)
+        headers = {}
+        for txhash in unverified:
+            result = merkle_data.get(txhash) or {}
+            if result.get('blockhash'):
+                if self.get_confirmations(txhash) is None:
+                    self._verify_merkle_data(txhash, result, headers)
+                statuses[txhash] = self._get_verified_status(txhash)
+            elif result.get('in_mempool'):
+                statuses[txhash] = TX_STATUS_UNCONFIRMED
+            else:
+                statuses[txhash] = TX_STATUS_INVALID
+        return statuses
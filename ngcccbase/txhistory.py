@@ -210,9 +210,9 @@ class TxHistory(object):
 
         # get addresses
         outputs = raw_tx.composed_tx_spec.txouts
-        wallet_addrs = set([r.address for r in am.get_all_addresses()])
         output_addrs = set([out.target_addr for out in outputs])
-        send_addrs = list(output_addrs.difference(wallet_addrs))
+        send_addrs = [addr for addr in output_addrs
+                      if not am.has_address(addr)]
 
         deltas = self.get_delta_color_values(spent_coins, received_coins)
         self.entries[txhash] = {
@@ -228,8 +228,7 @@ class TxHistory(object):
 
         # only inputs from this wallet
         input_addrs = set(raw_tx.get_input_addresses())
-        wallet_addrs = set([r.address for r in am.get_all_addresses()])
-        if wallet_addrs.intersection(input_addrs) != input_addrs:
+        if not all(am.has_address(addr) for addr in input_addrs):
             return False # foreign inputs
 
         # only one color + uncolored sent
@@ -9,6 +9,7 @@ CoinManager.
 from ngcccbase.services.blockchain import BlockchainInfoInterface, AbeInterface
 from ngcccbase.services.electrum import ElectrumInterface
 from ngcccbase.services.helloblock import HelloBlockInterface
+from ngcccbase.services.parallel import parallel_map
 
 import time
 import Queue
@@ -24,6 +25,16 @@ class BaseUTXOFetcher(object):
 
     @classmethod
     def make_interface(cls, model, params):
+        interface = cls.make_service_interface(model, params)
+        if 'max_concurrent_requests' in params:
+            interface.MAX_CONCURRENT_REQUESTS = \
+                params['max_concurrent_requests']
+        if 'utxo_batch_size' in params:
+            interface.UTXO_BATCH_SIZE = params['utxo_batch_size']
+        return interface
+
+    @classmethod
+    def make_service_interface(cls, model, params):
         use = params.get('interface', 'helloblock')
         if model.testnet:
             if use != 'helloblock':
@@ -43,13 +54,38 @@ class BaseUTXOFetcher(object):
         else:
             raise Exception('Unknown service for UTXOFetcher!')        
 
-    def scan_address(self, address):
+    def get_utxo(self, address):
+        return self.get_utxo_many([address]).get(address, [])
+
+    def get_utxo_many(self, addresses):
         try:
-            for data in self.interface.get_utxo(address):
-                self.add_utxo(address, data)
+            return self.interface.get_utxo_many(addresses)
         except Exception as e:
             if "%s" % e != "No JSON object could be decoded":
                 raise
+            return {}
+
+    def make_batches(self, addresses):
+        """Split <addresses> into chunks for get_utxo_many.
+        """
+        batch_size = getattr(self.interface, 'UTXO_BATCH_SIZE', 1)
+        return [addresses[i:i + batch_size]
+                for i in xrange(0, len(addresses), batch_size)]
+
+    def scan_address(self, address):
+        for data in self.get_utxo(address):
+            self.add_utxo(address, data)
+
+    def scan_addresses(self, addresses):
+        """Fetch UTXOs of <addresses> in batches, which are requested
+        in parallel, and add them in the order of <addresses>.
+        """
+        batches = self.make_batches(list(addresses))
+        results = parallel_map(self.interface, self.get_utxo_many, batches)
+        for batch, utxos in zip(batches, results):
+            for address in batch:
+                for data in utxos.get(address, []):
+                    self.add_utxo(address, data)
 
 class SimpleUTXOFetcher(BaseUTXOFetcher):
     def __init__(self, model, params):
@@ -65,10 +101,25 @@ class SimpleUTXOFetcher(BaseUTXOFetcher):
 
     def scan_all_addresses(self):
         wam = self.model.get_address_manager()
-        for address_rec in wam.get_all_addresses():
-            self.scan_address(address_rec.get_address())
+        self.scan_addresses([address_rec.get_address()
+                             for address_rec in wam.get_all_addresses()])
+
+class AddressState(object):
+    """What AsyncUTXOFetcher knows about an address."""
+    def __init__(self, interval):
+        self.status = None
+        self.checked = False
+        self.interval = interval
+        self.next_check = 0
+        self.last_change = None
+
 
 class AsyncUTXOFetcher(BaseUTXOFetcher):
+    """Checks addresses for changes in a background thread.
+    Addresses which didn't change are checked less and less often
+    (from min_interval up to max_interval seconds), recently changed
+    and change addresses at least every priority_interval seconds.
+    """
     def __init__(self, model, params):
         super(AsyncUTXOFetcher, self).__init__(
             self.make_interface(model, params))
@@ -76,14 +127,28 @@ class AsyncUTXOFetcher(BaseUTXOFetcher):
         self.model = model
         self.hash_queue = Queue.Queue()
         self.address_list = []
+        self.priority_addresses = set()
+        self.address_states = {}
+        self.min_interval = params.get('min_interval', 10)
+        self.max_interval = params.get('max_interval', 600)
+        self.priority_interval = params.get('priority_interval', 60)
+        # addresses which changed in this period have priority
+        self.recent_period = params.get('recent_period', 3600)
         self.running = False
         self.lock = threading.Lock()
 
     def update(self):
         wam = self.model.get_address_manager()
+        address_list = []
+        change_addresses = {}
+        for ar in wam.get_all_addresses():
+            address_list.append(ar.get_address())
+            # change goes to the first address of a color set
+            color_ids = tuple(sorted(ar.get_color_set().color_id_set))
+            change_addresses.setdefault(color_ids, ar.get_address())
         with self.lock:
-            self.address_list = [ar.get_address()
-                                 for ar in wam.get_all_addresses()]
+            self.address_list = address_list
+            self.priority_addresses = set(change_addresses.values())
 
         any_got_updates = False
         while not self.hash_queue.empty():
@@ -95,6 +160,76 @@ class AsyncUTXOFetcher(BaseUTXOFetcher):
         txhash = data[0]
         self.hash_queue.put(txhash)
 
+    def get_state(self, address):
+        if address not in self.address_states:
+            self.address_states[address] = AddressState(self.min_interval)
+        return self.address_states[address]
+
+    def is_priority(self, address, now):
+        state = self.get_state(address)
+        return (address in self.priority_addresses or
+                (state.last_change is not None and
+                 now - state.last_change < self.recent_period))
+
+    def get_due_addresses(self, address_list, now):
+        """Addresses which should be checked at <now>, never checked
+        and priority addresses first.
+        """
+        due = [address for address in address_list
+               if self.get_state(address).next_check <= now]
+        return sorted(due, key=lambda address: (
+            self.get_state(address).checked,
+            not self.is_priority(address, now),
+            self.get_state(address).next_check))
+
+    def process_notifications(self):
+        """Addresses the server reported as changed are due now.
+        """
+        notifications = getattr(self.interface, 'notifications', None)
+        while notifications and not notifications.empty():
+            message = notifications.get()
+            if message.get('method') == 'blockchain.address.subscribe':
+                address = message['params'][0]
+                self.get_state(address).next_check = 0
+
+    def check_addresses(self, addresses, now):
+        """Add UTXOs of those of <addresses> which changed since they
+        were checked last time and schedule the next check.
+        Uses status hashes if the interface provides them, otherwise
+        compares sets of unspent outputs.
+        """
+        if hasattr(self.interface, 'get_address_statuses'):
+            statuses = self.interface.get_address_statuses(addresses)
+            utxos = None
+        else:
+            utxos = self.get_utxo_many(addresses)
+            statuses = dict((address, frozenset(
+                (utxo[0], utxo[1]) for utxo in utxos.get(address, [])))
+                            for address in addresses)
+        changed = []
+        for address in addresses:
+            state = self.get_state(address)
+            if state.checked and state.status == statuses[address]:
+                limit = self.max_interval
+                if self.is_priority(address, now):
+                    limit = min(limit, self.priority_interval)
+                state.interval = min(state.interval * 2, limit)
+            else:
+                changed.append(address)
+                if state.checked:
+                    state.last_change = now
+                state.interval = self.min_interval
+            state.status = statuses[address]
+            state.checked = True
+            state.next_check = now + state.interval
+        if utxos is None:
+            self.scan_addresses(changed)
+        else:
+            for address in changed:
+                for data in utxos.get(address, []):
+                    self.add_utxo(address, data)
+        return changed
+
     def start_thread(self):
         thread = threading.Thread(target=self.thread_loop)
         thread.start()
@@ -117,14 +252,16 @@ class AsyncUTXOFetcher(BaseUTXOFetcher):
                 with self.lock:
                     address_list = self.address_list[:]
 
-                for address in address_list:
+                self.process_notifications()
+                due = self.get_due_addresses(address_list, time.time())
+                for batch in self.make_batches(due):
                     if not self.is_running():
                         break
-                    #self.logger.debug('scanning address %s', address)
-                    self.scan_address(address)
-                    wakeup = time.time() + 1
-                    while wakeup > time.time() and self.is_running():
-                        time.sleep(0.05)
+                    #self.logger.debug('checking addresses %s', batch)
+                    self.check_addresses(batch, time.time())
+                wakeup = time.time() + 1
+                while wakeup > time.time() and self.is_running():
+                    time.sleep(0.05)
             except Exception as e:
                 wakeup = time.time() + 20
                 while wakeup > time.time() and self.is_running():
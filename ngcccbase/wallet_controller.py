@@ -6,11 +6,13 @@ Executes high level tasks such as get balance
 """
 
 import os
+from time import time
 from ngcccbase import sanitize
 from collections import defaultdict
 from decimal import Decimal
 from asset import AssetTarget, AdditiveAssetValue
 from coindb import CoinQuery
+from ngcccbase.services.parallel import parallel_map
 from coloredcoinlib.colordef import OBColorDefinition
 from coloredcoinlib.colordef import EPOBCColorDefinition
 from coloredcoinlib.colordef import InvalidColorError
@@ -19,6 +21,7 @@ from coloredcoinlib import (InvalidColorDefinitionError, ColorDefinition,
                             GENESIS_OUTPUT_MARKER,
                             ColorTarget, SimpleColorValue)
 from txcons import BasicTxSpec, SimpleOperationalTxSpec
+from batchpayout import BatchPayout
 from wallet_model import ColorSet
 
 
@@ -26,6 +29,15 @@ class AssetMismatchError(Exception):
     pass
 
 
+class PartialPublishError(Exception):
+    """Publishing a transaction of a batch failed, <published> has
+    the hashes of the transactions which were published before.
+    """
+    def __init__(self, message, published):
+        super(PartialPublishError, self).__init__(message)
+        self.published = published
+
+
 class WalletController(object):
     """Controller for a wallet. Used for executing tasks related to the wallet.
     """
@@ -65,20 +77,25 @@ class WalletController(object):
 
     def full_rescan(self):
         """Updates all Unspent Transaction Outs for addresses associated with
-        this wallet."""
-        self.model.get_coin_manager().purge_coins()
-        self.model.get_tx_db().purge_tx_db()
+        this wallet. Returns seconds each phase took, by name."""
         wam = self.model.get_address_manager()
         bc_interface = self.model.utxo_fetcher.interface
-        tx_hashes = []
-        for ar in wam.get_all_addresses():
-            tx_hashes.extend(bc_interface.get_address_history(ar.get_address()))
-        sorted_txs = self.model.get_blockchain_state().sort_txs(tx_hashes)
-        txdb = self.model.get_tx_db()
-        for tx in sorted_txs:
-            txdb.add_tx_by_hash(tx.hash)
+        # get all histories first, so a failure leaves the wallet as it was
+        start = time()
+        histories = parallel_map(
+            bc_interface, bc_interface.get_address_history,
+            [ar.get_address() for ar in wam.get_all_addresses()])
+        history_time = time() - start
+        self.model.get_coin_manager().purge_coins()
+        self.model.get_tx_db().purge_tx_db()
+        tx_hashes = [txhash for history in histories for txhash in history]
+        timings = self.model.get_tx_db().add_txs_bulk(tx_hashes)
+        timings['history'] = history_time
+        start = time()
         self.model.tx_history.entries.clear()
         self.model.tx_history.populate_history()
+        timings['tx_history'] = time() - start
+        return timings
 
     def scan_utxos(self):
         self.model.utxo_fetcher.scan_all_addresses()
@@ -89,10 +106,7 @@ class WalletController(object):
             sums[asset] += value
         return sums
 
-    def validate_sendmany_entries(self, entries):
-        # TODO check for max entries
-        sums = self.sendmany_sums(entries)
-
+    def validate_sendmany_balances(self, sums):
         # check if required asset amount available
         for asset, amount in sums.items():
             available = Decimal(self.get_available_balance(asset))
@@ -105,6 +119,11 @@ class WalletController(object):
                 }
                 raise Exception(msg)
 
+    def validate_sendmany_entries(self, entries):
+        # TODO check for max entries
+        sums = self.sendmany_sums(entries)
+        self.validate_sendmany_balances(sums)
+
         # check inputs are only obc or only epobc
         def reduce_function(a, b):
             adef = a.get_color_def()
@@ -140,6 +159,25 @@ class WalletController(object):
         # TODO add to history
         return txhash
 
+    def sendmany_batch(self, entries, processes=None):
+        """Pay [(asset, address, value), ...] <entries> with as many
+        transactions as needed, returns their hashes.
+        Raises PartialPublishError if one of them can't be published.
+        """
+        self.validate_sendmany_balances(self.sendmany_sums(entries))
+        payout = BatchPayout(self.model, processes=processes)
+        published = []
+        for signed_tx_spec in payout.make_txs(entries):
+            try:
+                published.append(self.publish_tx(signed_tx_spec))
+            except Exception as e:
+                raise PartialPublishError(
+                    "Publishing transaction %s failed: %s, published "
+                    "before it: %s" % (signed_tx_spec.get_hex_txhash(), e,
+                                       ", ".join(published) or "none"),
+                    published)
+        return published
+
     def send_coins(self, asset, target_addrs, raw_colorvalues):
         """Sends coins to address <target_addr> of asset/color <asset>
         of amount <colorvalue> Satoshis.
@@ -258,30 +296,21 @@ class WalletController(object):
                     coinlog.append(coin)
         return coinlog
 
-    def _get_balance(self, asset, options):
+    def _get_balance(self, asset, confirmed):
         """Returns an integer value corresponding to the total number
         of Satoshis owned of asset/color <asset>.
         """
-        query = {"asset": asset}
-        query.update(options)
-        cq = self.model.make_coin_query(query)
-        utxo_list = cq.get_result()
-        value_list = [asset.get_colorvalue(utxo) for utxo in utxo_list]
-        if len(value_list) == 0:
-            return 0
-        else:
-            return SimpleColorValue.sum(value_list).get_value()
+        return self.model.get_coin_manager().get_balance(
+            asset.get_color_set(), confirmed)
 
     def get_available_balance(self, asset):
-        return self._get_balance(asset, {"spent": False})
+        return self._get_balance(asset, True)
 
     def get_total_balance(self, asset):
-        return self._get_balance(asset, {"spent": False,
-                                        "include_unconfirmed": True})
+        return self._get_balance(asset, None)
 
     def get_unconfirmed_balance(self, asset):
-        return self._get_balance(asset, {"spent": False,
-                                        "only_unconfirmed": True})
+        return self._get_balance(asset, False)
 
     def get_history(self, asset):
         """Returns the history of an asset for all addresses of that color
@@ -17,6 +17,8 @@ from coloredcoinlib import ColorSet, toposorted
 from txdb import NaiveTxDb, TrustingTxDb, VerifiedTxDb
 from txcons import TransactionSpecTransformer
 from coindb import CoinQuery, CoinManager
+from coinselection import make_coin_selector
+from feerate import make_fee_rate_source
 from utxo_fetcher import SimpleUTXOFetcher
 from coloredcoinlib import BlockchainState
 from ngcccbase.services.chroma import ChromaBlockchainState
@@ -69,16 +71,21 @@ class WalletModel(object):
         self.init_wallet_address_manager(config)
         self.coin_query_factory = CoinQueryFactory(self, config)
         self.coin_man = CoinManager(self, config)
+        self.coin_selector = make_coin_selector(
+            config.get('coin_selection', 'bnb'))
+        self.fee_rate_source = make_fee_rate_source(config)
         self.tx_spec_transformer = TransactionSpecTransformer(self, config)
         self.tx_history = TxHistory(self)
 
     def init_wallet_address_manager(self, config):
         if config.get('bip0032'):
             from bip0032 import HDWalletAddressManager
-            self.address_man = HDWalletAddressManager(self.ccc.colormap, config)
+            self.address_man = HDWalletAddressManager(
+                self.ccc.colormap, config, self.store_conn)
         else:
             from deterministic import DWalletAddressManager
-            self.address_man = DWalletAddressManager(self.ccc.colormap, config)
+            self.address_man = DWalletAddressManager(
+                self.ccc.colormap, config, self.store_conn)
 
     def init_tx_db(self, config):
         if self.testnet:
@@ -149,6 +156,16 @@ class WalletModel(object):
         """
         return self.coin_query_factory.make_query(params)
 
+    def get_coin_selector(self):
+        """Access method for the coin selection strategy
+        """
+        return self.coin_selector
+
+    def get_fee_rate(self):
+        """Fee in Satoshi per 1000 bytes new transactions pay
+        """
+        return self.fee_rate_source.get_fee_rate()
+
     def get_asset_definition_manager(self):
         """Access Method for asset definition manager
         """
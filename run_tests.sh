@@ -40,4 +40,16 @@ python -m ngcccbase.p2ptrade.tests.test_basic
 # FIXME python -m ngcccbase.tests.test_services
 # FIXME python -m ngcccbase.tests.test_txcons
 # FIXME python -m ngcccbase.tests.test_blockchain
+python -m ngcccbase.tests.test_headers
+python -m ngcccbase.tests.test_verified_txdb
+python -m ngcccbase.tests.test_coindb
+python -m ngcccbase.tests.test_txdb_bulk
+python -m ngcccbase.tests.test_parallel
+python -m ngcccbase.tests.test_utxo_fetcher
+python -m ngcccbase.tests.test_electrum
+python -m ngcccbase.tests.test_coinselection
+python -m ngcccbase.tests.test_pycoin_txcons
 
+python -m ngcccbase.tests.test_batchpayout
+python -m ngcccbase.tests.test_feerate
+python -m ngcccbase.tests.test_address_store